@@ -0,0 +1,145 @@
+# answer_cache.py - Semantic cache of LLM answers in front of the generation step
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+# --- Config ---
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL_SECONDS = 900
+
+
+def context_key(chunk_ids):
+    """Order-independent hash of the retrieved chunk ids."""
+    joined = ",".join(str(i) for i in sorted(chunk_ids))
+    return hashlib.sha1(joined.encode('ascii')).hexdigest()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers keyed by (query embedding, retrieved chunk set).
+
+    A question hits when an earlier one retrieved exactly the same chunks and
+    its embedding is at least `threshold` cosine-similar. Questions arriving
+    while a matching answer is still being generated wait for that single
+    LLM call instead of starting their own. Entries are evicted LRU-first and
+    expire after `ttl_seconds`.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_size=DEFAULT_MAX_SIZE, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # entry id -> (context key, unit embedding, answer, expires_at)
+        self._by_context = {}           # context key -> set of entry ids
+        self._inflight = {}             # context key -> list of (unit embedding, Future)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _best_match(self, candidates, embedding):
+        best, best_score = None, self.threshold
+        for candidate_embedding, payload in candidates:
+            score = float(candidate_embedding @ embedding)
+            if score >= best_score:
+                best, best_score = payload, score
+        return best
+
+    def _lookup_locked(self, key, embedding):
+        now = time.monotonic()
+        live = []
+        for entry_id in list(self._by_context.get(key, ())):
+            _, entry_embedding, answer, expires_at = self._entries[entry_id]
+            if expires_at <= now:
+                self._remove_locked(entry_id)
+            else:
+                live.append((entry_embedding, entry_id))
+        entry_id = self._best_match(live, embedding)
+        if entry_id is None:
+            return None
+        self._entries.move_to_end(entry_id)
+        return self._entries[entry_id][2]
+
+    def _remove_locked(self, entry_id):
+        key = self._entries.pop(entry_id)[0]
+        ids = self._by_context.get(key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_context[key]
+
+    def _release_locked(self, key, future):
+        waiters = [w for w in self._inflight.get(key, ()) if w[1] is not future]
+        if waiters:
+            self._inflight[key] = waiters
+        else:
+            self._inflight.pop(key, None)
+
+    def claim(self, query_embedding, chunk_ids):
+        """
+        Returns one of:
+          ("hit", answer)   -- a cached answer can be served
+          ("wait", future)  -- a matching answer is being generated; wait on the future
+          ("owner", ticket) -- caller must generate, then call resolve(ticket, ...)
+        """
+        key = context_key(chunk_ids)
+        embedding = _unit(query_embedding)
+        with self._lock:
+            answer = self._lookup_locked(key, embedding)
+            if answer is not None:
+                self.hits += 1
+                return "hit", answer
+            pending = self._best_match(self._inflight.get(key, ()), embedding)
+            if pending is not None:
+                self.coalesced += 1
+                return "wait", pending
+            self.misses += 1
+            future = Future()
+            self._inflight.setdefault(key, []).append((embedding, future))
+            return "owner", (key, embedding, future)
+
+    def resolve(self, ticket, answer, cacheable=True):
+        """Publishes the owner's answer to any waiters and caches it if `cacheable`."""
+        key, embedding, future = ticket
+        with self._lock:
+            self._release_locked(key, future)
+            if cacheable:
+                entry_id = self._next_id
+                self._next_id += 1
+                self._entries[entry_id] = (key, embedding, answer, time.monotonic() + self.ttl_seconds)
+                self._by_context.setdefault(key, set()).add(entry_id)
+                while len(self._entries) > self.max_size:
+                    self._remove_locked(next(iter(self._entries)))
+        future.set_result(answer)
+
+    def fail(self, ticket, error):
+        """Releases a claim whose generation raised; waiters see the same exception."""
+        key, _, future = ticket
+        with self._lock:
+            self._release_locked(key, future)
+        future.set_exception(error)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            # Coalesced requests are served without their own LLM call too
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,95 @@
+# batch_encoder.py - Request-coalescing encoder around a shared SentenceTransformer
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# --- Config ---
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+METRICS_WINDOW = 1000  # recent batches / waits kept for percentiles
+
+
+class BatchingEncoder:
+    """
+    Collects concurrent `encode` calls for up to `max_wait_ms` (or until
+    `max_batch_size` texts are waiting), runs them through the model in one
+    forward pass, and hands every caller back its own vector.
+    """
+
+    def __init__(self, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._queue = queue.Queue()
+        self._batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self._queue_waits_ms = deque(maxlen=METRICS_WINDOW)
+        self._total_batches = 0
+        self._total_texts = 0
+        # Guards the metrics above: the worker writes them while /metrics reads them
+        self._stats_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="sbert-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        """Queues one text and returns a Future resolving to its vector."""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text):
+        """Encodes one text; blocks until its batch has been processed."""
+        return self.submit(text).result()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.model.encode(texts, convert_to_numpy=True, batch_size=len(texts))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self._total_batches += 1
+                self._total_texts += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._queue_waits_ms.extend((started - enqueued) * 1000 for _, _, enqueued in batch)
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        with self._stats_lock:
+            sizes = np.array(list(self._batch_sizes), dtype=np.float64)
+            waits = np.array(list(self._queue_waits_ms), dtype=np.float64)
+            total_batches, total_texts = self._total_batches, self._total_texts
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "total_batches": total_batches,
+            "total_texts": total_texts,
+            "queue_depth": self._queue.qsize(),
+            "batch_size_mean": round(float(sizes.mean()), 2) if len(sizes) else 0.0,
+            "batch_size_max": int(sizes.max()) if len(sizes) else 0,
+            "queue_wait_ms_p50": round(float(np.percentile(waits, 50)), 3) if len(waits) else 0.0,
+            "queue_wait_ms_p99": round(float(np.percentile(waits, 99)), 3) if len(waits) else 0.0,
+        }
@@ -0,0 +1,89 @@
+# benchmark_chunker.py - Time and peak memory of text chunking on a synthetic book
+#
+# Usage:
+#   python benchmark_chunker.py                 # whitespace token counts
+#   python benchmark_chunker.py --tokenizer     # real all-MiniLM-L6-v2 word pieces
+import re
+import time
+import random
+import argparse
+import tracemalloc
+
+from text_chunker import TokenAwareChunker
+
+WORDS = ("paddy wheat urea potash nitrogen irrigation sowing harvest seed variety yield soil "
+         "kharif rabi fertilizer spray pest blast hectare field farmer water basal dose").split()
+
+
+def synthetic_book(n_pages=1000, sentences_per_page=40, seed=0):
+    """(page_number, text) pairs mixing prose with table-like numeric rows."""
+    rng = random.Random(seed)
+    pages = []
+    for page_number in range(1, n_pages + 1):
+        sentences = []
+        for _ in range(sentences_per_page):
+            if rng.random() < 0.15:
+                sentences.append(" ".join(f"{rng.choice(WORDS)} {rng.randint(1, 999)}" for _ in range(6)))
+            else:
+                sentences.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25))).capitalize() + ".")
+        pages.append((page_number, "\n".join(sentences)))
+    return pages
+
+
+def legacy_chunks(pages, chunk_size=800, chunk_overlap=100):
+    """The previous ingest_engine behaviour: += string building and re-split overlap."""
+    full_text = ""
+    for _, page_text in pages:
+        full_text += page_text + " "
+    text = re.sub(r'\s+', ' ', full_text)
+    processed_text = ""
+    for block in re.split(r'(?<=[.!?])\s+', text):
+        if sum(c.isalpha() for c in block) > 10 and sum(c.isdigit() for c in block) > 5:
+            if not block.endswith('.'):
+                block += '.'
+        processed_text += block + " "
+    chunks, current_chunk = [], ""
+    for sentence in re.split(r'(?<=[.!?])\s+', processed_text.strip()):
+        if len(current_chunk) + len(sentence) + 1 < chunk_size:
+            current_chunk += sentence + " "
+        else:
+            chunks.append(current_chunk.strip())
+            current_chunk = " ".join(current_chunk.split()[-chunk_overlap:]) + " " + sentence + " "
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return [c for c in chunks if len(c) > 100]
+
+
+def measure(label, func):
+    # Timed and memory-traced in separate runs: tracemalloc slows every allocation
+    start = time.perf_counter()
+    n_chunks = len(func())
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {label:<22}{elapsed:>10.2f}{peak / 2**20:>12.1f}{n_chunks:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the legacy and token-aware chunkers.")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--tokenizer", action="store_true", help="Count tokens with the SBERT tokenizer")
+    args = parser.parse_args()
+
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+
+    pages = synthetic_book(args.pages)
+    chunker = TokenAwareChunker(tokenizer=tokenizer)
+    print(f"\n📖 Synthetic book: {args.pages} pages, {sum(len(t) for _, t in pages) / 2**20:.1f} MiB of text")
+    print(f"   {'chunker':<22}{'seconds':>10}{'peak MiB':>12}{'chunks':>10}")
+    measure("legacy (+= strings)", lambda: legacy_chunks(pages))
+    measure("token-aware", lambda: list(chunker.iter_page_chunks(pages)))
+
+
+if __name__ == "__main__":
+    main()
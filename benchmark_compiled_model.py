@@ -0,0 +1,132 @@
+# benchmark_compiled_model.py - Parity and latency of the compiled yield model vs the sklearn pipeline
+#
+# Checks that CompiledModel predicts what pipeline.predict does (including
+# unseen categories and missing numbers; exits 1 on a mismatch), then
+# times one row at a time, as /predict scores, and whole batches, as
+# /predict/batch does. tests/test_compiled_model.py asserts the same parity.
+#
+# Usage:
+#   python benchmark_compiled_model.py                                   # trains a small synthetic model
+#   python benchmark_compiled_model.py --model models/yield_model-20261018-191257.pkl
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from compiled_model import compile_pipeline
+from model_registry import model_frame
+from train_yield_model import (
+    BOOLEAN_FEATURES, CATEGORICAL_FEATURES, NUMERIC_FEATURES, TARGET, build_encoder, build_model,
+)
+
+CATEGORIES = {
+    'Region': ['North', 'South', 'East', 'West'],
+    'Soil_Type': ['Clay', 'Sandy', 'Loam', 'Silt', 'Peaty', 'Chalky'],
+    'Crop': ['Wheat', 'Rice', 'Maize', 'Barley', 'Soybean', 'Cotton'],
+    'Weather_Condition': ['Sunny', 'Rainy', 'Cloudy'],
+}
+TOLERANCE = 1e-6
+
+
+def synthetic_rows(n, seed=0, noisy=False):
+    """Feature dicts shaped like the API's model input; noisy adds unseen and missing values."""
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        **{c: rng.choice(values, n) for c, values in CATEGORIES.items()},
+        'Fertilizer_Used': rng.random(n) < 0.5,
+        'Irrigation_Used': rng.random(n) < 0.5,
+        'Rainfall_mm': rng.uniform(100, 1000, n),
+        'Temperature_Celsius': rng.uniform(15, 40, n),
+        'Days_to_Harvest': rng.integers(60, 150, n),
+    })
+    rows = frame.to_dict('records')
+    if noisy:
+        for row in rows[::7]:
+            row['Crop'] = 'Millet'
+        for row in rows[3::11]:
+            row['Rainfall_mm'] = None
+    return rows
+
+
+def synthetic_pipeline(n_rows, max_iter):
+    from sklearn.pipeline import Pipeline
+    frame = pd.DataFrame(synthetic_rows(n_rows, seed=1))
+    frame[TARGET] = (frame['Rainfall_mm'] / 200 + frame['Fertilizer_Used'] * 1.5
+                     + frame['Crop'].map({c: i * 0.3 for i, c in enumerate(CATEGORIES['Crop'])})
+                     + np.random.default_rng(2).normal(0, 0.5, n_rows))
+    encoder = build_encoder(NUMERIC_FEATURES)
+    features = frame[CATEGORICAL_FEATURES + BOOLEAN_FEATURES + NUMERIC_FEATURES]
+    X = encoder.fit_transform(features)
+    model = build_model({"max_leaf_nodes": 31}).set_params(max_iter=max_iter).fit(X, frame[TARGET])
+    return Pipeline([("prep", encoder), ("model", model)])
+
+
+def per_row_ms(predict, rows):
+    latencies = []
+    for row in rows:
+        start = time.perf_counter()
+        predict([row])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def batch_ms(predict, rows, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(rows)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled vs sklearn yield model: parity and latency.")
+    parser.add_argument("--model", help="Exported .pkl pipeline (default: train a synthetic one)")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows for the parity check")
+    parser.add_argument("--single", type=int, default=300, help="Single-row calls to time")
+    parser.add_argument("--batches", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    if args.model:
+        import joblib
+        pipeline = joblib.load(args.model)
+    else:
+        print("🔧 Training a synthetic 20k-row, 300-tree model...")
+        pipeline = synthetic_pipeline(20000, 300)
+
+    started = time.perf_counter()
+    compiled = compile_pipeline(pipeline)
+    print(f"✅ Compiled in {(time.perf_counter() - started) * 1000:.0f} ms: {compiled.meta['kind']}, "
+          f"{len(compiled.arrays.get('value', []))} nodes, depth {compiled.meta.get('max_depth', '-')}")
+
+    def sklearn_predict(rows):
+        return pipeline.predict(model_frame(pipeline, rows))
+
+    # --- Parity ---
+    rows = synthetic_rows(args.rows, seed=3, noisy=True)
+    expected, got = sklearn_predict(rows), compiled.predict(rows)
+    max_diff = float(np.max(np.abs(expected - got)))
+    status = "✅" if max_diff <= TOLERANCE else "❌"
+    print(f"{status} Parity on {len(rows)} rows (unseen crops, missing rainfall): max |diff| = {max_diff:.2e}")
+    if max_diff > TOLERANCE:
+        # Timing a model that predicts something else is meaningless; fail the run
+        raise SystemExit(1)
+
+    # --- Latency ---
+    single = rows[:args.single]
+    sk_p50, sk_p99 = per_row_ms(sklearn_predict, single)
+    c_p50, c_p99 = per_row_ms(compiled.predict, single)
+    print(f"\n📊 Single row ({len(single)} calls)   {'p50 ms':>9}{'p99 ms':>9}")
+    print(f"   {'sklearn pipeline':<28}{sk_p50:>9.3f}{sk_p99:>9.3f}")
+    print(f"   {'compiled':<28}{c_p50:>9.3f}{c_p99:>9.3f}   ({sk_p50 / c_p50:.1f}x)")
+
+    print(f"\n📊 Batches   {'rows':>7}{'sklearn ms':>12}{'compiled ms':>13}{'speedup':>9}")
+    for size in args.batches:
+        batch = synthetic_rows(size, seed=4)
+        sk, c = batch_ms(sklearn_predict, batch), batch_ms(compiled.predict, batch)
+        print(f"   {'':<10}{size:>7}{sk:>12.2f}{c:>13.2f}{sk / c:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmark_embedding_store.py - Per-worker memory and cold start of the RAG store formats
+#
+# Each mode runs in a fresh Python process, the way a uvicorn worker would
+# load the store. RssAnon is memory private to that worker; RssFile is
+# page cache that every worker mapping the same files shares.
+#
+# Usage:
+#   python benchmark_embedding_store.py                    # synthetic 100k-chunk corpus
+#   python benchmark_embedding_store.py --real             # embeddings.pt / text_chunks.json
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from embedding_store import write_store
+
+WORKER = r'''
+import sys, json, time
+t0 = time.perf_counter()
+import numpy as np
+from vector_index import FlatIndex
+mode, prefix, legacy_vectors, legacy_chunks = sys.argv[1:5]
+if mode == "legacy-torch":
+    import torch
+    vectors = torch.load(legacy_vectors).cpu().numpy()
+    chunks = json.load(open(legacy_chunks, encoding="utf-8"))
+    index = FlatIndex(vectors)
+elif mode == "in-memory":
+    vectors = np.load(legacy_vectors)
+    chunks = json.load(open(legacy_chunks, encoding="utf-8"))
+    index = FlatIndex(vectors)
+else:
+    from embedding_store import EmbeddingStore
+    store = EmbeddingStore.open(prefix)
+    vectors, chunks = store.vectors, store.chunks
+    index = FlatIndex(vectors, normalized=True)
+ready = time.perf_counter() - t0
+query = np.random.default_rng(0).normal(size=vectors.shape[1]).astype(np.float32)
+t1 = time.perf_counter()
+_, ids = index.search(query, top_k=5)
+texts = [chunks[i] for i in ids.tolist()]
+search_ms = (time.perf_counter() - t1) * 1000
+t2 = time.perf_counter()
+index.search(query, top_k=5)
+warm_ms = (time.perf_counter() - t2) * 1000
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if ":" in line)
+kb = lambda key: int(status.get(key, "0 kB").split()[0])
+print(json.dumps({"ready_s": ready, "search_ms": search_ms, "warm_ms": warm_ms,
+                  "rss_mb": kb("VmRSS") / 1024, "anon_mb": kb("RssAnon") / 1024,
+                  "file_mb": kb("RssFile") / 1024}))
+'''
+
+
+def run_mode(mode, prefix, legacy_vectors, legacy_chunks):
+    out = subprocess.run([sys.executable, "-c", WORKER, mode, prefix, legacy_vectors, legacy_chunks],
+                         capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare resident memory and cold start of RAG store formats.")
+    parser.add_argument("--real", action="store_true", help="Use embeddings.pt and text_chunks.json from this folder")
+    parser.add_argument("--chunks", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.real:
+            import torch
+            legacy_vectors, legacy_chunks = os.path.abspath('embeddings.pt'), os.path.abspath('text_chunks.json')
+            vectors = torch.load(legacy_vectors).cpu().numpy()
+            with open(legacy_chunks, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            modes = ["legacy-torch"]
+        else:
+            rng = np.random.default_rng(0)
+            vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+            chunks = [f"Chunk {i}: " + "paddy urea irrigation schedule " * 25 for i in range(args.chunks)]
+            legacy_vectors, legacy_chunks = os.path.join(tmp, "vectors.npy"), os.path.join(tmp, "chunks.json")
+            np.save(legacy_vectors, vectors)
+            with open(legacy_chunks, 'w', encoding='utf-8') as f:
+                json.dump(chunks, f)
+            modes = ["in-memory"]
+
+        for dtype in ("float32", "float16", "int8"):
+            write_store(vectors, chunks, dtype=dtype, prefix=os.path.join(tmp, dtype))
+            modes.append(dtype)
+
+        print(f"\n📦 {len(chunks)} chunks x {vectors.shape[1]} dims")
+        print(f"   {'format':<14}{'ready s':>9}{'1st ms':>9}{'warm ms':>9}{'RSS MB':>9}"
+              f"{'private MB':>12}{'shared MB':>11}")
+        for mode in modes:
+            r = run_mode(mode, os.path.join(tmp, mode), legacy_vectors, legacy_chunks)
+            print(f"   {mode:<14}{r['ready_s']:>9.2f}{r['search_ms']:>9.1f}{r['warm_ms']:>9.1f}{r['rss_mb']:>9.0f}"
+                  f"{r['anon_mb']:>12.0f}{r['file_mb']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
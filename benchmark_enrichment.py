@@ -0,0 +1,149 @@
+# benchmark_enrichment.py - Throughput of the enrichment engine against local stub upstreams
+#
+# Starts stub NASA POWER and SoilGrids servers that answer after a fixed
+# latency (and optionally fail a fraction of calls with 503 to exercise the
+# retries), points enrich_dataset at them and enriches a synthetic crop table
+# with different worker counts, each starting from an empty weather cache.
+# A final run repeats the last one against the warm weather and soil caches.
+#
+# Usage:
+#   python benchmark_enrichment.py --rows 400 --latency-ms 150 --workers 1 8 32
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+
+def make_stub_handler(latency_s, failure_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            if random.random() < failure_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path.endswith("/point"):
+                body = self._nasa(query)
+            else:
+                body = self._soil()
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _nasa(self, query):
+            days = pd.date_range(pd.to_datetime(query["start"]), pd.to_datetime(query["end"]), freq="D")
+            seed = abs(hash((query["latitude"], query["longitude"]))) % (2 ** 32)
+            rng = np.random.default_rng(seed)
+            keys = days.strftime("%Y%m%d")
+
+            def series(low, high):
+                return dict(zip(keys, np.round(rng.uniform(low, high, len(days)), 2).tolist()))
+
+            return {"properties": {"parameter": {
+                "T2M": series(15, 35), "PRECTOTCORR": series(0, 20), "RH2M": series(30, 95),
+            }}}
+
+        def _soil(self):
+            names = {"phh2o": 65, "nitrogen": 120, "phosphorus": 12, "potassium": 55}
+            return {"properties": {"layers": [
+                {"name": name, "depths": [{"label": "0-5cm", "values": {"mean": value}}]}
+                for name, value in names.items()
+            ]}}
+
+    return StubHandler
+
+
+def start_stub(latency_s, failure_rate):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_stub_handler(latency_s, failure_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def synthetic_rows(n_rows, n_districts):
+    rng = np.random.default_rng(0)
+    seasons = ["Kharif", "Rabi", "Whole Year"]
+    df = pd.DataFrame({
+        "state_name": "stubstate",
+        "district_name": [f"district{i}" for i in rng.integers(n_districts, size=n_rows)],
+        "year": rng.integers(2005, 2015, size=n_rows),
+        "season": [seasons[i] for i in rng.integers(len(seasons), size=n_rows)],
+        "crop": "Rice",
+    })
+    coords_df = pd.DataFrame({
+        "district": [f"District{i}" for i in range(n_districts)],
+        "state": "StubState",
+        "latitude": [10 + i * 0.1 for i in range(n_districts)],
+        "longitude": [75 + i * 0.1 for i in range(n_districts)],
+    })
+    return df, coords_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark enrich_dataset against stub upstreams.")
+    parser.add_argument("--rows", type=int, default=400)
+    parser.add_argument("--districts", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Fraction of calls answered with 503")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rate", type=float, default=1000, help="Per-upstream token-bucket rate (calls/s)")
+    args = parser.parse_args()
+
+    base = start_stub(args.latency_ms / 1000, args.failure_rate)
+    os.environ["NASA_POWER_URL"] = f"{base}/api/temporal/daily/point"
+    os.environ["SOILGRIDS_URL"] = f"{base}/soilgrids/v2.0/properties/query"
+    os.environ["NASA_RATE_PER_SECOND"] = str(args.rate)
+    os.environ["SOILGRIDS_RATE_PER_SECOND"] = str(args.rate)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import enrich_dataset
+    from soil_cache import SoilCache
+    for upstream in (enrich_dataset.nasa_power, enrich_dataset.soilgrids):
+        upstream.backoff_seconds = 0.05
+
+    df, coords_df = synthetic_rows(args.rows, args.districts)
+    started = time.perf_counter()
+    located, fetch_plan, _ = enrich_dataset.prepare_rows(df, coords_df)
+    prepare_s = time.perf_counter() - started
+    print(f"\n🌾 {args.rows} rows, {args.districts} districts, {args.latency_ms:.0f} ms upstream latency, "
+          f"{args.failure_rate:.0%} transient failures; preparation took {prepare_s * 1000:.0f} ms")
+    print(f"   {'run':>10}{'seconds':>10}{'rows/s':>10}{'enriched':>10}   upstream calls/retries/failures")
+
+    def run(label, workers, soil):
+        for upstream in (enrich_dataset.nasa_power, enrich_dataset.soilgrids):
+            upstream.counters = dict.fromkeys(upstream.counters, 0)
+        started = time.perf_counter()
+        enriched = sum(int(batch["temperature"].notna().sum()) if "temperature" in batch else 0
+                       for batch in enrich_dataset.enrich_rows(located, fetch_plan, workers=workers,
+                                                              soil_cache=soil))
+        elapsed = time.perf_counter() - started
+        print(f"   {label:>10}{elapsed:>10.2f}{args.rows / elapsed:>10.1f}{enriched:>10}   "
+              f"{enrich_dataset.upstream_summary()}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            enrich_dataset.weather_history.cache_dir = os.path.join(tmp, f"w{workers}")
+            os.makedirs(enrich_dataset.weather_history.cache_dir)
+            soil = SoilCache(os.path.join(tmp, f"soil{workers}.sqlite"))
+            run(f"{workers} cold", workers, soil)
+        run(f"{workers} warm", workers, soil)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmark_lexical_index.py - Build time and query latency of the BM25 index
+#
+# Builds the index over a synthetic corpus shaped like the book chunks
+# (Zipf-distributed vocabulary, ~150 tokens per chunk) with variety codes
+# planted in a few chunks, then times queries and checks that exact codes
+# are retrieved first.
+#
+# Usage:
+#   python benchmark_lexical_index.py                      # 100k synthetic chunks
+#   python benchmark_lexical_index.py --chunks text_chunks.json
+import json
+import argparse
+import time
+
+import numpy as np
+
+from lexical_index import LexicalIndex, tokenize
+
+CODES = ["ADT 43", "CO 51", "IR 64", "MTU 1010", "BPT 5204", "PUSA 1121", "HD 2967", "GW 322"]
+CHEMICALS = ["urea", "mancozeb", "chlorpyrifos", "imidacloprid", "carbendazim", "glyphosate"]
+
+
+def synthetic_corpus(n, vocab_size=40000, words_per_chunk=150, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(vocab_size)])
+    ranks = np.minimum(rng.zipf(1.2, size=n * words_per_chunk), vocab_size) - 1
+    words = vocab[ranks].reshape(n, words_per_chunk)
+    chunks = [" ".join(row) for row in words]
+    planted = {}
+    for i, term in enumerate(CODES + CHEMICALS):
+        for doc_id in rng.choice(n, size=3, replace=False):
+            chunks[doc_id] += f" Variety {term} is recommended." if term in CODES else f" Apply {term} at sowing."
+            planted.setdefault(term, set()).add(int(doc_id))
+    return chunks, planted, vocab
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 index build time and query latency.")
+    parser.add_argument("--chunks", help="text_chunks.json to index (default: synthetic corpus)")
+    parser.add_argument("--size", type=int, default=100_000, help="Synthetic chunks")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.chunks:
+        with open(args.chunks, 'r', encoding='utf-8') as f:
+            chunks = json.load(f)
+        planted = {}
+        words = [t for chunk in chunks[:2000] for t in tokenize(chunk)]
+        queries = {"sampled words": [" ".join(rng.choice(words, size=rng.integers(3, 9)))
+                                     for _ in range(args.queries)]}
+    else:
+        print(f"🔧 Generating {args.size} synthetic chunks...")
+        chunks, planted, vocab = synthetic_corpus(args.size)
+        # Content words (log-uniform over ranks past the 20 everyday words), plus the
+        # worst case: only words that appear in nearly every chunk
+        def words(low, high, n):
+            return vocab[np.exp(rng.uniform(np.log(low), np.log(high), n)).astype(int)]
+        queries = {
+            "content words": [" ".join(words(20, len(vocab), rng.integers(2, 7))) for _ in range(args.queries)],
+            "everyday words only": [" ".join(words(1, 20, rng.integers(2, 7))) for _ in range(args.queries)],
+        }
+
+    started = time.perf_counter()
+    index = LexicalIndex.build(chunks)
+    build_s = time.perf_counter() - started
+    print(f"✅ Built over {len(chunks)} chunks in {build_s:.1f}s: {len(index.terms)} terms, "
+          f"{len(index.docs)} postings ({(index.docs.nbytes + index.weights.nbytes) / 1e6:.0f} MB)")
+
+    print(f"\n📊 Query latency, top_k={args.top_k}   {'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}")
+    for name, batch in queries.items():
+        latencies = []
+        for query in batch:
+            start = time.perf_counter()
+            index.search(query, top_k=args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies = np.array(latencies)
+        print(f"   {name + f' ({len(batch)})':<32}{np.percentile(latencies, 50):>8.2f}"
+              f"{np.percentile(latencies, 99):>8.2f}{latencies.max():>8.2f}")
+
+    if planted:
+        print("\n📋 Exact terms (planted in 3 chunks each): found in top 3")
+        for term, docs in planted.items():
+            for query in (f"which variety is {term}", term.replace(" ", "-").lower()):
+                _, found = index.search(query, top_k=3)
+                hits = len(docs & set(found.tolist()))
+                print(f"   {'✅' if hits == len(docs) else '❌'} {query!r:<32} {hits}/3")
+
+
+if __name__ == "__main__":
+    main()
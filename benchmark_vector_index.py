@@ -0,0 +1,85 @@
+# benchmark_vector_index.py - Recall@k and latency of the vector index backends
+#
+# Usage:
+#   python benchmark_vector_index.py                       # synthetic corpora
+#   python benchmark_vector_index.py --embeddings embeddings.pt
+import argparse
+import time
+
+import numpy as np
+
+from vector_index import FlatIndex, IVFIndex, normalize_vectors
+
+DIM = 384  # all-MiniLM-L6-v2
+
+
+def synthetic_corpus(n, n_topics=200, seed=0):
+    """Clustered unit vectors, roughly shaped like sentence embeddings of book chunks."""
+    rng = np.random.default_rng(seed)
+    topics = normalize_vectors(rng.normal(size=(n_topics, DIM)))
+    labels = rng.integers(0, n_topics, size=n)
+    return normalize_vectors(topics[labels] + 0.8 * rng.normal(size=(n, DIM)) / np.sqrt(DIM))
+
+
+def load_embeddings(path):
+    import torch
+    return torch.load(path).cpu().numpy()
+
+
+def time_queries(index, queries, top_k, **kwargs):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q, top_k=top_k, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    return np.array(latencies), results
+
+
+def recall_at_k(truth, found):
+    hits = [len(set(t.tolist()) & set(f.tolist())) / max(len(t), 1) for t, f in zip(truth, found)]
+    return float(np.mean(hits))
+
+
+def run(vectors, n_queries, top_k, nprobes):
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), n_queries, replace=False)
+    queries = normalize_vectors(vectors[picks] + 0.05 * rng.normal(size=(n_queries, vectors.shape[1])))
+
+    flat = FlatIndex(vectors)
+    flat_lat, truth = time_queries(flat, queries, top_k)
+    print(f"\n📊 Corpus: {len(vectors)} chunks x {vectors.shape[1]} dims, {n_queries} queries, k={top_k}")
+    print(f"   {'backend':<18}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}")
+    print(f"   {'flat':<18}{1.0:>10.3f}{np.percentile(flat_lat, 50):>10.2f}"
+          f"{np.percentile(flat_lat, 99):>10.2f}{0.0:>10.2f}")
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(vectors)
+    build_s = time.perf_counter() - start
+    for nprobe in nprobes:
+        lat, found = time_queries(ivf, queries, top_k, nprobe=nprobe)
+        label = f"ivf/{ivf.n_lists} np={nprobe}"
+        print(f"   {label:<18}{recall_at_k(truth, found):>10.3f}{np.percentile(lat, 50):>10.2f}"
+              f"{np.percentile(lat, 99):>10.2f}{build_s:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark flat vs IVF vector index backends.")
+    parser.add_argument("--embeddings", help="Path to an embeddings.pt file (default: synthetic corpora)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.embeddings:
+        corpora = [load_embeddings(args.embeddings)]
+    else:
+        corpora = [synthetic_corpus(n) for n in args.sizes]
+
+    for vectors in corpora:
+        run(vectors, min(args.queries, len(vectors)), args.top_k, args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
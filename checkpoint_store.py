@@ -0,0 +1,53 @@
+# checkpoint_store.py - Append-only SQLite checkpoint of enriched rows, keyed by source row
+import json
+import sqlite3
+
+import pandas as pd
+
+
+class CheckpointStore:
+    """
+    Every finished batch is inserted in one transaction, so a checkpoint costs
+    time proportional to the batch, not to everything done so far. Rows are
+    keyed by their index in the input file: resuming skips exactly the rows
+    already stored, whatever order they finished in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (source_row INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def done_rows(self):
+        return {row[0] for row in self._conn.execute("SELECT source_row FROM rows")}
+
+    def append(self, batch):
+        """Stores a DataFrame of enriched rows indexed by source row."""
+        records = batch.to_dict('records')
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows (source_row, data) VALUES (?, ?)",
+                ((int(index), json.dumps(record)) for index, record in zip(batch.index, records)),
+            )
+
+    def iter_chunks(self, chunk_size=10000):
+        """Yields the stored rows as DataFrames in source-row order, chunk_size rows at a time."""
+        last = -1
+        while True:
+            rows = self._conn.execute(
+                "SELECT source_row, data FROM rows WHERE source_row > ? ORDER BY source_row LIMIT ?",
+                (last, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield pd.DataFrame([json.loads(data) for _, data in rows], index=[index for index, _ in rows])
+
+    def close(self):
+        self._conn.close()
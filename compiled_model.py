@@ -0,0 +1,333 @@
+# compiled_model.py - The yield pipeline compiled to plain NumPy arrays
+#
+# pipeline.predict on a one-row DataFrame spends most of its time building
+# the frame, validating column names and dispatching through the encoders,
+# not in the trees. compile_pipeline() turns a fitted
+# Pipeline(ColumnTransformer -> model) into category-to-index tables plus
+# flat node arrays (or linear coefficients), saved as one .npz next to the
+# .pkl. CompiledModel scores dicts of raw features with a few NumPy ops.
+#
+# Supported steps: OrdinalEncoder, OneHotEncoder, StandardScaler and
+# passthrough columns, feeding a HistGradientBoostingRegressor or a linear
+# model. Anything else raises UnsupportedPipeline, and callers keep sklearn.
+#
+# Usage:
+#   python compiled_model.py models/yield_model-20261018-191257.pkl
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+BITSET_WORDS = 8  # 8 x 32 bits = HGB's 256 possible categories
+
+
+class UnsupportedPipeline(ValueError):
+    pass
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _scalar(value):
+    """numpy scalars -> plain Python, so categories survive a JSON round trip."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# --- Compilation ---
+
+def _column_names(transformer_columns, input_names):
+    if isinstance(transformer_columns, str):
+        return [transformer_columns]
+    columns = list(transformer_columns)
+    if columns and isinstance(columns[0], (bool, np.bool_)):
+        return [name for name, keep in zip(input_names, columns) if keep]
+    if columns and isinstance(columns[0], (int, np.integer)):
+        return [input_names[i] for i in columns]
+    return [str(c) for c in columns]
+
+
+def _compile_encoder(prep):
+    """Column specs laying out the encoded matrix exactly as prep.transform does."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder, StandardScaler
+
+    if not isinstance(prep, ColumnTransformer):
+        raise UnsupportedPipeline(f"cannot compile preprocessing step {type(prep).__name__}")
+    input_names = [str(c) for c in getattr(prep, 'feature_names_in_', [])]
+    specs, offset = [], 0
+    for _, transformer, columns in prep.transformers_:
+        if transformer == 'drop':
+            continue
+        names = _column_names(columns, input_names)
+        if not names:
+            continue
+        # Fitted transformers_ may hold 'passthrough' as an identity FunctionTransformer
+        if transformer == 'passthrough' or (isinstance(transformer, FunctionTransformer)
+                                            and transformer.func is None):
+            for name in names:
+                specs.append({"name": name, "kind": "number", "offset": offset})
+                offset += 1
+        elif isinstance(transformer, StandardScaler):
+            means = transformer.mean_ if transformer.mean_ is not None else np.zeros(len(names))
+            scales = transformer.scale_ if transformer.scale_ is not None else np.ones(len(names))
+            for name, mean, scale in zip(names, means, scales):
+                specs.append({"name": name, "kind": "number", "offset": offset,
+                              "mean": float(mean), "scale": float(scale)})
+                offset += 1
+        elif isinstance(transformer, OrdinalEncoder):
+            unknown = (transformer.unknown_value
+                       if transformer.handle_unknown == 'use_encoded_value' else None)
+            missing = float(transformer.encoded_missing_value)
+            for name, categories in zip(names, transformer.categories_):
+                specs.append({"name": name, "kind": "category", "offset": offset,
+                              "categories": [_scalar(c) for c in categories],
+                              "unknown": None if unknown is None else float(unknown),
+                              "missing": None if np.isnan(missing) else missing})
+                offset += 1
+        elif isinstance(transformer, OneHotEncoder):
+            if transformer.drop_idx_ is not None or getattr(transformer, '_infrequent_enabled', False):
+                raise UnsupportedPipeline("cannot compile OneHotEncoder with drop or infrequent categories")
+            for name, categories in zip(names, transformer.categories_):
+                specs.append({"name": name, "kind": "onehot", "offset": offset,
+                              "categories": [_scalar(c) for c in categories],
+                              "ignore_unknown": transformer.handle_unknown != 'error'})
+                offset += len(categories)
+        else:
+            raise UnsupportedPipeline(f"cannot compile column transformer {type(transformer).__name__}")
+    return specs, offset
+
+
+def _bit(bitsets, codes):
+    """(len(bitsets), len(codes)) booleans: is each code in each 256-bit set."""
+    return ((bitsets[:, codes >> 5] >> (codes & 31).astype(np.uint32)) & 1).astype(bool)
+
+
+def _compile_trees(model, n_features):
+    """
+    All trees concatenated into one node table, each tree renumbered
+    breadth-first so a node's children are adjacent: the right child is
+    always child + 1, and a split is one comparison plus an add. Categorical
+    splits become a per-node table over the 256 category codes (plus one
+    column for missing), folding in sklearn's rule that unknown categories
+    follow the missing-value direction.
+    """
+    link = type(model._loss.link).__name__
+    if link != 'IdentityLink' or model.n_trees_per_iteration_ != 1:
+        raise UnsupportedPipeline(f"cannot compile a HistGradientBoosting model with {link}")
+    known_bitsets = np.zeros((n_features, BITSET_WORDS), dtype=np.uint32)
+    if model.is_categorical_ is not None:
+        known, f_idx_map = model._bin_mapper.make_known_categories_bitsets()
+        for feature in np.flatnonzero(model.is_categorical_):
+            known_bitsets[feature] = known[f_idx_map[feature]]
+    codes = np.arange(BITSET_WORDS * 32)
+
+    trees, cat_tables, roots = [], [], []
+    node_offset = n_cat = max_depth = 0
+    for (predictor,) in model._predictors:
+        tree = predictor.nodes
+        order = [0]
+        for old in order:
+            if not tree['is_leaf'][old]:
+                order += [int(tree['left'][old]), int(tree['right'][old])]
+        tree = tree[order]
+        new_id = np.empty(len(order), dtype=np.int64)
+        new_id[order] = np.arange(len(order))
+        leaf = tree['is_leaf'].astype(bool)
+        categorical = tree['is_categorical'].astype(bool) & ~leaf
+        cat_row = np.full(len(tree), -1, dtype=np.int64)
+        cat_row[categorical] = n_cat + np.arange(categorical.sum())
+        if categorical.any():
+            node_cats = tree[categorical]
+            in_left = _bit(predictor.raw_left_cat_bitsets[node_cats['bitset_idx']], codes)
+            in_known = _bit(known_bitsets[node_cats['feature_idx']], codes)
+            missing_left = node_cats['missing_go_to_left'].astype(bool)[:, None]
+            goes_left = np.where(in_left | in_known, in_left, missing_left)
+            cat_tables.append(np.hstack([goes_left, missing_left]))
+            n_cat += len(node_cats)
+        trees.append({
+            "feature": np.where(leaf, 0, tree['feature_idx']),
+            "threshold": tree['num_threshold'],
+            "child": np.where(leaf, -1, new_id[np.where(leaf, 0, tree['left'])] + node_offset),
+            "leaf": leaf,
+            "value": np.where(leaf, tree['value'], 0.0),
+            "missing_left": tree['missing_go_to_left'].astype(bool),
+            "cat_row": cat_row,
+        })
+        roots.append(node_offset)
+        node_offset += len(tree)
+        max_depth = max(max_depth, int(tree['depth'].max()))
+
+    if not trees:
+        raise UnsupportedPipeline("the model has no trees")
+    arrays = {key: np.concatenate([t[key] for t in trees]) for key in trees[0]}
+    for key in ("feature", "child", "cat_row"):
+        arrays[key] = arrays[key].astype(np.int32)
+    arrays["cat_left"] = (np.vstack(cat_tables) if cat_tables
+                          else np.zeros((1, len(codes) + 1), dtype=bool))
+    arrays["roots"] = np.array(roots, dtype=np.int32)
+    arrays["baseline"] = np.array([float(np.ravel(model._baseline_prediction)[0])])
+    return arrays, {"kind": "trees", "max_depth": max_depth}
+
+
+def _compile_linear(model):
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    if coef.ndim != 1:
+        raise UnsupportedPipeline("cannot compile a multi-output linear model")
+    return {"coef": coef, "intercept": np.array([float(np.ravel(model.intercept_)[0])])}, {"kind": "linear"}
+
+
+def compile_pipeline(pipeline, source_sha1=None):
+    """A CompiledModel equivalent to a fitted Pipeline([prep, model]); raises UnsupportedPipeline."""
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+    steps = getattr(pipeline, 'steps', None)
+    if not steps or len(steps) != 2:
+        raise UnsupportedPipeline("expected a Pipeline of one ColumnTransformer and one regressor")
+    prep, model = steps[0][1], steps[1][1]
+    specs, n_features = _compile_encoder(prep)
+    if isinstance(model, HistGradientBoostingRegressor):
+        arrays, model_meta = _compile_trees(model, n_features)
+    elif hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        arrays, model_meta = _compile_linear(model)
+    else:
+        raise UnsupportedPipeline(f"cannot compile model {type(model).__name__}")
+    meta = {"columns": specs, "n_features": n_features, "source_sha1": source_sha1, **model_meta}
+    return CompiledModel(meta, arrays)
+
+
+# --- Inference ---
+
+class CompiledModel:
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        self.source_sha1 = meta.get("source_sha1")
+        self._columns = []
+        for spec in meta["columns"]:
+            table = {c: i for i, c in enumerate(spec.get("categories", ()))}
+            self._columns.append((spec, table))
+        self._predict_encoded = self._predict_trees if meta["kind"] == "trees" else self._predict_linear
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files if key != 'meta'}
+            meta = json.loads(str(data['meta']))
+        return cls(meta, arrays)
+
+    def save(self, path):
+        """Writes the .npz atomically (np.savez appends .npz to names without it)."""
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, meta=np.array(json.dumps(self.meta)), **self.arrays)
+        os.replace(tmp, path)
+
+    def encode(self, rows):
+        """Raw feature dicts -> the float64 matrix the fitted ColumnTransformer would produce."""
+        X = np.zeros((len(rows), self.meta["n_features"]))
+        for spec, table in self._columns:
+            name, offset = spec["name"], spec["offset"]
+            values = [row.get(name) for row in rows]
+            if spec["kind"] == "number":
+                column = np.array([np.nan if v is None else float(v) for v in values])
+                if "mean" in spec:
+                    column = (column - spec["mean"]) / spec["scale"]
+                X[:, offset] = column
+            elif spec["kind"] == "category":
+                X[:, offset] = [self._category_code(spec, table, v) for v in values]
+            else:
+                for i, v in enumerate(values):
+                    code = table.get(v)
+                    if code is None and not spec["ignore_unknown"]:
+                        raise ValueError(f"Found unknown category {v!r} in column {name!r}")
+                    if code is not None:
+                        X[i, offset + code] = 1.0
+        return X
+
+    @staticmethod
+    def _category_code(spec, table, value):
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return np.nan if spec["missing"] is None else spec["missing"]
+        code = table.get(value)
+        if code is not None:
+            return code
+        if spec["unknown"] is None:
+            raise ValueError(f"Found unknown category {value!r} in column {spec['name']!r}")
+        return spec["unknown"]
+
+    def predict(self, rows):
+        """Predictions for a list of raw feature dicts, as a float64 array."""
+        return self._predict_encoded(self.encode(rows))
+
+    def _predict_linear(self, X):
+        return X @ self.arrays["coef"] + self.arrays["intercept"][0]
+
+    def _predict_trees(self, X):
+        """
+        Walks every (row, tree) pair down at once, one level per step; pairs
+        that reach a leaf drop out of the active set. Split semantics follow
+        sklearn's raw-data predictor: NaN goes the missing-value direction.
+        """
+        a = self.arrays
+        n_rows, n_features = X.shape
+        n_trees = len(a["roots"])
+        X = np.ascontiguousarray(X).ravel()
+        row_base = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        node = np.tile(a["roots"], n_rows)
+        active = np.flatnonzero(~a["leaf"][node])
+        while active.size:
+            nid = node[active]
+            x = X[row_base[active] + a["feature"][nid]]
+            go_left = (x <= a["threshold"][nid]) | (np.isnan(x) & a["missing_left"][nid])
+            cat_row = a["cat_row"][nid]
+            on_cat = np.flatnonzero(cat_row >= 0)
+            if on_cat.size:
+                xc = x[on_cat]
+                out_of_range = np.isnan(xc) | (xc < 0) | (xc >= BITSET_WORDS * 32)
+                code = np.where(out_of_range, BITSET_WORDS * 32, xc).astype(np.intp)
+                go_left[on_cat] = a["cat_left"][cat_row[on_cat], code]
+            nid = a["child"][nid] + ~go_left
+            node[active] = nid
+            active = active[~a["leaf"][nid]]
+        return a["baseline"][0] + a["value"][node].reshape(n_rows, n_trees).sum(axis=1)
+
+
+def compile_model_file(model_file):
+    """Compiles a saved .pkl pipeline to <same name>.npz; returns the new path."""
+    import joblib
+    compiled = compile_pipeline(joblib.load(model_file), source_sha1=file_sha1(model_file))
+    path = os.path.splitext(model_file)[0] + '.npz'
+    compiled.save(path)
+    return path
+
+
+def load_for(model_file):
+    """
+    The compiled artifact belonging to model_file, or None when there is
+    none or it was compiled from a different version of the .pkl.
+    """
+    path = os.path.splitext(model_file)[0] + '.npz'
+    if not os.path.exists(path) or not os.path.exists(model_file):
+        return None
+    compiled = CompiledModel.load(path)
+    if compiled.source_sha1 != file_sha1(model_file):
+        print(f"⚠️ '{path}' was compiled from a different '{model_file}'; ignoring it.")
+        return None
+    return compiled
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python compiled_model.py MODEL_FILE.pkl")
+        sys.exit(1)
+    try:
+        print(f"✅ Compiled to '{compile_model_file(sys.argv[1])}'.")
+    except UnsupportedPipeline as e:
+        print(f"❌ {e}")
+        sys.exit(1)
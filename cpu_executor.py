@@ -0,0 +1,17 @@
+# cpu_executor.py - Dedicated pool for CPU-bound work on the async API path
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Torch, NumPy and sklearn release the GIL in their heavy kernels, so threads
+# are enough to keep the event loop free while a model runs.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu-bound")
+
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """Runs a blocking, CPU-heavy call on the dedicated pool and awaits the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, functools.partial(func, *args, **kwargs))
@@ -1,44 +1,180 @@
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
 import requests
+import httpx
 from dotenv import load_dotenv
 from datetime import datetime
 
+from ttl_cache import TTLCache
+
 # Load environment variables from a .env file
 load_dotenv()
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+REQUEST_TIMEOUT_SECONDS = 10
+CURRENT_WEATHER_TTL_SECONDS = 600
+FORECAST_SLOT_SECONDS = 3 * 3600  # OpenWeatherMap publishes 3-hourly forecast slots
+WEATHER_CACHE_SIZE = 2048
+
+# Shared clients: keep connections to OpenWeatherMap alive between requests
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+_async_client = None
+
+# --- Weather cache & request coalescing ---
+current_weather_cache = TTLCache(max_size=WEATHER_CACHE_SIZE, ttl_seconds=CURRENT_WEATHER_TTL_SECONDS)
+forecast_cache = TTLCache(max_size=WEATHER_CACHE_SIZE, ttl_seconds=FORECAST_SLOT_SECONDS)
+_inflight_async = {}
+_inflight_sync = {}
+_inflight_lock = threading.Lock()
+_counters = {"upstream_calls": 0, "coalesced": 0}
+
+
+def _normalize_town(town_name: str):
+    return " ".join(town_name.split()).lower()
+
+
+def _seconds_until_next_forecast_slot():
+    """A cached forecast stays valid until the next 3-hour slot is published."""
+    return max(60, FORECAST_SLOT_SECONDS - time.time() % FORECAST_SLOT_SECONDS)
+
+
+def _coalesce_sync(key, fetch):
+    """Runs `fetch` once for concurrent callers asking for the same key."""
+    with _inflight_lock:
+        future = _inflight_sync.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight_sync[key] = future
+        else:
+            _counters["coalesced"] += 1
+    if not owner:
+        return future.result()
+    try:
+        result = fetch()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_sync.pop(key, None)
+
+
+async def _coalesce_async(key, fetch):
+    """Shares one in-flight upstream call between concurrent coroutines."""
+    task = _inflight_async.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _inflight_async[key] = task
+        task.add_done_callback(lambda _: _inflight_async.pop(key, None))
+    else:
+        _counters["coalesced"] += 1
+    # Shielded so one caller disconnecting does not cancel the others' fetch
+    return await asyncio.shield(task)
+
+
+def get_weather_stats():
+    """Cache hit/miss and upstream call counters for the API."""
+    return {
+        "current_cache": current_weather_cache.stats(),
+        "forecast_cache": forecast_cache.stats(),
+        **_counters,
+    }
+
+
+def get_async_client():
+    """Returns the pooled async HTTP client, creating it on first use."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """Closes the pooled async client (called on API shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def _weather_params(town_name: str):
+    if not OPENWEATHER_API_KEY:
+        raise Exception("OpenWeatherMap API key is not set in the .env file.")
+    return {"q": town_name, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+
+
+def _raise_for_status_code(status_code: int, town_name: str, context: str = ""):
+    if status_code == 401:
+        raise Exception("Invalid OpenWeatherMap API key.")
+    if status_code == 404:
+        raise Exception(f"The town '{town_name}' could not be found{context}.")
+    raise Exception(f"API request failed: {status_code}")
+
+
+def _parse_current_weather(data: dict):
+    current_weather = {
+        "location_name": f"{data['name']}, {data['sys']['country']}",
+        "temperature_celsius": data["main"]["temp"],
+        "humidity_percent": data["main"]["humidity"],
+        "wind_speed_mps": data["wind"]["speed"],
+        "description": data["weather"][0]["description"].title(),
+        "rainfall_last_hour_mm": data.get("rain", {}).get("1h", 0.0)
+    }
+    coordinates = {"lat": data["coord"]["lat"], "lon": data["coord"]["lon"]} if "coord" in data else None
+    return {"current_conditions": current_weather, "coordinates": coordinates}
+
+
+def _parse_forecast(data: dict):
+    forecast_list = []
+    # The 'list' key contains 40 forecast entries (8 per day for 5 days)
+    for entry in data.get("list", []):
+        forecast_list.append({
+            "datetime": entry["dt_txt"],
+            "temperature_celsius": entry["main"]["temp"],
+            "wind_speed_mps": entry["wind"]["speed"],  # Added wind speed
+            # 'pop' is the Probability of Precipitation
+            "rain_chance_percent": entry["pop"] * 100,
+            "description": entry["weather"][0]["description"].title()
+        })
+    return {"forecast": forecast_list}
 
 
 def fetch_weather_by_town(town_name: str):
     """
     Fetches CURRENT weather data for a specific town using the free API.
+    Results are cached for CURRENT_WEATHER_TTL_SECONDS per town.
     """
-    if not OPENWEATHER_API_KEY:
-        raise Exception("OpenWeatherMap API key is not set in the .env file.")
+    key = _normalize_town(town_name)
+    cached = current_weather_cache.get(key)
+    if cached is not None:
+        return cached
+    return _coalesce_sync(("current", key), lambda: _request_current_weather(town_name, key))
+
 
-    url = f"https://api.openweathermap.org/data/2.5/weather?q={town_name}&appid={OPENWEATHER_API_KEY}&units=metric"
+def _request_current_weather(town_name: str, key: str):
+    params = _weather_params(town_name)
 
     try:
-        response = requests.get(url, timeout=10)
+        _counters["upstream_calls"] += 1
+        response = _session.get(f"{OPENWEATHER_BASE_URL}/weather", params=params, timeout=REQUEST_TIMEOUT_SECONDS)
         response.raise_for_status()
-        data = response.json()
-
-        current_weather = {
-            "location_name": f"{data['name']}, {data['sys']['country']}",
-            "temperature_celsius": data["main"]["temp"],
-            "humidity_percent": data["main"]["humidity"],
-            "wind_speed_mps": data["wind"]["speed"],
-            "description": data["weather"][0]["description"].title(),
-            "rainfall_last_hour_mm": data.get("rain", {}).get("1h", 0.0)
-        }
-        return {"current_conditions": current_weather}
+        result = _parse_current_weather(response.json())
+        current_weather_cache.set(key, result)
+        return result
 
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            raise Exception("Invalid OpenWeatherMap API key.")
-        if e.response.status_code == 404:
-            raise Exception(f"The town '{town_name}' could not be found.")
-        raise Exception(f"API request failed: {e.response.status_code}")
+        _raise_for_status_code(e.response.status_code, town_name)
     except Exception as e:
         raise Exception(f"An error occurred: {str(e)}")
 
@@ -46,37 +182,84 @@ def fetch_weather_by_town(town_name: str):
 def fetch_weather_forecast_by_town(town_name: str):
     """
     Fetches a 5-DAY, 3-HOUR forecast, including rain probability and wind speed, for a specific town.
+    Results are cached until the next forecast slot.
     """
-    if not OPENWEATHER_API_KEY:
-        raise Exception("OpenWeatherMap API key is not set in the .env file.")
+    key = _normalize_town(town_name)
+    cached = forecast_cache.get(key)
+    if cached is not None:
+        return cached
+    return _coalesce_sync(("forecast", key), lambda: _request_forecast(town_name, key))
 
-    # Use the free 'forecast' endpoint
-    url = f"https://api.openweathermap.org/data/2.5/forecast?q={town_name}&appid={OPENWEATHER_API_KEY}&units=metric"
+
+def _request_forecast(town_name: str, key: str):
+    params = _weather_params(town_name)
 
     try:
-        response = requests.get(url, timeout=10)
+        _counters["upstream_calls"] += 1
+        # Use the free 'forecast' endpoint
+        response = _session.get(f"{OPENWEATHER_BASE_URL}/forecast", params=params, timeout=REQUEST_TIMEOUT_SECONDS)
         response.raise_for_status()
-        data = response.json()
-
-        forecast_list = []
-        # The 'list' key contains 40 forecast entries (8 per day for 5 days)
-        for entry in data.get("list", []):
-            forecast_list.append({
-                "datetime": entry["dt_txt"],
-                "temperature_celsius": entry["main"]["temp"],
-                "wind_speed_mps": entry["wind"]["speed"],  # Added wind speed
-                # 'pop' is the Probability of Precipitation
-                "rain_chance_percent": entry["pop"] * 100,
-                "description": entry["weather"][0]["description"].title()
-            })
-
-        return {"forecast": forecast_list}
+        result = _parse_forecast(response.json())
+        forecast_cache.set(key, result, ttl_seconds=_seconds_until_next_forecast_slot())
+        return result
 
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            raise Exception("Invalid OpenWeatherMap API key.")
-        if e.response.status_code == 404:
-            raise Exception(f"The town '{town_name}' could not be found for forecast.")
-        raise Exception(f"API request failed: {e.response.status_code}")
+        _raise_for_status_code(e.response.status_code, town_name, " for forecast")
+    except Exception as e:
+        raise Exception(f"An error occurred: {str(e)}")
+
+
+async def fetch_weather_by_town_async(town_name: str):
+    """
+    Non-blocking variant of fetch_weather_by_town for the async API path.
+    """
+    key = _normalize_town(town_name)
+    cached = current_weather_cache.get(key)
+    if cached is not None:
+        return cached
+    return await _coalesce_async(("current", key), lambda: _request_current_weather_async(town_name, key))
+
+
+async def _request_current_weather_async(town_name: str, key: str):
+    params = _weather_params(town_name)
+
+    try:
+        _counters["upstream_calls"] += 1
+        response = await get_async_client().get(f"{OPENWEATHER_BASE_URL}/weather", params=params)
+        response.raise_for_status()
+        result = _parse_current_weather(response.json())
+        current_weather_cache.set(key, result)
+        return result
+
+    except httpx.HTTPStatusError as e:
+        _raise_for_status_code(e.response.status_code, town_name)
+    except Exception as e:
+        raise Exception(f"An error occurred: {str(e)}")
+
+
+async def fetch_weather_forecast_by_town_async(town_name: str):
+    """
+    Non-blocking variant of fetch_weather_forecast_by_town for the async API path.
+    """
+    key = _normalize_town(town_name)
+    cached = forecast_cache.get(key)
+    if cached is not None:
+        return cached
+    return await _coalesce_async(("forecast", key), lambda: _request_forecast_async(town_name, key))
+
+
+async def _request_forecast_async(town_name: str, key: str):
+    params = _weather_params(town_name)
+
+    try:
+        _counters["upstream_calls"] += 1
+        response = await get_async_client().get(f"{OPENWEATHER_BASE_URL}/forecast", params=params)
+        response.raise_for_status()
+        result = _parse_forecast(response.json())
+        forecast_cache.set(key, result, ttl_seconds=_seconds_until_next_forecast_slot())
+        return result
+
+    except httpx.HTTPStatusError as e:
+        _raise_for_status_code(e.response.status_code, town_name, " for forecast")
     except Exception as e:
         raise Exception(f"An error occurred: {str(e)}")
@@ -0,0 +1,193 @@
+# embedding_store.py - Memory-mapped, compact on-disk store for the RAG embeddings
+#
+# Layout (all files sit next to each other, named from one prefix):
+#   <prefix>.vectors.npy   unit-length vectors: float32, float16 or int8 (row-quantized)
+#   <prefix>.scales.npy    per-row dequantization scales (int8 only)
+#   <prefix>.chunks.bin    UTF-8 chunk texts, back to back
+#   <prefix>.offsets.npy   int64 byte offsets into chunks.bin (n + 1 entries)
+#   <prefix>.meta.json     dtype, count, dimension and a content hash of the chunks
+#
+# Every array is opened with mmap, so uvicorn workers on one host share a
+# single copy through the page cache, and chunk texts are decoded only when
+# a search actually returns them.
+#
+# Convert an existing embeddings.pt / text_chunks.json pair with:
+#   python embedding_store.py --dtype float16
+import os
+import json
+import hashlib
+import argparse
+
+import numpy as np
+
+# --- Config ---
+STORE_PREFIX = 'rag_store'
+DTYPES = ('float32', 'float16', 'int8')
+
+
+def store_paths(prefix=STORE_PREFIX):
+    return {
+        "vectors": f"{prefix}.vectors.npy",
+        "scales": f"{prefix}.scales.npy",
+        "chunks": f"{prefix}.chunks.bin",
+        "offsets": f"{prefix}.offsets.npy",
+        "meta": f"{prefix}.meta.json",
+    }
+
+
+def store_exists(prefix=STORE_PREFIX):
+    return os.path.exists(store_paths(prefix)["meta"])
+
+
+class QuantizedVectors:
+    """Row-quantized int8 matrix that dequantizes to float32 only for the rows it is asked for."""
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+        self.shape = codes.shape
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+
+class ChunkTexts:
+    """Read-only sequence of chunk texts, decoded lazily from the mmapped text file."""
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._data[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def sha1(self):
+        digest = hashlib.sha1(self._data)
+        digest.update(np.asarray(self._offsets, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+
+def chunks_sha1(chunks):
+    """
+    Content hash of a chunk list: its UTF-8 texts back to back, then their
+    int64 offsets (the chunks.bin layout), so a list and the store written
+    from it hash the same.
+    """
+    if isinstance(chunks, ChunkTexts):
+        return chunks.sha1()
+    digest = hashlib.sha1()
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    for i, chunk in enumerate(chunks):
+        encoded = chunk.encode('utf-8')
+        digest.update(encoded)
+        offsets[i + 1] = offsets[i] + len(encoded)
+    digest.update(offsets.tobytes())
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, vectors, chunks, meta):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @classmethod
+    def open(cls, prefix=STORE_PREFIX):
+        paths = store_paths(prefix)
+        with open(paths["meta"], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        codes = np.load(paths["vectors"], mmap_mode='r')
+        if meta["dtype"] == 'int8':
+            vectors = QuantizedVectors(codes, np.load(paths["scales"], mmap_mode='r'))
+        else:
+            vectors = codes
+        offsets = np.load(paths["offsets"], mmap_mode='r')
+        if os.path.getsize(paths["chunks"]):
+            data = np.memmap(paths["chunks"], dtype=np.uint8, mode='r')
+        else:
+            data = np.empty(0, dtype=np.uint8)
+        if not (len(codes) == len(offsets) - 1 == meta["count"]):
+            raise ValueError(f"Embedding store '{prefix}' is inconsistent. Re-run the conversion.")
+        return cls(vectors, ChunkTexts(data, offsets), meta)
+
+
+def write_store(vectors, chunks, dtype='float16', prefix=STORE_PREFIX):
+    """Writes normalized vectors and chunk texts in the mmap-friendly layout."""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported store dtype '{dtype}'. Choose from {DTYPES}.")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) != len(chunks):
+        raise ValueError(f"{len(vectors)} vectors but {len(chunks)} chunks.")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+
+    paths = store_paths(prefix)
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        _save_npy(paths["scales"], scales.astype(np.float32))
+    else:
+        codes = vectors.astype(dtype)
+    _save_npy(paths["vectors"], codes)
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    digest = hashlib.sha1()
+    with open(paths["chunks"] + '.tmp', 'wb') as f:
+        for i, chunk in enumerate(chunks):
+            encoded = chunk.encode('utf-8')
+            f.write(encoded)
+            digest.update(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    os.replace(paths["chunks"] + '.tmp', paths["chunks"])
+    _save_npy(paths["offsets"], offsets)
+    digest.update(offsets.tobytes())
+
+    meta = {"dtype": dtype, "count": len(chunks), "dim": int(vectors.shape[1]) if len(vectors) else 0,
+            "chunks_sha1": digest.hexdigest()}
+    with open(paths["meta"] + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    # meta.json goes last: readers only trust a store once it exists
+    os.replace(paths["meta"] + '.tmp', paths["meta"])
+
+
+def _save_npy(path, array):
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert embeddings.pt + text_chunks.json to the mmap store.")
+    parser.add_argument("--embeddings", default='embeddings.pt')
+    parser.add_argument("--chunks", default='text_chunks.json')
+    parser.add_argument("--dtype", choices=DTYPES, default='float16')
+    parser.add_argument("--prefix", default=STORE_PREFIX)
+    args = parser.parse_args()
+
+    import torch
+    vectors = torch.load(args.embeddings).cpu().numpy()
+    with open(args.chunks, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    write_store(vectors, chunks, dtype=args.dtype, prefix=args.prefix)
+    print(f"💾 Wrote {len(chunks)} {args.dtype} vectors to '{args.prefix}.*'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,39 @@
 import pandas as pd
-import requests
-import time
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import os
 
+from checkpoint_store import CheckpointStore
+from soil_cache import SoilCache, grid_cell
+from upstream import Upstream
+from weather_history import WeatherHistory, season_aggregates
+
 # --- Configuration ---
 INPUT_CSV = "crop-wise-area-production-yield.csv"
 # MODIFIED: Pointing to your new coordinates file
 COORDS_CSV = "UnApportionedIdentifiers.csv"
 OUTPUT_CSV = "enriched_crop_yield_data.csv"
-CHECKPOINT_FILE = "checkpoint.csv"
+CHECKPOINT_FILE = "enrich_checkpoint.sqlite"
+OUTPUT_CHUNK_ROWS = 20000
+UNMATCHED_CSV = "unmatched_districts.csv"
+
+# --- Upstreams ---
+# Base URLs can point at local stub servers (see benchmark_enrichment.py)
+NASA_POWER_URL = os.getenv("NASA_POWER_URL", "https://power.larc.nasa.gov/api/temporal/daily/point")
+SOILGRIDS_URL = os.getenv("SOILGRIDS_URL", "https://rest.isric.org/soilgrids/v2.0/properties/query")
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "8"))
+NASA_RATE_PER_SECOND = float(os.getenv("NASA_RATE_PER_SECOND", "4"))
+# ISRIC's fair-use policy for SoilGrids is 5 calls per minute
+SOILGRIDS_RATE_PER_SECOND = float(os.getenv("SOILGRIDS_RATE_PER_SECOND", str(5 / 60)))
+
+nasa_power = Upstream("nasa_power", NASA_POWER_URL, NASA_RATE_PER_SECOND, timeout=30)
+soilgrids = Upstream("soilgrids", SOILGRIDS_URL, SOILGRIDS_RATE_PER_SECOND, burst=5, timeout=20)
+# Multi-year daily series per location, cached as Parquet (see weather_history.py)
+weather_history = WeatherHistory(nasa_power)
+# Soil properties per grid cell, kept across runs and read by the API (see soil_cache.py)
+soil_store = SoilCache()
 
 # --- Mappings and Constants ---
 # Define date ranges for Indian agricultural seasons
@@ -25,90 +49,253 @@ SEASON_MAP = {
 
 # --- API Helper Functions ---
 
+_soil_inflight = {}
+_soil_inflight_lock = threading.Lock()
+
+
 def fetch_soil_for_model(lat, lon, cache):
-    """Fetches soil data from SoilGrids, using a cache to avoid redundant calls."""
-    cache_key = f"{lat:.2f},{lon:.2f}"
-    if cache_key in cache:
-        return cache[cache_key]
-
-    url = (
-        f"https://rest.isric.org/soilgrids/v2.0/properties/query"
-        f"?lon={lon}&lat={lat}"
-        f"&property=phh2o&property=nitrogen&property=phosphorus&property=potassium"
-        f"&depth=0-5cm&value=mean"
-    )
-    try:
-        resp = requests.get(url, timeout=20).json()
-        if "properties" not in resp:
-            return None
-
-        props = resp["properties"]["layers"]
-
-        def extract_value(layer, default):
-            val = next((v.get("value") for v in layer.get("depths", []) if "value" in v), None)
-            # SoilGrids returns values scaled by 10 or 100
-            if layer['name'] == 'phh2o' and val is not None: return val / 10.0
-            if layer['name'] == 'nitrogen' and val is not None: return val / 100.0
-            return val if val is not None else default
-
-        soil_data = {
-            "soil_ph": extract_value(next(p for p in props if p['name'] == 'phh2o'), 7.0),
-            "soil_nitrogen": extract_value(next(p for p in props if p['name'] == 'nitrogen'), 0.2),
-            "soil_phosphorus": extract_value(next(p for p in props if p['name'] == 'phosphorus'), 10.0),
-            "soil_potassium": extract_value(next(p for p in props if p['name'] == 'potassium'), 50.0)
-        }
-        cache[cache_key] = soil_data
+    """
+    Returns soil data from the persistent SoilCache, fetching and storing it
+    from SoilGrids on a miss. Worker threads asking for the same grid cell
+    share one request.
+    """
+    soil_data = cache.get(lat, lon)
+    if soil_data is not None:
         return soil_data
-    except requests.RequestException:
-        return None
 
+    cell = grid_cell(lat, lon)
+    with _soil_inflight_lock:
+        entry = _soil_inflight.get(cell)
+        owner = entry is None
+        if owner:
+            entry = _soil_inflight[cell] = Future()
+    if not owner:
+        return entry.result()
 
-def fetch_nasa_weather(lat, lon, start_date, end_date):
-    """Fetches historical weather data from NASA POWER API."""
-    base_url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+    soil_data = None
+    try:
+        # Another thread may have stored it between our first look and the claim
+        soil_data = cache.get(lat, lon)
+        if soil_data is None:
+            soil_data = _request_soil(lat, lon)
+            if soil_data is not None:
+                cache.put(lat, lon, soil_data)
+    finally:
+        with _soil_inflight_lock:
+            _soil_inflight.pop(cell, None)
+        entry.set_result(soil_data)
+    return soil_data
+
+
+def prefetch_soil(locations, cache=None, workers=ENRICH_WORKERS):
+    """Fills the soil cache for every (lat, lon) whose grid cell is not cached yet."""
+    cache = soil_store if cache is None else cache
+    todo = cache.missing(locations)
+    if not todo:
+        return 0
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="soil") as pool:
+        futures = [pool.submit(fetch_soil_for_model, lat, lon, cache) for lat, lon in todo]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Prefetching soil", unit="cell"):
+            fetched += future.result() is not None
+    return fetched
+
+
+def _request_soil(lat, lon):
     params = {
-        "parameters": "T2M,PRECTOTCORR,RH2M",
-        "community": "AG",
-        "longitude": lon,
-        "latitude": lat,
-        "start": start_date,
-        "end": end_date,
-        "format": "JSON"
+        "lon": lon,
+        "lat": lat,
+        "property": ["phh2o", "nitrogen", "phosphorus", "potassium"],
+        "depth": "0-5cm",
+        "value": "mean",
     }
+    resp = soilgrids.get_json(params)
+    if not resp or "properties" not in resp:
+        return None
     try:
-        response = requests.get(base_url, params=params, timeout=30)
-        if response.status_code != 200:
-            return None
-
-        data = response.json()
-
-        temp_data = [v for v in data['properties']['parameter']['T2M'].values() if v != -999]
-        precip_data = [v for v in data['properties']['parameter']['PRECTOTCORR'].values() if v != -999]
-        humidity_data = [v for v in data['properties']['parameter']['RH2M'].values() if v != -999]
-
-        return {
-            "temperature": sum(temp_data) / len(temp_data) if temp_data else None,
-            "rainfall": sum(precip_data),
-            "humidity": sum(humidity_data) / len(humidity_data) if humidity_data else None,
-        }
-    except requests.RequestException:
+        layers = {layer['name']: layer for layer in resp["properties"]["layers"]}
+    except (KeyError, TypeError):
         return None
 
+    def extract_value(name, default):
+        # Depth entries carry {"values": {"mean": ...}}; older responses used a flat "value".
+        # Properties SoilGrids does not map fall back to the default.
+        depths = layers.get(name, {}).get("depths", [])
+        val = next((v["values"].get("mean") if "values" in v else v.get("value")
+                    for v in depths if "values" in v or "value" in v), None)
+        # SoilGrids returns values scaled by 10 or 100
+        if name == 'phh2o' and val is not None: return val / 10.0
+        if name == 'nitrogen' and val is not None: return val / 100.0
+        return val if val is not None else default
+
+    return {
+        "soil_ph": extract_value('phh2o', 7.0),
+        "soil_nitrogen": extract_value('nitrogen', 0.2),
+        "soil_phosphorus": extract_value('phosphorus', 10.0),
+        "soil_potassium": extract_value('potassium', 50.0)
+    }
+
+
+def normalize_key(values):
+    return values.astype(str).str.strip().str.lower()
+
+
+def season_windows(seasons, years):
+    """
+    Column-wise (start_date, end_date) of every row's season, from SEASON_MAP.
+    Seasons that end before they start run into the next year. Unknown
+    seasons or years give NaT.
+    """
+    bounds = pd.DataFrame(
+        [(name, *map(int, start.split('-')), *map(int, end.split('-')))
+         for name, (start, end) in SEASON_MAP.items()],
+        columns=['season', 'start_month', 'start_day', 'end_month', 'end_day'],
+    ).set_index('season')
+    row_bounds = bounds.reindex(seasons.astype(str).str.strip().to_numpy())
+    row_bounds.index = seasons.index
+    year = pd.to_numeric(years, errors='coerce')
+    rolls_over = (row_bounds['end_month'] * 100 + row_bounds['end_day']
+                  < row_bounds['start_month'] * 100 + row_bounds['start_day'])
+
+    def to_dates(year, month, day):
+        parts = pd.DataFrame({'year': year, 'month': month, 'day': day})
+        valid = parts.notna().all(axis=1)
+        dates = pd.Series(pd.NaT, index=parts.index, dtype='datetime64[ns]')
+        dates[valid] = pd.to_datetime(parts[valid].astype(int))
+        return dates
+
+    start_date = to_dates(year, row_bounds['start_month'], row_bounds['start_day'])
+    end_date = to_dates(year + rolls_over, row_bounds['end_month'], row_bounds['end_day'])
+    return start_date, end_date
+
+
+# --- Enrichment Engine ---
+
+PLAN_COLUMNS = ['latitude', 'longitude', 'start_date', 'end_date']
+ENRICHED_COLUMNS = ['temperature', 'rainfall', 'humidity',
+                    'soil_ph', 'soil_nitrogen', 'soil_phosphorus', 'soil_potassium']
+
+
+def prepare_rows(df, coords_df):
+    """
+    Vectorized preparation stage. Joins every crop row to its district's
+    coordinates on normalized (district, state) keys and adds its season
+    window. Returns:
+      located     rows that can be enriched, with PLAN_COLUMNS added
+      fetch_plan  one row per location: latitude, longitude, start_year, end_year, rows
+      unmatched   (district, state, rows) for districts with no coordinates
+    """
+    coords = coords_df.assign(district=normalize_key(coords_df['district']),
+                              state=normalize_key(coords_df['state']))
+    coords = (coords.drop_duplicates(['district', 'state'], keep='last')
+                    .set_index(['district', 'state'])[['latitude', 'longitude']])
+
+    keys = pd.DataFrame({'district': normalize_key(df['district_name']),
+                         'state': normalize_key(df['state_name'])}, index=df.index)
+    matched = keys.join(coords, on=['district', 'state'])
+    start_date, end_date = season_windows(df['season'], df['year'])
+
+    has_coords = matched['latitude'].notna() & matched['longitude'].notna()
+    unmatched = keys[~has_coords].value_counts().rename('rows').reset_index()
+
+    usable = has_coords & start_date.notna() & end_date.notna()
+    located = df[usable].assign(latitude=matched['latitude'], longitude=matched['longitude'],
+                                start_date=start_date, end_date=end_date)
+    fetch_plan = (located.assign(start_year=located['start_date'].dt.year, end_year=located['end_date'].dt.year)
+                         .groupby(['latitude', 'longitude'], sort=False)
+                         .agg(start_year=('start_year', 'min'), end_year=('end_year', 'max'),
+                              rows=('start_year', 'size'))
+                         .reset_index())
+    return located, fetch_plan, unmatched
+
+
+def enrich_location(lat, lon, start_year, end_year, rows, soil_cache):
+    """Enriches all rows of one location from a single weather series and a single soil lookup."""
+    enriched = rows.drop(columns=PLAN_COLUMNS)
+    series = weather_history.daily_series(lat, lon, start_year, end_year)
+    if series is not None:
+        aggregates = season_aggregates(series, rows['start_date'], rows['end_date'])
+        aggregates.index = rows.index
+        enriched = enriched.join(aggregates)
+    soil_data = fetch_soil_for_model(lat, lon, soil_cache)
+    if soil_data:
+        enriched = enriched.assign(**soil_data)
+    return enriched
+
+
+def enrich_rows(located, fetch_plan, workers=ENRICH_WORKERS, soil_cache=None):
+    """
+    Enriches located rows one fetch-plan location at a time on a thread pool
+    and yields each location's rows as it completes, so upstream calls scale
+    with the number of districts rather than rows. The per-upstream token
+    buckets, not the pool size, set the request rate.
+    """
+    soil_cache = soil_store if soil_cache is None else soil_cache
+    groups = located.groupby(['latitude', 'longitude'], sort=False)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as pool:
+        futures = [
+            pool.submit(enrich_location, location.latitude, location.longitude,
+                        int(location.start_year), int(location.end_year),
+                        groups.get_group((location.latitude, location.longitude)), soil_cache)
+            for location in fetch_plan.itertuples(index=False)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_output(checkpoint, columns, path=OUTPUT_CSV):
+    """Streams the checkpointed rows to the output CSV in source order, one chunk at a time."""
+    written = 0
+    for chunk in checkpoint.iter_chunks(OUTPUT_CHUNK_ROWS):
+        chunk.reindex(columns=columns).to_csv(path, mode='w' if written == 0 else 'a',
+                                              header=written == 0, index=False)
+        written += len(chunk)
+    if written == 0:
+        pd.DataFrame(columns=columns).to_csv(path, index=False)
+    return written
+
+
+def report_preparation(df, located, fetch_plan, unmatched):
+    """Prints what the run will fetch and which rows it cannot enrich."""
+    years = int((fetch_plan['end_year'] - fetch_plan['start_year'] + 1).sum()) if len(fetch_plan) else 0
+    print(f"📋 Fetch plan: {len(fetch_plan)} locations, {years} location-years of daily weather.")
+    if len(unmatched):
+        unmatched.to_csv(UNMATCHED_CSV, index=False)
+        print(f"⚠️ {int(unmatched['rows'].sum())} rows in {len(unmatched)} districts have no coordinates "
+              f"(listed in '{UNMATCHED_CSV}'). Most affected:")
+        for row in unmatched.head(10).itertuples(index=False):
+            print(f"   {row.district}, {row.state}: {row.rows} rows")
+    no_season = len(df) - len(located) - int(unmatched['rows'].sum())
+    if no_season:
+        print(f"⚠️ {no_season} located rows have an unknown season or year and are skipped.")
+
+
+def upstream_summary():
+    """Short per-upstream call/retry/failure counts for the progress bar."""
+    return {
+        upstream.name: "{calls}c/{retries}r/{failures}f".format(**upstream.stats())
+        for upstream in (nasa_power, soilgrids)
+    }
+
 
 # --- Main Script ---
 
 def main():
+    parser = argparse.ArgumentParser(description="Enrich the crop yield dataset with weather and soil data.")
+    parser.add_argument("--prefetch-soil", action="store_true",
+                        help="Only fill the soil cache for every district in the coordinates file")
+    args = parser.parse_args()
+
     print("Starting data enrichment process with 'UnApportionedIdentifiers.csv'...")
 
     # Load input files
-    if not os.path.exists(INPUT_CSV):
+    if not args.prefetch_soil and not os.path.exists(INPUT_CSV):
         print(f"❌ Error: Input file '{INPUT_CSV}' not found.")
         return
     if not os.path.exists(COORDS_CSV):
         print(f"❌ Error: Coordinates file '{COORDS_CSV}' not found.")
         return
 
-    df = pd.read_csv(INPUT_CSV)
     coords_df = pd.read_csv(COORDS_CSV)
 
     # --- MODIFIED SECTION ---
@@ -121,73 +308,49 @@ def main():
     })
     # --- END MODIFIED SECTION ---
 
-    df.columns = df.columns.str.strip().str.lower()
-    coords_df['district'] = coords_df['district'].str.strip().str.lower()
-    coords_df['state'] = coords_df['state'].str.strip().str.lower()
+    if args.prefetch_soil:
+        locations = coords_df[['latitude', 'longitude']].dropna().itertuples(index=False, name=None)
+        fetched = prefetch_soil(list(locations))
+        print(f"🎉 Soil cache '{soil_store.path}' now holds {len(soil_store)} cells ({fetched} fetched).")
+        return
 
-    coords_map = {
-        (row['district'], row['state']): (row['latitude'], row['longitude'])
-        for _, row in coords_df.iterrows()
-    }
+    df = pd.read_csv(INPUT_CSV)
+    df.columns = df.columns.str.strip().str.lower()
 
-    start_index = 0
-    if os.path.exists(CHECKPOINT_FILE):
-        print("✅ Checkpoint file found. Resuming process...")
-        checkpoint_df = pd.read_csv(CHECKPOINT_FILE)
-        start_index = len(checkpoint_df)
-        df_to_process = df.iloc[start_index:].copy()
-        results = checkpoint_df.to_dict('records')
+    # Rows finish location by location; the checkpoint is keyed by their row in the input file
+    resuming = os.path.exists(CHECKPOINT_FILE)
+    checkpoint = CheckpointStore(CHECKPOINT_FILE)
+    if resuming:
+        done = checkpoint.done_rows()
+        print(f"✅ Checkpoint file found with {len(done)} rows. Resuming process...")
+        df_to_process = df[~df.index.isin(done)]
     else:
-        df_to_process = df.copy()
-        results = []
-
-    soil_cache = {}
-
-    print(f"Processing {len(df_to_process)} rows, starting from index {start_index}.")
-
-    for index, row in tqdm(df_to_process.iterrows(), total=len(df_to_process), desc="Enriching Data"):
-        district = str(row.get('district_name', '')).strip().lower()
-        state = str(row.get('state_name', '')).strip().lower()
-        year = pd.to_numeric(row.get('year'), errors='coerce')
-        season = row.get('season', '').strip()
-
-        coords = coords_map.get((district, state))
-        if not coords or pd.isna(year):
-            continue
-
-        lat, lon = coords
-        start_month_day, end_month_day = SEASON_MAP.get(season, (None, None))
-        if not start_month_day:
-            continue
-
-        start_year, end_year = int(year), int(year)
-        if season == "Rabi":
-            end_year += 1
-
-        start_date = f"{start_year}{start_month_day.replace('-', '')}"
-        end_date = f"{end_year}{end_month_day.replace('-', '')}"
-
-        weather_data = fetch_nasa_weather(lat, lon, start_date, end_date)
-        soil_data = fetch_soil_for_model(lat, lon, soil_cache)
-
-        time.sleep(1)
-
-        new_row = row.to_dict()
-        if weather_data: new_row.update(weather_data)
-        if soil_data: new_row.update(soil_data)
-        results.append(new_row)
-
-        if (len(results) % 200 == 0):
-            pd.DataFrame(results).to_csv(CHECKPOINT_FILE, index=False)
-            tqdm.write(f"💾 Checkpoint saved at row {start_index + len(results)}")
-
-    print("\n✅ Processing complete. Saving final enriched dataset...")
-    final_df = pd.DataFrame(results)
-    final_df.to_csv(OUTPUT_CSV, index=False)
-    print(f"🎉 Success! Enriched data saved to '{OUTPUT_CSV}'")
-
-    if os.path.exists(CHECKPOINT_FILE):
-        os.remove(CHECKPOINT_FILE)
+        df_to_process = df
+
+    located, fetch_plan, unmatched = prepare_rows(df_to_process, coords_df)
+    report_preparation(df_to_process, located, fetch_plan, unmatched)
+    print(f"Processing {len(located)} of {len(df_to_process)} remaining rows across {len(fetch_plan)} locations "
+          f"with {ENRICH_WORKERS} workers.")
+
+    # Soil for the whole plan first, in bulk; cells cached by earlier runs cost nothing
+    prefetch_soil(fetch_plan[['latitude', 'longitude']].itertuples(index=False, name=None))
+
+    # tqdm's rate and remaining time are the throughput/ETA report
+    with tqdm(total=len(located), desc="Enriching Data", unit="row") as progress:
+        for enriched in enrich_rows(located, fetch_plan):
+            # Each finished location is checkpointed immediately
+            checkpoint.append(enriched)
+            progress.update(len(enriched))
+            progress.set_postfix(upstream_summary())
+
+    print(f"\n✅ Processing complete ({upstream_summary()}). Saving final enriched dataset...")
+    written = write_output(checkpoint, list(df.columns) + ENRICHED_COLUMNS)
+    checkpoint.close()
+    print(f"🎉 Success! {written} enriched rows saved to '{OUTPUT_CSV}'")
+
+    for path in (CHECKPOINT_FILE, CHECKPOINT_FILE + '-wal', CHECKPOINT_FILE + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+# faq_store.py - Incremental FAQ store with persisted embeddings
+import os
+import glob
+import json
+import threading
+
+import torch
+from sentence_transformers import util
+
+# --- Config ---
+FAQ_FILE = 'faq.json'
+FAQ_LOG_FILE = 'faq_log.jsonl'
+FAQ_EMBEDDINGS_FILE = 'faq_embeddings.pt'
+COMPACT_EVERY = 50  # log entries folded back into faq.json per compaction
+
+
+class FAQStore:
+    """
+    Holds the FAQ entries and their embeddings in memory.
+
+    New answers are appended to an append-only log and their single vector is
+    written into a growable tensor, so adding an entry never re-encodes the
+    FAQ. A background compaction folds the log back into faq.json and
+    persists the embeddings, so a restart only encodes entries it has never
+    seen before.
+    """
+
+    def __init__(self, model, faq_file=FAQ_FILE, log_file=FAQ_LOG_FILE,
+                 embeddings_file=FAQ_EMBEDDINGS_FILE, compact_every=COMPACT_EVERY):
+        self.model = model
+        self.faq_file = faq_file
+        self.log_file = log_file
+        self.embeddings_file = embeddings_file
+        self.compact_every = compact_every
+
+        self.entries = []
+        self._buffer = None
+        self._size = 0
+        self._pending_log = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def embeddings(self):
+        return None if self._buffer is None else self._buffer[:self._size]
+
+    # --- Loading ---
+    def load(self):
+        entries = _read_json_list(self.faq_file)
+        self._pending_log = 0
+        # Logs a compaction set aside but may not have finished folding in
+        for path in self._compacting_logs():
+            base, logged = _compacting_base(path), _read_jsonl(path)
+            if len(entries) == base:
+                entries.extend(logged)
+                self._pending_log += len(logged)
+            elif len(entries) >= base + len(logged):
+                os.remove(path)  # faq.json already holds them
+        logged = _read_jsonl(self.log_file)
+        entries.extend(logged)
+        self._pending_log += len(logged)
+
+        queries = [item['query'] for item in entries]
+        cached_queries, cached_embeddings = self._load_persisted()
+
+        # Reuse persisted vectors for the matching prefix, encode only the rest
+        reuse = 0
+        while (reuse < len(cached_queries) and reuse < len(queries)
+               and cached_queries[reuse] == queries[reuse]):
+            reuse += 1
+
+        parts = []
+        if reuse:
+            parts.append(cached_embeddings[:reuse])
+        if reuse < len(queries):
+            parts.append(self.model.encode(queries[reuse:], convert_to_tensor=True).cpu())
+
+        self.entries = entries
+        if parts:
+            embeddings = torch.cat(parts)
+            self._buffer = embeddings.clone()
+            self._size = len(embeddings)
+            if reuse < len(queries):
+                self._save_embeddings(queries, embeddings)
+        return self
+
+    def _load_persisted(self):
+        if not os.path.exists(self.embeddings_file):
+            return [], None
+        try:
+            saved = torch.load(self.embeddings_file)
+            return saved['queries'], saved['embeddings']
+        except Exception as e:
+            print(f"⚠️ Could not read '{self.embeddings_file}' ({e}). Re-encoding FAQ.")
+            return [], None
+
+    def _save_embeddings(self, queries, embeddings):
+        tmp_path = self.embeddings_file + '.tmp'
+        torch.save({'queries': queries, 'embeddings': embeddings}, tmp_path)
+        os.replace(tmp_path, self.embeddings_file)
+
+    # --- Lookup ---
+    def search(self, query_embedding, threshold):
+        """Returns the answer of the most similar FAQ entry above `threshold`, else None."""
+        with self._lock:
+            buffer, size = self._buffer, self._size
+        if buffer is None or size == 0:
+            return None
+        query_tensor = torch.as_tensor(query_embedding, device=buffer.device)
+        cosine_scores = util.cos_sim(query_tensor, buffer[:size])[0]
+        best_score, best_idx = torch.max(cosine_scores, dim=0)
+        return self.entries[int(best_idx)]['answer'] if best_score > threshold else None
+
+    # --- Updates ---
+    def add(self, query, answer, query_embedding):
+        """Appends a new Q&A pair using its already-computed embedding."""
+        entry = {"query": query, "answer": answer}
+        vector = torch.as_tensor(query_embedding).reshape(1, -1).cpu()
+        with self._lock:
+            self._append_vector(vector)
+            self.entries.append(entry)
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._pending_log += 1
+            should_compact = self._pending_log >= self.compact_every and not self._compacting
+            if should_compact:
+                self._compacting = True
+        print(f"✅ Saved new Q&A to '{self.log_file}'.")
+        if should_compact:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _append_vector(self, vector):
+        if self._buffer is None:
+            self._buffer = torch.empty((16, vector.shape[1]), dtype=vector.dtype)
+        elif self._size == len(self._buffer):
+            # Grow geometrically so appends stay amortized O(1)
+            grown = torch.empty((2 * len(self._buffer), self._buffer.shape[1]), dtype=self._buffer.dtype)
+            grown[:self._size] = self._buffer[:self._size]
+            self._buffer = grown
+        self._buffer[self._size] = vector[0].to(self._buffer.dtype)
+        self._size += 1
+
+    def _compacting_logs(self):
+        """Set-aside logs, oldest first: '<log>.compacting.<N>' follows the first N faq.json entries."""
+        return sorted(glob.glob(glob.escape(self.log_file) + '.compacting.*'), key=_compacting_base)
+
+    def compact(self):
+        """
+        Folds the append-only log into faq.json and persists the embeddings.
+        The log is first renamed aside, tagged with how many entries faq.json
+        held before it; load() uses that count to tell whether a crash came
+        before or after faq.json was replaced, so nothing is read twice.
+        """
+        folded = 0
+        try:
+            with self._lock:
+                entries = list(self.entries)
+                embeddings = self._buffer[:self._size].clone()
+                folded = self._pending_log
+                if os.path.exists(self.log_file):
+                    os.replace(self.log_file, f"{self.log_file}.compacting.{len(entries) - folded}")
+                self._pending_log = 0
+                set_aside = self._compacting_logs()
+
+            tmp_path = self.faq_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.faq_file)
+            for path in set_aside:
+                os.remove(path)
+            self._save_embeddings([item['query'] for item in entries], embeddings)
+            print(f"🗜️ Compacted {folded} new Q&A entries into '{self.faq_file}'.")
+        except Exception as e:
+            print(f"⚠️ FAQ compaction failed: {e}")
+            with self._lock:
+                # The set-aside logs stay on disk and are folded by the next compaction
+                self._pending_log += folded
+        finally:
+            with self._lock:
+                self._compacting = False
+
+
+def _compacting_base(path):
+    return int(path.rsplit('.', 1)[1])
+
+
+def _read_json_list(path):
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f) or []
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"⚠️ Could not read '{path}': {e}")
+        return []
+
+
+def _read_jsonl(path):
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-write; everything before it is intact
+                break
+    return entries
@@ -1,124 +1,308 @@
 # ingest_data.py (Final Robust Version)
 import os
-import re
+import copy
 import json
+import hashlib
+import queue
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import torch
 import pypdf
 from sentence_transformers import SentenceTransformer
 
+from embedding_store import STORE_PREFIX, write_store as write_mmap_store
+from lexical_index import LexicalIndex
+from text_chunker import TokenAwareChunker
+from vector_index import INDEX_FILE, build_index, save_index
+
 # --- Config ---
 PDF_SOURCE_FOLDER = 'books'
 EMBEDDINGS_FILE = 'embeddings.pt'
 CHUNKS_FILE = 'text_chunks.json'
+# One {"source", "page", "page_end"} entry per chunk, so answers can cite book and page
+SOURCES_FILE = 'chunk_sources.json'
 MODEL_NAME = 'all-MiniLM-L6-v2'
+# 'flat' (exact) for small libraries, 'ivf' (approximate) for large ones
+INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "flat")
+# Per-file content hashes: only added or changed books are re-processed, removed ones are dropped
+MANIFEST_FILE = 'ingest_manifest.json'
+PARTS_FOLDER = 'ingest_parts'
+# Compact copy served to the API: 'float16' or 'int8'
+STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float16")
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CHUNK_QUEUE_SIZE = 1024
+ENCODE_BATCH_SIZE = 64
 
-# Delete old files
-for f in [EMBEDDINGS_FILE, CHUNKS_FILE]:
-    if os.path.exists(f):
-        os.remove(f)
-        print(f"Removed old file: {f}")
+_END_OF_FILE = 'end'
+_CHUNK = 'chunk'
+_ALL_DONE = None
 
 # --- Text Extraction & Cleaning ---
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a single PDF file."""
-    full_text = ""
+def extract_pages_from_pdf(pdf_path):
+    """Extracts (page_number, text) pairs from a single PDF file, 1-based."""
+    pages = []
     try:
         reader = pypdf.PdfReader(pdf_path)
-        for page in reader.pages:
+        for page_number, page in enumerate(reader.pages, start=1):
             page_text = page.extract_text()
             if page_text:
-                full_text += page_text + " "
+                pages.append((page_number, page_text))
     except Exception as e:
         print(f"⚠️ Could not read {os.path.basename(pdf_path)}. Error: {e}")
-    return full_text
-
-def advanced_text_cleaning(text):
-    """Cleans text and heuristically splits table-like structures into sentences."""
-    text = re.sub(r'\s+', ' ', text).replace('\f', ' ')
-    blocks = re.split(r'(?<=[.!?])\s+', text)
-    processed_text = ""
-    for block in blocks:
-        digits = sum(c.isdigit() for c in block)
-        letters = sum(c.isalpha() for c in block)
-        if letters > 10 and digits > 5:
-            if not block.endswith('.'):
-                block += '.'
-        processed_text += block + " "
-    return processed_text.strip()
-
-def create_text_chunks(text, chunk_size=800, chunk_overlap=100):
-    """Splits long text into overlapping semantic chunks."""
+    return pages
+
+def extract_text_from_pdf(pdf_path):
+    """Extracts text from a single PDF file."""
+    return " ".join(text for _, text in extract_pages_from_pdf(pdf_path))
+
+def create_text_chunks(text, chunker=None):
+    """Splits long text into overlapping, token-bounded chunks."""
     if not text:
         return []
+    return (chunker or TokenAwareChunker()).chunk_text(text)
+
+# --- Manifest ---
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def file_sha256(pdf_path, block_size=1 << 20):
+    """Content hash of a book; renames and touched mtimes do not count as changes."""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def part_path(pdf_file):
+    return os.path.join(PARTS_FOLDER, os.path.splitext(pdf_file)[0] + '.pt')
+
+def needs_processing(manifest, pdf_file, sha256):
+    """True unless this exact content is already in the store or embedded in a pending part."""
+    entry = manifest.get(pdf_file)
+    if entry is None or entry.get("sha256") != sha256:
+        return True
+    if entry.get("status") == "stored":
+        return False
+    return not (entry.get("status") == "embedded" and os.path.exists(part_path(pdf_file)))
 
-    cleaned_text = advanced_text_cleaning(text)
-    sentences = re.split(r'(?<=[.!?])\s+', cleaned_text)
+def reconcile_manifest(manifest, store_exists):
+    """
+    Drops entries that point at data which is gone: "stored" books when the
+    store files are missing, and "embedded" books whose part file is missing.
+    Embedded parts survive a crash before the first store was written.
+    """
+    def still_valid(pdf_file, entry):
+        if entry.get("status") == "stored":
+            return store_exists
+        return entry.get("status") == "embedded" and os.path.exists(part_path(pdf_file))
+    return {pdf_file: entry for pdf_file, entry in manifest.items() if still_valid(pdf_file, entry)}
 
-    chunks = []
-    current_chunk = ""
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) + 1 < chunk_size:
-            current_chunk += sentence + " "
+# --- Pipeline Stages ---
+def produce_chunks(pdf_paths, chunk_queue, workers, chunker):
+    """Stage 1+2: extracts PDFs in a process pool and streams their chunks into the queue."""
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(extract_pages_from_pdf, path): path for path in pdf_paths}
+            for future in as_completed(futures):
+                pdf_file = os.path.basename(futures[future])
+                pages = future.result()
+                if not pages:
+                    print(f"⚠️ No text extracted from {pdf_file}. Skipping.")
+                for chunk, first_page, last_page in chunker.iter_page_chunks(pages):
+                    source = {"source": pdf_file, "page": first_page, "page_end": last_page}
+                    chunk_queue.put((_CHUNK, pdf_file, (chunk, source)))
+                chunk_queue.put((_END_OF_FILE, pdf_file, None))
+    finally:
+        chunk_queue.put(_ALL_DONE)
+
+def encode_chunks(model, chunk_queue, on_file_done, batch_size=ENCODE_BATCH_SIZE):
+    """Stage 3: encodes queued chunks in batches and hands back each finished file."""
+    per_file = {}
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+        vectors = model.encode([chunk for _, (chunk, _) in pending], convert_to_tensor=True).cpu()
+        for (pdf_file, _), vector in zip(pending, vectors):
+            per_file[pdf_file]['vectors'].append(vector)
+        pending.clear()
+
+    while True:
+        item = chunk_queue.get()
+        if item is _ALL_DONE:
+            break
+        kind, pdf_file, payload = item
+        part = per_file.setdefault(pdf_file, {'chunks': [], 'sources': [], 'vectors': []})
+        if kind == _CHUNK:
+            chunk, source = payload
+            part['chunks'].append(chunk)
+            part['sources'].append(source)
+            pending.append((pdf_file, payload))
+            if len(pending) >= batch_size:
+                flush()
         else:
-            chunks.append(current_chunk.strip())
-            overlap_text = " ".join(current_chunk.split()[-chunk_overlap:])
-            current_chunk = overlap_text + " " + sentence + " "
+            flush()
+            on_file_done(pdf_file, per_file.pop(pdf_file))
 
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+def save_part(pdf_file, part):
+    vectors = torch.stack(part['vectors']) if part['vectors'] else torch.empty(0)
+    tmp_path = part_path(pdf_file) + '.tmp'
+    torch.save({'chunks': part['chunks'], 'sources': part['sources'], 'embeddings': vectors}, tmp_path)
+    os.replace(tmp_path, part_path(pdf_file))
 
-    # Filter out very small chunks
-    return [c for c in chunks if len(c) > 100]
+def load_store():
+    """Loads the current RAG store, or None if it is missing or has no source mapping."""
+    if not all(os.path.exists(f) for f in [EMBEDDINGS_FILE, CHUNKS_FILE, SOURCES_FILE]):
+        return None
+    embeddings = torch.load(EMBEDDINGS_FILE)
+    with open(CHUNKS_FILE, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    with open(SOURCES_FILE, 'r', encoding='utf-8') as f:
+        sources = json.load(f)
+    if not (len(embeddings) == len(chunks) == len(sources)):
+        print("⚠️ Existing store is inconsistent; it will be rebuilt.")
+        return None
+    return embeddings, chunks, sources
 
-# --- Main Ingestion Process ---
-all_text_chunks = []
-book_chunk_report = {}
+def write_store(embeddings, chunks, sources, backend):
+    """Writes the files query_engine loads, each one atomically."""
+    torch.save(embeddings, EMBEDDINGS_FILE + '.tmp')
+    with open(CHUNKS_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(chunks, f)
+    with open(SOURCES_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(sources, f)
+    for path in [EMBEDDINGS_FILE, CHUNKS_FILE, SOURCES_FILE]:
+        os.replace(path + '.tmp', path)
+    print(f"💾 Store saved to '{EMBEDDINGS_FILE}', '{CHUNKS_FILE}' and '{SOURCES_FILE}'")
+
+    write_mmap_store(embeddings.numpy(), chunks, dtype=STORE_DTYPE, prefix=STORE_PREFIX)
+    print(f"💾 Memory-mapped {STORE_DTYPE} store saved to '{STORE_PREFIX}.*'")
 
-print(f"\n📂 Scanning folder: {PDF_SOURCE_FOLDER}")
-pdf_files = [f for f in os.listdir(PDF_SOURCE_FOLDER) if f.lower().endswith('.pdf')]
-if not pdf_files:
-    print("❌ No PDF files found in the folder.")
-    exit()
+    lexical = LexicalIndex.build(chunks)
+    lexical.save(STORE_PREFIX)
+    print(f"💾 BM25 index of {len(lexical.terms)} terms saved to '{STORE_PREFIX}.bm25.*'")
+
+    print(f"🧭 Building '{backend}' vector index...")
+    save_index(build_index(embeddings.numpy(), backend=backend), INDEX_FILE)
+    print(f"💾 Vector index saved to '{INDEX_FILE}'")
+
+def splice_store(store, keep_books, new_parts, backend):
+    """
+    Stage 4: keeps the existing rows of unchanged books, drops rows of removed
+    or changed books and appends the freshly embedded parts.
+    """
+    embeddings, chunks, sources = store or (torch.empty(0), [], [])
+    keep_rows = [i for i, src in enumerate(sources) if src["source"] in keep_books]
+
+    all_chunks = [chunks[i] for i in keep_rows]
+    all_sources = [sources[i] for i in keep_rows]
+    all_embeddings = [embeddings[keep_rows]] if keep_rows else []
+    for pdf_file in sorted(new_parts):
+        part = torch.load(part_path(pdf_file))
+        if not part['chunks']:
+            continue
+        all_chunks.extend(part['chunks'])
+        all_sources.extend(part['sources'])
+        all_embeddings.append(part['embeddings'])
+
+    if not all_chunks:
+        return 0
+    write_store(torch.cat(all_embeddings), all_chunks, all_sources, backend)
+    return len(all_chunks)
+
+# --- Main Ingestion Process ---
+def run_ingestion(source_folder=PDF_SOURCE_FOLDER, rebuild=False, workers=EXTRACT_WORKERS,
+                  backend=INDEX_BACKEND):
+    print(f"\n📂 Scanning folder: {source_folder}")
+    pdf_files = sorted(f for f in os.listdir(source_folder) if f.lower().endswith('.pdf'))
+    if not pdf_files:
+        print("❌ No PDF files found in the folder.")
+        return False
 
-for pdf_file in pdf_files:
-    pdf_path = os.path.join(PDF_SOURCE_FOLDER, pdf_file)
-    print(f"\n📖 Processing: {pdf_file}")
-    raw_text = extract_text_from_pdf(pdf_path)
+    os.makedirs(PARTS_FOLDER, exist_ok=True)
+    store = None if rebuild else load_store()
+    manifest = {} if rebuild else reconcile_manifest(load_manifest(), store is not None)
+    hashes = {f: file_sha256(os.path.join(source_folder, f)) for f in pdf_files}
+    removed = sorted(set(manifest) - set(pdf_files))
+    todo = [f for f in pdf_files if needs_processing(manifest, f, hashes[f])]
+    print(f"   {len(pdf_files) - len(todo)} book(s) unchanged, {len(todo)} added or changed, "
+          f"{len(removed)} removed.")
 
-    if not raw_text.strip():
-        print(f"⚠️ No text extracted from {pdf_file}. Skipping.")
-        continue
+    if todo:
+        print(f"⚙️ Loading model '{MODEL_NAME}'...")
+        model = SentenceTransformer(MODEL_NAME)
+        # Chunk sizes and overlap are measured in the model's own word pieces.
+        # The producer thread gets its own tokenizer copy so it never contends with encode().
+        chunker = TokenAwareChunker(tokenizer=copy.deepcopy(model.tokenizer))
 
-    chunks = create_text_chunks(raw_text)
-    print(f"✅ Extracted {len(chunks)} chunks from {pdf_file}")
+        def on_file_done(pdf_file, part):
+            save_part(pdf_file, part)
+            manifest[pdf_file] = {"status": "embedded", "sha256": hashes[pdf_file],
+                                  "chunks": len(part['chunks'])}
+            save_manifest(manifest)
+            print(f"✅ Extracted and embedded {len(part['chunks'])} chunks from {pdf_file}")
 
-    all_text_chunks.extend(chunks)
-    book_chunk_report[pdf_file] = len(chunks)
+        chunk_queue = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+        producer = threading.Thread(
+            target=produce_chunks,
+            args=([os.path.join(source_folder, f) for f in todo], chunk_queue, workers, chunker),
+            daemon=True,
+        )
+        producer.start()
+        print("🔍 Extracting and generating embeddings (this may take a while)...")
+        encode_chunks(model, chunk_queue, on_file_done)
+        producer.join()
 
-if not all_text_chunks:
-    print("❌ No valid text chunks could be created. Stopping.")
-    exit()
+    pending = [f for f in pdf_files if manifest.get(f, {}).get("status") == "embedded"]
+    if not todo and not pending and not removed and store is not None:
+        print("\n✅ Store is already up to date.")
+        return True
 
-# --- Report ---
-print("\n📊 Ingestion Report:")
-for book, count in book_chunk_report.items():
-    print(f"   - {book}: {count} chunks")
-print(f"   Total chunks: {len(all_text_chunks)}")
-print("-----------------------------------\n")
+    # --- Report ---
+    print("\n📊 Ingestion Report:")
+    for book in pdf_files:
+        print(f"   - {book}: {manifest.get(book, {}).get('chunks', 0)} chunks")
+    for book in removed:
+        print(f"   - {book}: removed")
 
-# --- Generate Embeddings ---
-print(f"⚙️ Loading model '{MODEL_NAME}'...")
-model = SentenceTransformer(MODEL_NAME)
+    keep_books = {f for f in pdf_files if manifest.get(f, {}).get("status") == "stored"}
+    total = splice_store(store, keep_books, pending, backend)
+    if not total:
+        print("❌ No valid text chunks could be created. Stopping.")
+        return False
 
-print("🔍 Generating embeddings (this may take a while)...")
-embeddings = model.encode(all_text_chunks, convert_to_tensor=True, show_progress_bar=True)
+    for book in removed:
+        manifest.pop(book, None)
+    for book in pending:
+        manifest[book]["status"] = "stored"
+        os.remove(part_path(book))
+    save_manifest(manifest)
 
-# --- Save Results ---
-torch.save(embeddings, EMBEDDINGS_FILE)
-print(f"💾 Embeddings saved to '{EMBEDDINGS_FILE}'")
+    print(f"   Total chunks: {total}")
+    print("\n✅ Ingestion complete! Your chatbot is ready.")
+    return True
 
-with open(CHUNKS_FILE, 'w', encoding='utf-8') as f:
-    json.dump(all_text_chunks, f)
-print(f"💾 Text chunks saved to '{CHUNKS_FILE}'")
+def main():
+    parser = argparse.ArgumentParser(description="Build the Krishi Mitra RAG store from a folder of PDFs.")
+    parser.add_argument("--source", default=PDF_SOURCE_FOLDER, help="Folder containing the PDF books")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the existing store and re-process every book")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="PDF extraction processes")
+    parser.add_argument("--backend", default=INDEX_BACKEND, help="Vector index backend (flat|ivf)")
+    args = parser.parse_args()
+    ok = run_ingestion(args.source, rebuild=args.rebuild, workers=args.workers, backend=args.backend)
+    raise SystemExit(0 if ok else 1)
 
-print("\n✅ Ingestion complete! Your chatbot is ready.")
+if __name__ == "__main__":
+    main()
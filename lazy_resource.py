@@ -0,0 +1,117 @@
+# lazy_resource.py - Heavy resources that load on first use or in a background warm-up
+import os
+import time
+import threading
+
+from cpu_executor import run_cpu_bound
+
+# --- Config ---
+# Comma-separated resources that gate /ready on this node, e.g. "" for a
+# weather/soil-only node or "query_encoder,faq_store" for Gemini-only /ask.
+# Unset: every resource's own `required` default applies.
+READY_REQUIRED = os.getenv("READY_REQUIRED")
+READY_REQUIRED = None if READY_REQUIRED is None else {n.strip() for n in READY_REQUIRED.split(",") if n.strip()}
+
+# Every LazyResource registers itself here so the API can report readiness
+RESOURCES = {}
+
+
+def has_value(value):
+    """Default availability check: None or an empty collection means nothing was loaded."""
+    if value is None:
+        return False
+    try:
+        return len(value) > 0
+    except TypeError:
+        return True
+
+
+class LazyResource:
+    """
+    Wraps an expensive loader (a model, an index, an API client). Nothing is
+    loaded at import time: the first `get()` -- or an explicit warm-up --
+    runs the loader once, and concurrent callers wait for that single load.
+    `available(value)` decides whether the loaded value is usable; it is
+    checked on every readiness probe, so a resource can become available
+    later (e.g. a model registry that picks up its first model).
+    """
+
+    def __init__(self, name, loader, required=True, available=has_value):
+        self.name = name
+        self.loader = loader
+        self.required = required if READY_REQUIRED is None else name in READY_REQUIRED
+        self.available = available
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.error = None
+        RESOURCES[name] = self
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                try:
+                    self._value = self.loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                self.error = None
+                self._loaded = True
+                print(f"✅ Loaded '{self.name}' in {self.load_seconds}s")
+        return self._value
+
+    async def get_async(self):
+        """Like get(), but a first-time load runs on the CPU pool instead of the event loop."""
+        if self._loaded:
+            return self._value
+        return await run_cpu_bound(self.get)
+
+    def is_available(self):
+        if not self._loaded:
+            return False
+        try:
+            return bool(self.available(self._value))
+        except Exception:
+            return False
+
+    def status(self):
+        return {
+            "loaded": self._loaded,
+            "available": self.is_available(),
+            "required": self.required,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+def warm_up(names=None):
+    """
+    Loads the given resources (default: all registered, or only the
+    READY_REQUIRED ones when set), logging failures instead of raising.
+    """
+    if names is None and READY_REQUIRED is not None:
+        names = [name for name in RESOURCES if name in READY_REQUIRED]
+    for name in list(RESOURCES) if names is None else names:
+        try:
+            RESOURCES[name].get()
+        except Exception as e:
+            print(f"⚠️ Warm-up of '{name}' failed: {e}")
+
+
+def readiness():
+    """(ready, per-resource status): ready once every required resource has loaded something usable."""
+    statuses = {name: resource.status() for name, resource in RESOURCES.items()}
+    # A READY_REQUIRED name that matches no resource is a typo; never report ready on it
+    for name in (READY_REQUIRED or set()) - set(RESOURCES):
+        statuses[name] = {"loaded": False, "available": False, "required": True, "error": "unknown resource"}
+    ready = all(s["loaded"] and s["available"] for s in statuses.values() if s["required"])
+    return ready, statuses
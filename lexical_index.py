@@ -0,0 +1,218 @@
+# lexical_index.py - BM25 inverted index over the RAG chunks, and rank fusion with dense search
+#
+# MiniLM embeddings blur exact tokens, and variety codes ("ADT 43", "CO 51")
+# and chemical names ("urea", "mancozeb") are where questions are most
+# specific. This index scores chunks with BM25 instead. Postings are stored
+# CSR-style with their BM25 weight precomputed (one float32 per posting),
+# so a query is one scatter-add per term. Like the embedding store, every
+# array is memory-mapped.
+#
+# Layout (next to the embedding store, named from the same prefix):
+#   <prefix>.bm25.terms.json    vocabulary, in term-id order
+#   <prefix>.bm25.offsets.npy   int64 offsets of each term's postings (n_terms + 1)
+#   <prefix>.bm25.docs.npy      int32 chunk ids, grouped by term
+#   <prefix>.bm25.weights.npy   float32 BM25 weight of each posting
+#   <prefix>.bm25.meta.json     chunk count, content hash of the chunks and BM25 parameters
+#
+# ingest_engine.py writes it with the store; for an existing store run:
+#   python lexical_index.py --chunks text_chunks.json
+import os
+import re
+import json
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from embedding_store import STORE_PREFIX, chunks_sha1
+
+# --- Config ---
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in more than this share of chunks only re-score chunks that rarer query
+# terms matched, instead of pulling in (nearly) every chunk as a candidate
+COMMON_TERM_FRACTION = 0.05
+# Reciprocal rank fusion constant: higher flattens the advantage of top ranks
+RRF_K = 60
+
+_TOKEN = re.compile(r'[a-z]+|\d+(?:\.\d+)?')
+# A short word directly followed by a number: "adt 43", "co-51", "co51"
+_CODE = re.compile(r'\b([a-z]{1,6})[\s\-]?(\d{1,4})\b')
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from has have how i in is it its
+    my of on or should that the their there this to was what when where which
+    who why will with you your
+""".split())
+# Units that precede numbers ("kg 50", "ha 2") without forming a code
+UNITS = frozenset("""
+    g gm kg mg q qtl t ton tons l lit ltr ml ha ac acre acres cm mm m km
+    ppm pct rs hr hrs min day days week weeks no nos
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercase word and number tokens without stopwords. Codes also yield
+    their joined form ("adt43"), so "ADT 43", "ADT-43" and "ADT43" match.
+    """
+    text = text.lower()
+    tokens = [t for t in _TOKEN.findall(text) if t not in STOPWORDS]
+    tokens += [word + number for word, number in _CODE.findall(text)
+               if word not in STOPWORDS and word not in UNITS]
+    return tokens
+
+
+def index_paths(prefix=STORE_PREFIX):
+    return {
+        "terms": f"{prefix}.bm25.terms.json",
+        "offsets": f"{prefix}.bm25.offsets.npy",
+        "docs": f"{prefix}.bm25.docs.npy",
+        "weights": f"{prefix}.bm25.weights.npy",
+        "meta": f"{prefix}.bm25.meta.json",
+    }
+
+
+def index_exists(prefix=STORE_PREFIX):
+    return os.path.exists(index_paths(prefix)["meta"])
+
+
+class LexicalIndex:
+    def __init__(self, terms, offsets, docs, weights, count, chunks_sha1=None):
+        self.terms = terms
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.count = count
+        # Content hash of the chunks it was built from (embedding_store.chunks_sha1)
+        self.chunks_sha1 = chunks_sha1
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def build(cls, chunks, k1=BM25_K1, b=BM25_B):
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, text in enumerate(chunks):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            counts = Counter(tokens)
+            term_ids.extend(vocab.setdefault(term, len(vocab)) for term in counts)
+            doc_ids.extend([doc_id] * len(counts))
+            tfs.extend(counts.values())
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        # Stable, so each term's postings stay in chunk order
+        order = np.argsort(term_ids, kind='stable')
+        term_ids = term_ids[order]
+        docs = np.array(doc_ids, dtype=np.int32)[order]
+        tf = np.array(tfs, dtype=np.float32)[order]
+
+        df = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+        n = len(chunks)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_length = float(lengths.mean()) if n and lengths.mean() > 0 else 1.0
+        length_norm = k1 * (1 - b + b * lengths[docs] / avg_length)
+        weights = (idf[term_ids] * tf * (k1 + 1) / (tf + length_norm)).astype(np.float32)
+        return cls(list(vocab), offsets, docs, weights, n, chunks_sha1(chunks))
+
+    def save(self, prefix=STORE_PREFIX):
+        paths = index_paths(prefix)
+        for key in ("offsets", "docs", "weights"):
+            with open(paths[key] + '.tmp', 'wb') as f:
+                np.save(f, getattr(self, key))
+            os.replace(paths[key] + '.tmp', paths[key])
+        with open(paths["terms"] + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.terms, f)
+        os.replace(paths["terms"] + '.tmp', paths["terms"])
+        meta = {"count": self.count, "chunks_sha1": self.chunks_sha1, "terms": len(self.terms),
+                "postings": int(len(self.docs)), "k1": BM25_K1, "b": BM25_B}
+        with open(paths["meta"] + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        # meta.json goes last: readers only trust an index once it exists
+        os.replace(paths["meta"] + '.tmp', paths["meta"])
+
+    @classmethod
+    def open(cls, prefix=STORE_PREFIX):
+        paths = index_paths(prefix)
+        with open(paths["meta"], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(paths["terms"], 'r', encoding='utf-8') as f:
+            terms = json.load(f)
+        offsets = np.load(paths["offsets"], mmap_mode='r')
+        docs = np.load(paths["docs"], mmap_mode='r')
+        weights = np.load(paths["weights"], mmap_mode='r')
+        if not (len(terms) + 1 == len(offsets) and len(docs) == len(weights) == offsets[-1]):
+            raise ValueError(f"Lexical index '{prefix}' is inconsistent. Rebuild it.")
+        return cls(terms, offsets, docs, weights, meta["count"], meta.get("chunks_sha1"))
+
+    def _postings(self, term_id):
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        return self.docs[start:end], self.weights[start:end]
+
+    def search(self, query, top_k=5):
+        """
+        (scores, chunk ids) of the best BM25 matches, best first; chunks
+        sharing no term are skipped. Very common terms (see
+        COMMON_TERM_FRACTION) add their weight to the chunks the other terms
+        matched but bring in no candidates of their own, which keeps queries
+        with everyday words in the low milliseconds.
+        """
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or not self.count:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        common_df = max(1, int(COMMON_TERM_FRACTION * self.count))
+        rare = [t for t in term_ids if self.offsets[t + 1] - self.offsets[t] <= common_df]
+        common = [t for t in term_ids if t not in rare]
+        if not rare:
+            # Only everyday words: score them all over the whole corpus
+            rare, common = common, []
+
+        # Each term's postings hold a chunk at most once, so a scatter-add is exact
+        scores = np.zeros(self.count, dtype=np.float32)
+        for t in rare:
+            term_docs, term_weights = self._postings(t)
+            scores[term_docs] += term_weights
+        candidates = np.flatnonzero(scores)
+        for t in common:
+            term_docs, term_weights = self._postings(t)
+            scores[term_docs] += term_weights
+        scores = scores[candidates]
+
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return scores[best], candidates[best]
+
+
+def reciprocal_rank_fusion(rankings, top_k=5, k=RRF_K):
+    """
+    Merges best-first lists of chunk ids: each id scores the sum of
+    1 / (k + rank) over the lists it appears in. Ties keep first-seen order.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the BM25 index for an existing chunk list.")
+    parser.add_argument("--chunks", default='text_chunks.json')
+    parser.add_argument("--prefix", default=STORE_PREFIX)
+    args = parser.parse_args()
+
+    with open(args.chunks, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    index = LexicalIndex.build(chunks)
+    index.save(args.prefix)
+    print(f"💾 Wrote a BM25 index of {len(index.terms)} terms over {len(chunks)} chunks to '{args.prefix}.bm25.*'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# load_test.py - Concurrent load generator for the KrishiMitra API
+#
+# Start the API version you want to measure, then point the harness at it.
+# Pass several --target label=url pairs to compare builds side by side, e.g.
+#   python load_test.py --endpoint ask --target before=http://localhost:8000 \
+#                                      --target after=http://localhost:8001
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+PAYLOADS = {
+    "ping": ("GET", "/ping", None),
+    "ask": ("POST", "/ask", {"question": "What are some high-yielding rice varieties?"}),
+    "weather": ("POST", "/weather", {"town": "Coimbatore"}),
+    "predict": ("POST", "/predict", {
+        "State": "Tamil Nadu", "Town": "Coimbatore", "Soil_Type": "Loam", "Crop": "Rice",
+        "Temperature_Celsius": 28.0, "Fertilizer_Used": True, "Irrigation_Used": True,
+        "Weather_Condition": "Sunny", "Days_to_Harvest": 120,
+    }),
+}
+
+
+async def run_load(base_url, endpoint, total_requests, concurrency, timeout):
+    """Fires `total_requests` calls with at most `concurrency` in flight."""
+    method, path, body = PAYLOADS[endpoint]
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one_call():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_call() for _ in range(total_requests)))
+        elapsed = time.perf_counter() - started
+
+    lat = np.array(latencies)
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "rps": total_requests / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p99_ms": float(np.percentile(lat, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure p50/p99 latency and throughput of the API.")
+    parser.add_argument("--target", action="append", default=None,
+                        help="label=base_url (repeatable). Default: now=http://localhost:8000")
+    parser.add_argument("--endpoint", choices=sorted(PAYLOADS), default="ping")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    targets = [t.split("=", 1) for t in (args.target or ["now=http://localhost:8000"])]
+
+    print(f"\n🚜 Load test: {args.requests} x /{args.endpoint} at concurrency {args.concurrency}")
+    print(f"   {'target':<12}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for label, url in targets:
+        result = asyncio.run(run_load(url, args.endpoint, args.requests, args.concurrency, args.timeout))
+        print(f"   {label:<12}{result['rps']:>10.1f}{result['p50_ms']:>10.1f}"
+              f"{result['p99_ms']:>10.1f}{result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# local_llm.py - Long-lived Ollama client with bounded concurrency and a circuit breaker
+#
+# The Ollama server keeps the model loaded between requests (keep_alive), so
+# nothing here ever stops the server. When the local model is slow, busy or
+# down, calls raise LocalLLMUnavailable quickly and the caller falls back to
+# Gemini; after repeated failures the breaker skips the local model entirely
+# for a cool-down period.
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+try:
+    from ollama import Client, AsyncClient
+except ImportError:
+    Client = AsyncClient = None
+    print("⚠️ Ollama client not installed. Local LLM may not work.")
+
+# --- Config ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")  # None = the Ollama client's default (localhost:11434)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+LOCAL_LLM_MAX_CONCURRENCY = int(os.getenv("LOCAL_LLM_MAX_CONCURRENCY", "2"))
+LOCAL_LLM_TIMEOUT_SECONDS = float(os.getenv("LOCAL_LLM_TIMEOUT_SECONDS", "60"))
+# How long a request may wait for a free generation slot before using Gemini instead
+LOCAL_LLM_QUEUE_SECONDS = float(os.getenv("LOCAL_LLM_QUEUE_SECONDS", "2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LOCAL_LLM_BREAKER_FAILURES", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("LOCAL_LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+class LocalLLMUnavailable(Exception):
+    """The local model cannot serve this request; use the fallback."""
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls go through; `failure_threshold` consecutive failures open it
+    open      -> calls are rejected until `reset_seconds` have passed
+    half-open -> one trial call; success closes the breaker, failure re-opens it
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """Gives back a half-open trial that ended without a verdict (e.g. a cancelled stream)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class GenerationSlots:
+    """
+    A counting semaphore shared by threads and event loops. A released slot
+    is handed straight to the longest waiter: a thread is woken through its
+    Event, a coroutine through its Future on its own loop, so neither side
+    ever polls.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._in_use = 0
+        self._waiters = deque()   # threading.Event or (loop, Future)
+        self._lock = threading.Lock()
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def _try_acquire_locked(self):
+        if self._in_use < self.size and not self._waiters:
+            self._in_use += 1
+            return True
+        return False
+
+    def _withdraw(self, waiter):
+        """True if `waiter` was still queued; False means a slot was already handed to it."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return True
+            except ValueError:
+                return False
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            if self._try_acquire_locked():
+                return True
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        if waiter.wait(timeout):
+            return True
+        return not self._withdraw(waiter)
+
+    async def acquire_async(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire_locked():
+                return True
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            # shield: a timeout cancels the wait, never the hand-off future itself
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return not self._withdraw(waiter)
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._in_use -= 1
+                return
+            # The slot passes to the next waiter without ever being free
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(_hand_off, future)
+
+
+def _hand_off(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LocalLLM:
+    """One persistent sync and async Ollama client per process, shared by every request."""
+
+    def __init__(self, model, host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE,
+                 max_concurrency=LOCAL_LLM_MAX_CONCURRENCY, timeout=LOCAL_LLM_TIMEOUT_SECONDS,
+                 queue_seconds=LOCAL_LLM_QUEUE_SECONDS, breaker=None):
+        if Client is None:
+            raise RuntimeError("Ollama client not installed.")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.queue_seconds = queue_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self._client = Client(host=host, timeout=timeout)
+        self._async_client = AsyncClient(host=host, timeout=timeout)
+        # One limit for sync and async callers alike
+        self._slots = GenerationSlots(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._counters = {"calls": 0, "failures": 0, "rejected_busy": 0, "rejected_open": 0}
+
+    # --- Admission: a bounded generation slot, then the breaker ---
+    def _reject_open(self):
+        self._counters["rejected_open"] += 1
+        raise LocalLLMUnavailable("circuit breaker open")
+
+    def _reject_busy(self):
+        self._counters["rejected_busy"] += 1
+        raise LocalLLMUnavailable(f"all {self.max_concurrency} local generation slots busy")
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._slots.release()
+            self._reject_open()
+
+    def _acquire(self):
+        if self.breaker.state == "open":
+            self._reject_open()
+        if not self._slots.acquire(timeout=self.queue_seconds):
+            self._reject_busy()
+        self._admit()
+
+    async def _acquire_async(self):
+        if self.breaker.state == "open":
+            self._reject_open()
+        if not await self._slots.acquire_async(timeout=self.queue_seconds):
+            self._reject_busy()
+        self._admit()
+
+    def _failed(self, e):
+        self._counters["failures"] += 1
+        self.breaker.record_failure()
+        raise LocalLLMUnavailable(str(e)) from e
+
+    # --- Generation ---
+    def warm(self):
+        """Loads the model into the Ollama server's memory without generating anything."""
+        self._client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+
+    def chat(self, messages):
+        self._acquire()
+        try:
+            self._counters["calls"] += 1
+            response = self._client.chat(model=self.model, messages=messages, keep_alive=self.keep_alive)
+        except Exception as e:
+            self._failed(e)
+        finally:
+            self._slots.release()
+        self.breaker.record_success()
+        return response['message']['content']
+
+    async def chat_async(self, messages):
+        await self._acquire_async()
+        try:
+            self._counters["calls"] += 1
+            response = await asyncio.wait_for(
+                self._async_client.chat(model=self.model, messages=messages, keep_alive=self.keep_alive),
+                timeout=self.timeout,
+            )
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self._failed(e)
+        finally:
+            self._slots.release()
+        self.breaker.record_success()
+        return response['message']['content']
+
+    async def stream_async(self, messages):
+        """Yields tokens as they are generated. Failures raise LocalLLMUnavailable."""
+        await self._acquire_async()
+        finished = False
+        try:
+            self._counters["calls"] += 1
+            try:
+                stream = await self._async_client.chat(model=self.model, messages=messages,
+                                                       keep_alive=self.keep_alive, stream=True)
+                async for part in stream:
+                    token = part['message']['content']
+                    if token:
+                        yield token
+            except Exception as e:
+                finished = True
+                self._failed(e)
+            finished = True
+        finally:
+            self._slots.release()
+            if not finished:
+                # The consumer stopped reading; that says nothing about the model's health
+                self.breaker.release()
+        self.breaker.record_success()
+
+    def stats(self):
+        return {**self._counters, "model": self.model, "breaker": self.breaker.state,
+                "max_concurrency": self.max_concurrency, "slots_in_use": self._slots.in_use}
@@ -1,18 +1,48 @@
+from contextlib import asynccontextmanager
+import asyncio
+import threading
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Any, Dict, List
 from fastapi.middleware.cors import CORSMiddleware  # <-- IMPORT THE CORS MIDDLEWARE
 import os
+import json
+import sqlite3
 
 # Import your custom logic
-from predict_hackathon import predict_yield
-from query_engine import run_query_engine
-from data_fetcher import fetch_weather_by_town, fetch_weather_forecast_by_town
+from predict_hackathon import predict_yield, predict_yield_batch, model_registry
+from query_engine import run_query_engine_async, stream_query_engine_async, get_query_stats
+from data_fetcher import (
+    fetch_weather_by_town_async, fetch_weather_forecast_by_town_async, close_async_client,
+    get_weather_stats
+)
+from cpu_executor import run_cpu_bound
+from lazy_resource import LazyResource, warm_up, readiness
+from soil_cache import SoilCache
+from scenarios import ScenarioError, grid_axes, expand_grid, scenario_key, response_surface, scenario_cache
 
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI(title="KrishiMitra AI Backend")
+# "background": load models in a startup thread while /ping and /live already answer.
+# "lazy": load each model only when the first request needs it.
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")
+# Upper bound on /predict/batch records: each distinct town costs a weather fetch
+PREDICT_BATCH_MAX_RECORDS = int(os.getenv("PREDICT_BATCH_MAX_RECORDS", "500"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_MODE == "background":
+        threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
+    yield
+    # Stop the model directory watcher and release pooled upstream connections
+    if model_registry.is_loaded:
+        model_registry.get().stop()
+    await close_async_client()
+
+app = FastAPI(title="KrishiMitra AI Backend", lifespan=lifespan)
 
 # --- ENABLE CORS ---
 # This is the crucial part that allows your frontend to communicate with this backend.
@@ -47,6 +77,40 @@ def get_region_from_state(state_name: str):
     clean_state = state_name.strip().lower()
     return STATE_TO_REGION.get(clean_state)
 
+# --- Soil Lookup ---
+# Read-only use of the cache that enrich_dataset.py fills; never calls SoilGrids
+soil_cache = LazyResource("soil_cache", SoilCache, required=False)
+
+def lookup_soil(weather_data: dict, cache=None):
+    """Cached soil properties nearest to the weather location, or None."""
+    coordinates = weather_data.get("coordinates")
+    if not coordinates:
+        return None
+    cache = soil_cache.get() if cache is None else cache
+    return cache.nearest(coordinates["lat"], coordinates["lon"])
+
+_last_soil_error = None
+
+def _log_soil_error(e):
+    # Once per distinct error: a broken cache would otherwise log on every request
+    global _last_soil_error
+    if str(e) != _last_soil_error:
+        _last_soil_error = str(e)
+        print(f"⚠️ Soil cache unavailable ({e}); serving without soil properties.")
+
+async def lookup_soil_async(weather_data: dict):
+    """
+    Like lookup_soil, off the event loop (the first call opens or creates the
+    SQLite cache). Soil is optional: a cache that cannot be opened or read
+    (read-only directory, locked or corrupt file) gives None, never an error.
+    """
+    try:
+        cache = await soil_cache.get_async()
+        return await run_cpu_bound(lookup_soil, weather_data, cache)
+    except (sqlite3.Error, OSError) as e:
+        _log_soil_error(e)
+        return None
+
 # --- API Endpoints ---
 
 # 1. Yield Predictor
@@ -62,9 +126,9 @@ class PredictRequest(BaseModel):
     Days_to_Harvest: int
 
 @app.post("/predict")
-def predict(req: PredictRequest):
+async def predict(req: PredictRequest):
     try:
-        weather_data = fetch_weather_by_town(req.Town)
+        weather_data = await fetch_weather_by_town_async(req.Town)
         live_rainfall = weather_data.get("current_conditions", {}).get("rainfall_last_hour_mm", 0.0)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Could not fetch weather for town '{req.Town}'. Error: {e}")
@@ -73,40 +137,226 @@ def predict(req: PredictRequest):
     if not region:
         raise HTTPException(status_code=400, detail=f"State '{req.State}' not found.")
 
+    soil = await lookup_soil_async(weather_data)
+    model_input_data = build_model_input(req, region, live_rainfall, soil)
+
+    result = await run_cpu_bound(predict_yield, model_input_data)
+    result['live_rainfall_used_mm'] = live_rainfall
+    result['soil_properties'] = soil
+    return result
+
+def build_model_input(req: PredictRequest, region: str, live_rainfall: float, soil: dict = None):
     model_input_data = req.dict()
     model_input_data['Region'] = region
     model_input_data['Rainfall_mm'] = live_rainfall
     del model_input_data['State']
     del model_input_data['Town']
+    if soil:
+        model_input_data.update({k: v for k, v in soil.items() if k != 'distance_km'})
+    return model_input_data
 
-    result = predict_yield(model_input_data)
-    result['live_rainfall_used_mm'] = live_rainfall
-    return result
+# 1b. Batch Yield Predictor
+class PredictBatchRequest(BaseModel):
+    records: List[PredictRequest]
+
+@app.post("/predict/batch")
+async def predict_batch(req: PredictBatchRequest):
+    if len(req.records) > PREDICT_BATCH_MAX_RECORDS:
+        raise HTTPException(status_code=400,
+                            detail=f"A batch may hold at most {PREDICT_BATCH_MAX_RECORDS} records; got {len(req.records)}.")
+    # Weather is resolved once per distinct town, all towns in parallel
+    towns = list({record.Town.strip().lower(): record.Town for record in req.records}.items())
+    weather_results = await asyncio.gather(
+        *(fetch_weather_by_town_async(town) for _, town in towns), return_exceptions=True
+    )
+    rainfall_by_town = dict(zip([key for key, _ in towns], weather_results))
+    resolved = [(key, weather_data) for key, weather_data in rainfall_by_town.items()
+                if not isinstance(weather_data, Exception)]
+    soils = await asyncio.gather(*(lookup_soil_async(weather_data) for _, weather_data in resolved))
+    soil_by_town = dict(zip([key for key, _ in resolved], soils))
+
+    results = [None] * len(req.records)
+    rows, row_positions, row_rainfall, row_soil = [], [], [], []
+    for i, record in enumerate(req.records):
+        weather_data = rainfall_by_town[record.Town.strip().lower()]
+        if isinstance(weather_data, Exception):
+            results[i] = {"error": f"Could not fetch weather for town '{record.Town}'. Error: {weather_data}"}
+            continue
+        region = get_region_from_state(record.State)
+        if not region:
+            results[i] = {"error": f"State '{record.State}' not found."}
+            continue
+        live_rainfall = weather_data.get("current_conditions", {}).get("rainfall_last_hour_mm", 0.0)
+        soil = soil_by_town[record.Town.strip().lower()]
+        rows.append(build_model_input(record, region, live_rainfall, soil))
+        row_positions.append(i)
+        row_rainfall.append(live_rainfall)
+        row_soil.append(soil)
+
+    # One vectorized model call for every valid row
+    predictions = await run_cpu_bound(predict_yield_batch, rows)
+    for position, live_rainfall, soil, result in zip(row_positions, row_rainfall, row_soil, predictions):
+        if "error" not in result:
+            result['live_rainfall_used_mm'] = live_rainfall
+            result['soil_properties'] = soil
+        results[position] = result
+
+    return {"results": results}
+
+# 1c. What-if Scenarios: one base input and a grid of varied fields, answered with
+# one weather fetch and one batch model call. Cached by base input + grid + model version.
+class ScenarioRequest(BaseModel):
+    base: PredictRequest
+    # {field: [values]}, or for numeric fields {field: {"start": .., "stop": .., "step": ..}}
+    vary: Dict[str, Any]
+
+@app.post("/predict/scenarios")
+async def predict_scenarios(req: ScenarioRequest):
+    try:
+        axes = grid_axes(req.vary)
+    except ScenarioError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    region = get_region_from_state(req.base.State)
+    if not region:
+        raise HTTPException(status_code=400, detail=f"State '{req.base.State}' not found.")
+
+    registry = await model_registry.get_async()
+    base_request = {**req.base.dict(), "State": req.base.State.strip().lower(), "Town": req.base.Town.strip().lower()}
+    key = scenario_key(base_request, axes, registry.active.name if registry.active else None)
+    cached = scenario_cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    try:
+        weather_data = await fetch_weather_by_town_async(req.base.Town)
+        live_rainfall = weather_data.get("current_conditions", {}).get("rainfall_last_hour_mm", 0.0)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not fetch weather for town '{req.base.Town}'. Error: {e}")
+    soil = await lookup_soil_async(weather_data)
+    base_row = build_model_input(req.base, region, live_rainfall, soil)
+
+    # Every scenario in one vectorized model call
+    results = await run_cpu_bound(predict_yield_batch, expand_grid(base_row, axes))
+    response = {
+        "input_features": {k: v for k, v in base_row.items() if k not in axes},
+        **response_surface(axes, results),
+        "model_version": next((r["model_version"] for r in results if "model_version" in r), None),
+        "live_rainfall_used_mm": live_rainfall,
+        "soil_properties": soil,
+    }
+    if response["best"] is not None:
+        scenario_cache.set(key, response)
+    return {**response, "cached": False}
+
+# 1d. Model Registry: loaded versions, per-version latency histograms and shadow comparisons
+@app.get("/models")
+async def models():
+    registry = await model_registry.get_async()
+    return registry.stats()
+
+# Makes a version live at once: the shadow candidate, or an older one to roll back
+@app.post("/models/{version}/promote")
+async def promote_model(version: str):
+    registry = await model_registry.get_async()
+    try:
+        await run_cpu_bound(registry.promote, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return registry.stats()
+
+# Scores a version on `percent`% of /predict traffic without serving its answers
+@app.post("/models/{version}/shadow")
+async def shadow_model(version: str, percent: float = None):
+    if percent is not None and not 0 <= percent <= 100:
+        raise HTTPException(status_code=400, detail="percent must be between 0 and 100.")
+    registry = await model_registry.get_async()
+    try:
+        await run_cpu_bound(registry.set_candidate, version, percent)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return registry.stats()
+
+@app.delete("/models/shadow")
+async def stop_shadow():
+    registry = await model_registry.get_async()
+    registry.set_candidate(None)
+    return registry.stats()
 
 # 2. AI Q&A Bot
 class QueryRequest(BaseModel):
     question: str
 
 @app.post("/ask")
-def ask(req: QueryRequest):
-    answer = run_query_engine(req.question)
+async def ask(req: QueryRequest):
+    answer = await run_query_engine_async(req.question)
     return {"answer": answer}
 
+# 2b. Streaming Q&A: tokens are forwarded as the LLM produces them.
+# format=ndjson (default) sends one JSON event per line; format=sse sends Server-Sent Events.
+@app.post("/ask/stream")
+async def ask_stream(req: QueryRequest, format: str = "ndjson"):
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
+
+    async def events():
+        async for event in stream_query_engine_async(req.question):
+            payload = json.dumps(event, ensure_ascii=False)
+            yield f"data: {payload}\n\n" if format == "sse" else payload + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    # no-transform stops proxies from buffering the stream
+    return StreamingResponse(events(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
 # 3. Weather Dashboard
 class TownRequest(BaseModel):
     town: str
 
 @app.post("/weather")
-def weather(req: TownRequest):
+async def weather(req: TownRequest):
     try:
-        current = fetch_weather_by_town(req.town)
-        forecast = fetch_weather_forecast_by_town(req.town)
+        current, forecast = await asyncio.gather(
+            fetch_weather_by_town_async(req.town),
+            fetch_weather_forecast_by_town_async(req.town),
+        )
         return {"current": current, "forecast": forecast}
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+# 3b. Soil Properties (from the local cache, no network call)
+@app.get("/soil")
+async def soil(lat: float, lon: float):
+    try:
+        cache = await soil_cache.get_async()
+        result = await run_cpu_bound(cache.nearest, lat, lon)
+    except (sqlite3.Error, OSError) as e:
+        _log_soil_error(e)
+        raise HTTPException(status_code=503, detail=f"Soil cache unavailable: {e}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No cached soil data near ({lat}, {lon}).")
+    return {"lat": lat, "lon": lon, "soil_properties": result}
+
 # 4. Health Check
 @app.get("/ping")
-def ping():
+async def ping():
+    return {"status": "ok"}
+
+# Liveness: the process is up and serving (never waits for models)
+@app.get("/live")
+async def live():
     return {"status": "ok"}
 
+# Readiness: every required model and index has finished loading
+@app.get("/ready")
+async def ready():
+    is_ready, resources = readiness()
+    return JSONResponse(status_code=200 if is_ready else 503,
+                        content={"ready": is_ready, "resources": resources})
+
+# 5. Runtime Metrics
+@app.get("/metrics")
+async def metrics():
+    models = model_registry.get().stats() if model_registry.is_loaded else {"loaded": False}
+    return {"query": get_query_stats(), "weather": get_weather_stats(), "models": models,
+            "scenario_cache": scenario_cache.stats()}
+
@@ -0,0 +1,371 @@
+# model_registry.py - Versioned yield models with background hot-swap and shadow scoring
+#
+# The registry polls MODEL_DIR for the yield_model-<version>.pkl files that
+# train_yield_model.py exports. A new version is loaded off the request
+# path and then made active with a single reference swap: a request that
+# already picked up the old version finishes on it, the next one gets the
+# new version, and nothing is dropped or restarted.
+#
+# A candidate version can be shadow-scored on a sample of live traffic. It
+# runs on its own thread after the active version has answered, and only
+# its latency and its disagreement with the active version are recorded;
+# callers never see its predictions.
+import os
+import glob
+import time
+import bisect
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- Config ---
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+# Served when no versioned model has been exported yet
+LEGACY_MODEL_FILE = "hackathon_yield_model.pkl"
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_POLL_SECONDS", "10"))
+# "auto": a newly exported version goes live as soon as it has loaded.
+# "shadow": it becomes the candidate and goes live only when promoted.
+MODEL_ROLLOUT = os.getenv("MODEL_ROLLOUT", "auto")
+SHADOW_PERCENT = float(os.getenv("SHADOW_PERCENT", "10"))
+# Shadow requests waiting beyond this are skipped rather than queued
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "64"))
+# Loaded versions kept in memory for instant rollback (active and candidate always are)
+MODEL_VERSIONS_KEPT = int(os.getenv("MODEL_VERSIONS_KEPT", "3"))
+# Requests of up to this many rows are scored by the compiled NumPy model
+# (compiled_model.py) when one exists; past it sklearn's Cython tree walk
+# wins (see benchmark_compiled_model.py)
+COMPILED_MODEL_ENABLED = os.getenv("COMPILED_MODEL_ENABLED", "1") == "1"
+COMPILED_MAX_BATCH_ROWS = int(os.getenv("COMPILED_MAX_BATCH_ROWS", "256"))
+LATENCY_BUCKETS_MS = (0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def model_frame(pipeline, input_rows):
+    """
+    One DataFrame for the pipeline. When it records the columns it was fitted
+    on, the frame is aligned to them: extra inputs (e.g. soil properties for
+    a model trained without them) are dropped and missing ones become NaN.
+    """
+    import pandas as pd
+    input_df = pd.DataFrame(input_rows)
+    features = getattr(pipeline, 'feature_names_in_', None)
+    if features is not None:
+        input_df = input_df.reindex(columns=list(features))
+    return input_df
+
+
+def version_name(path):
+    """models/yield_model-20261018-191257.pkl -> '20261018-191257'."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem[len("yield_model-"):] if stem.startswith("yield_model-") else stem
+
+
+class LatencyHistogram:
+    """Cumulative fixed-bucket histogram of latencies in milliseconds."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        bucket = bisect.bisect_left(self.bounds, ms)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total_ms += ms
+
+    def quantile(self, q, counts=None, count=None):
+        """
+        Upper bound of the bucket holding the q-quantile; None if it is past
+        the last bound. Computed from `counts`/`count` when given (a copy
+        taken under the lock), else from a fresh copy.
+        """
+        if counts is None:
+            with self._lock:
+                counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        seen, target = 0, q * count
+        for bound, bucket_count in zip(self.bounds, counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.total_ms
+        labels = [f"le_{bound}" for bound in self.bounds] + ["inf"]
+        return {
+            "count": count,
+            "mean_ms": round(total / count, 3) if count else None,
+            "p50_ms": self.quantile(0.5, counts, count),
+            "p95_ms": self.quantile(0.95, counts, count),
+            "p99_ms": self.quantile(0.99, counts, count),
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class ModelVersion:
+    """One loaded model: the sklearn pipeline plus, when exported, its compiled form."""
+
+    def __init__(self, name, path, pipeline, compiled=None):
+        self.name = name
+        self.path = path
+        self.pipeline = pipeline
+        self.compiled = compiled
+        self.loaded_at = time.time()
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.shadow = {"requests": 0, "rows": 0, "abs_diff_sum": 0.0, "max_abs_diff": 0.0, "errors": 0}
+        # Guards errors and shadow: request threads and the shadow thread update them
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        import joblib
+        pipeline = joblib.load(path)
+        compiled = None
+        if COMPILED_MODEL_ENABLED:
+            from compiled_model import load_for
+            try:
+                compiled = load_for(path)
+            except Exception as e:
+                print(f"⚠️ Could not load the compiled model for '{path}': {e}")
+        return cls(version_name(path), path, pipeline, compiled)
+
+    def predict(self, rows):
+        """Predictions for a list of feature dicts; every call lands in the latency histogram."""
+        started = time.perf_counter()
+        try:
+            return self._predict(rows)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            self.latency.observe((time.perf_counter() - started) * 1000)
+
+    def _predict(self, rows):
+        if self.compiled is not None and len(rows) <= COMPILED_MAX_BATCH_ROWS:
+            try:
+                return self.compiled.predict(rows)
+            except Exception:
+                pass  # e.g. an unscorable value: the pipeline reports it in its own words
+        return self.pipeline.predict(model_frame(self.pipeline, rows))
+
+    def record_shadow(self, diff):
+        """Adds one shadow comparison (|candidate - served| per row)."""
+        with self._lock:
+            self.shadow["requests"] += 1
+            self.shadow["rows"] += len(diff)
+            self.shadow["abs_diff_sum"] += float(diff.sum())
+            self.shadow["max_abs_diff"] = max(self.shadow["max_abs_diff"], float(diff.max()))
+
+    def record_shadow_error(self):
+        with self._lock:
+            self.shadow["errors"] += 1
+
+    def stats(self):
+        with self._lock:
+            shadow = dict(self.shadow)
+            errors = self.errors
+        diff_sum = shadow.pop("abs_diff_sum")
+        shadow["mean_abs_diff"] = round(diff_sum / shadow["rows"], 4) if shadow["rows"] else None
+        return {
+            "path": self.path,
+            "compiled": self.compiled is not None,
+            "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.loaded_at)),
+            "errors": errors,
+            "latency": self.latency.snapshot(),
+            "shadow": shadow,
+        }
+
+
+class ModelRegistry:
+    """Loaded model versions, the active one, and an optional shadow candidate."""
+
+    def __init__(self, model_dir=MODEL_DIR, rollout=MODEL_ROLLOUT, shadow_percent=SHADOW_PERCENT,
+                 keep=MODEL_VERSIONS_KEPT):
+        self.model_dir = model_dir
+        self.rollout = rollout
+        self.shadow_percent = shadow_percent
+        self.keep = keep
+        self.versions = OrderedDict()  # name -> ModelVersion, in load order
+        self.active = None
+        self.candidate = None
+        self._lock = threading.Lock()       # guards versions / active / candidate
+        self._load_lock = threading.Lock()  # one model load at a time
+        self._failed = {}                   # path -> mtime of a file that failed to load
+        self._stop = threading.Event()
+        self._watcher = None
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-shadow")
+        self._shadow_pending = 0
+
+    # --- Versions ---
+
+    def available(self):
+        """Exported (name, path) pairs, oldest first; the legacy file if nothing was exported."""
+        # Versions are UTC timestamps, so name order is age order
+        paths = sorted(glob.glob(os.path.join(self.model_dir, "yield_model-*.pkl")))
+        if not paths and os.path.exists(LEGACY_MODEL_FILE):
+            paths = [LEGACY_MODEL_FILE]
+        return [(version_name(path), path) for path in paths]
+
+    def _load(self, name, path):
+        with self._load_lock:
+            if name in self.versions:
+                return self.versions[name]
+            started = time.perf_counter()
+            version = ModelVersion.load(path)
+            with self._lock:
+                self.versions[name] = version
+            print(f"✅ Yield model version '{name}' loaded in {time.perf_counter() - started:.2f}s"
+                  f"{' (compiled)' if version.compiled is not None else ''}.")
+            return version
+
+    def _version(self, name):
+        """A loaded version, loading an exported one on demand. KeyError if there is none."""
+        version = self.versions.get(name)
+        if version is not None:
+            return version
+        paths = dict(self.available())
+        if name not in paths:
+            raise KeyError(f"No model version '{name}' in '{self.model_dir}'.")
+        return self._load(name, paths[name])
+
+    def _evict(self):
+        # Oldest first, never the active version or the candidate
+        with self._lock:
+            spare = [name for name, v in self.versions.items() if v is not self.active and v is not self.candidate]
+            for name in spare[:max(len(self.versions) - self.keep, 0)]:
+                del self.versions[name]
+
+    def refresh(self):
+        """
+        Loads the newest exported version if it is new, and makes it active
+        (rollout "auto", or nothing is active yet) or the shadow candidate.
+        Returns its name, or None when there was nothing new.
+        """
+        available = self.available()
+        if not available:
+            return None
+        name, path = available[-1]
+        if name in self.versions:
+            return None
+        mtime = os.path.getmtime(path)
+        if self._failed.get(path) == mtime:
+            return None
+        try:
+            version = self._load(name, path)
+        except Exception as e:
+            self._failed[path] = mtime
+            print(f"⚠️ Could not load model version '{name}' from '{path}': {e}")
+            return None
+        with self._lock:
+            if self.active is None or self.rollout == "auto":
+                previous, self.active = self.active, version
+                if previous is not None:
+                    print(f"🔁 Yield model version '{name}' is now active (was '{previous.name}').")
+            else:
+                self.candidate = version
+                print(f"🕶️ Yield model version '{name}' is shadowing {self.shadow_percent:g}% of traffic.")
+        self._evict()
+        return name
+
+    def promote(self, name):
+        """Makes a version active, e.g. the shadow candidate or an older one to roll back."""
+        version = self._version(name)
+        with self._lock:
+            previous, self.active = self.active, version
+            if self.candidate is version:
+                self.candidate = None
+        print(f"🔁 Yield model version '{name}' promoted (was '{previous.name if previous else None}').")
+        self._evict()
+        return version
+
+    def set_candidate(self, name, percent=None):
+        """Shadow-scores a version on `percent`% of traffic; name None stops shadowing."""
+        version = self._version(name) if name is not None else None
+        with self._lock:
+            self.candidate = version
+            if percent is not None:
+                self.shadow_percent = percent
+        self._evict()
+        return version
+
+    # --- Background Watcher ---
+
+    def start(self, poll_seconds=MODEL_POLL_SECONDS):
+        if self._watcher is None and poll_seconds > 0:
+            self._watcher = threading.Thread(target=self._watch, args=(poll_seconds,),
+                                             name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self, poll_seconds):
+        while not self._stop.wait(poll_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Model directory scan failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._shadow_pool.shutdown(wait=False)
+
+    # --- Scoring ---
+
+    def predict(self, rows):
+        """(predictions, version name) from the active version; may shadow-score the candidate."""
+        # One read of each reference: a concurrent swap cannot split a request across versions
+        version, candidate = self.active, self.candidate
+        if version is None:
+            raise RuntimeError("No yield model is loaded.")
+        predictions = version.predict(rows)
+        if (candidate is not None and candidate is not version
+                and random.random() * 100 < self.shadow_percent):
+            self._submit_shadow(candidate, rows, predictions)
+        return predictions, version.name
+
+    def _submit_shadow(self, candidate, rows, served):
+        # Shadow scoring is best effort: it must never fail the request being served
+        if self._stop.is_set():
+            return
+        with self._lock:
+            if self._shadow_pending >= SHADOW_MAX_PENDING:
+                return
+            self._shadow_pending += 1
+        try:
+            self._shadow_pool.submit(self._shadow_score, candidate, rows, served)
+        except RuntimeError:
+            # stop() shut the pool down between the check and the submit
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def _shadow_score(self, candidate, rows, served):
+        try:
+            diff = np.abs(np.asarray(candidate.predict(rows), dtype=float) - np.asarray(served, dtype=float))
+            candidate.record_shadow(diff)
+        except Exception:
+            candidate.record_shadow_error()
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def stats(self):
+        with self._lock:
+            versions = list(self.versions.values())
+            active, candidate = self.active, self.candidate
+        return {
+            "model_dir": self.model_dir,
+            "rollout": self.rollout,
+            "active": active.name if active else None,
+            "candidate": candidate.name if candidate else None,
+            "shadow_percent": self.shadow_percent,
+            "versions": {v.name: v.stats() for v in versions},
+        }
@@ -1,38 +1,64 @@
-import joblib
-import pandas as pd
-
-# Load the trained model pipeline from the file.
-# This happens once when the server starts.
-MODEL_FILE = "hackathon_yield_model.pkl"
-try:
-    model_pipeline = joblib.load(MODEL_FILE)
-    print("✅ Hackathon prediction model loaded successfully.")
-except FileNotFoundError:
-    print(f"❌ ERROR: Model file not found at '{MODEL_FILE}'. Please run train_hackathon_model.py first.")
-    model_pipeline = None
+from lazy_resource import LazyResource
+
+# The model registry is created on first use (or by the API's startup
+# warm-up), not at import time. It loads the newest exported model version
+# and keeps watching the model directory for newer ones
+# (see model_registry.py); joblib/pandas/sklearn are imported with it.
+def _load_model_registry():
+    from model_registry import ModelRegistry, LEGACY_MODEL_FILE
+    registry = ModelRegistry()
+    registry.refresh()
+    if registry.active is None:
+        print(f"❌ ERROR: No model found in '{registry.model_dir}' or at '{LEGACY_MODEL_FILE}'. "
+              "Please run train_yield_model.py first.")
+    registry.start()
+    return registry
+
+# Ready only once a version is active: the watcher may pick up the first export later
+model_registry = LazyResource("yield_model", _load_model_registry,
+                              available=lambda registry: registry.active is not None)
+
+def _prediction_result(input_data, predicted_yield, version):
+    return {
+        "predicted_yield_tons_per_hectare": round(float(predicted_yield), 2),
+        "input_features": input_data,
+        "model_version": version
+    }
 
 def predict_yield(input_data: dict):
     """
-    Predicts crop yield using the trained hackathon model.
+    Predicts crop yield using the active model version.
     """
-    if model_pipeline is None:
+    registry = model_registry.get()
+    if registry.active is None:
         return {"error": "Model not loaded. Please train the model first."}
 
     try:
-        # Convert the input dictionary from the API into a pandas DataFrame
-        input_df = pd.DataFrame([input_data])
-
-        # Use the pipeline to preprocess the input and make a prediction
-        prediction = model_pipeline.predict(input_df)
+        # The registry scores the dict directly (compiled model) or via a one-row DataFrame
+        prediction, version = registry.predict([input_data])
 
         # The result is a numpy array, so we get the first (and only) element
-        predicted_yield = prediction[0]
-
-        return {
-            "predicted_yield_tons_per_hectare": round(float(predicted_yield), 2),
-            "input_features": input_data
-        }
+        return _prediction_result(input_data, prediction[0], version)
 
     except Exception as e:
         return {"error": f"Prediction error: {str(e)}"}
 
+def predict_yield_batch(input_rows: list):
+    """
+    Predicts crop yield for many rows with one vectorized call. Returns one
+    result per input row, in order; a bad row yields an error entry instead
+    of failing the whole batch.
+    """
+    registry = model_registry.get()
+    if registry.active is None:
+        return [{"error": "Model not loaded. Please train the model first."} for _ in input_rows]
+    if not input_rows:
+        return []
+
+    try:
+        predictions, version = registry.predict(input_rows)
+    except Exception:
+        # Something in the batch is unscorable: fall back to per-row calls to isolate it
+        return [predict_yield(row) for row in input_rows]
+
+    return [_prediction_result(row, predicted_yield, version) for row, predicted_yield in zip(input_rows, predictions)]
@@ -0,0 +1,45 @@
+# profile_imports.py - Import-time profile of the API process
+#
+# Runs `python -X importtime -c "import main_api"` in a fresh interpreter and
+# lists the modules with the largest cumulative import time, so regressions
+# in cold start (a heavy library imported at module level) are easy to spot.
+#
+# Usage:
+#   python profile_imports.py [--module main_api] [--top 25]
+import sys
+import argparse
+import subprocess
+
+
+def profile(module):
+    """Returns (total_seconds, [(cumulative_us, self_us, module_name), ...])."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"❌ 'import {module}' failed:\n{proc.stderr.splitlines()[-1]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative_us), int(self_us), name))
+    total = next((cum for cum, _, name in rows if name.strip() == module), 0) / 1e6
+    return total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the slowest imports of the API.")
+    parser.add_argument("--module", default="main_api")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    total, rows = profile(args.module)
+    print(f"\n⏱️ import {args.module}: {total:.3f}s")
+    print(f"   {'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"   {cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
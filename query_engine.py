@@ -1,20 +1,21 @@
 # query_engine.py - Final Clean Version
 import os
-import time
+import re
+import asyncio
 import json
-import subprocess
 from dotenv import load_dotenv
 
-import torch
-from sentence_transformers import SentenceTransformer, util
-
-try:
-    from ollama import Client
-except ImportError:
-    Client = None
-    print("⚠️ Ollama client not installed. Local LLM may not work.")
-
-import google.generativeai as genai
+# torch, sentence-transformers and the Gemini SDK are imported by the
+# loaders below, so importing this module stays fast.
+from answer_cache import SemanticAnswerCache
+from batch_encoder import BatchingEncoder
+from cpu_executor import run_cpu_bound
+from embedding_store import STORE_PREFIX, EmbeddingStore, chunks_sha1, store_exists
+from lazy_resource import LazyResource
+from lexical_index import LexicalIndex, index_exists as lexical_index_exists, reciprocal_rank_fusion
+from local_llm import LocalLLM, LocalLLMUnavailable
+from ttl_cache import TTLCache
+from vector_index import INDEX_FILE, FlatIndex, load_index
 
 # --- Load environment variables ---
 load_dotenv()
@@ -23,70 +24,214 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # --- Config ---
 EMBEDDINGS_FILE = 'embeddings.pt'
 CHUNKS_FILE = 'text_chunks.json'
+SOURCES_FILE = 'chunk_sources.json'
 FAQ_FILE = 'faq.json'
 MODEL_NAME = 'all-MiniLM-L6-v2'
 LOCAL_LLM_MODEL = 'phi3'
+# "0" sends every question straight to Gemini
+LOCAL_LLM_ENABLED = os.getenv("LOCAL_LLM_ENABLED", "1") == "1"
+# Local answers shorter than this are treated as failures and regenerated by Gemini
+MIN_LOCAL_ANSWER_CHARS = 10
 SIMILARITY_THRESHOLD = 0.85
+# Only used by the 'ivf' backend: clusters scanned per query (higher = better recall)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "0")) or None
+# Dense and BM25 candidates merged by reciprocal rank fusion; "0" retrieves by embeddings only
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+# Candidates each retriever contributes to the fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "30"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+# Concurrent /ask queries are coalesced into one SBERT batch
+ENCODER_MAX_BATCH_SIZE = int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32"))
+ENCODER_MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", "5"))
+# Generated answers are reused for paraphrases that retrieve the same chunks
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "900"))
+
+# --- Lazily Loaded Models & Data ---
+def _load_sbert_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+def _load_query_encoder():
+    return BatchingEncoder(sbert_model.get(), max_batch_size=ENCODER_MAX_BATCH_SIZE,
+                           max_wait_ms=ENCODER_MAX_WAIT_MS)
+
+class RagStore:
+    """Vector index, chunk texts and (optional) chunk sources and BM25 index of the book library."""
+
+    def __init__(self, index=None, chunks=None, sources=None, lexical=None):
+        self.index = index
+        self.chunks = chunks
+        self.sources = sources
+        self.lexical = lexical
+
+    def __len__(self):
+        # Empty when the store files were missing, so readiness reports it unavailable
+        return len(self.chunks) if self.index is not None and self.chunks is not None else 0
+
+def _load_rag_store():
+    # Prefer the shared, memory-mapped store; fall back to the legacy torch/JSON pair
+    doc_vectors, text_chunks, vectors_normalized = None, None, False
+    text_chunks_sha1 = None
+    if store_exists(STORE_PREFIX):
+        try:
+            doc_store = EmbeddingStore.open(STORE_PREFIX)
+            doc_vectors, text_chunks, vectors_normalized = doc_store.vectors, doc_store.chunks, True
+            text_chunks_sha1 = doc_store.meta.get("chunks_sha1")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not open embedding store '{STORE_PREFIX}' ({e}).")
+    if doc_vectors is None:
+        try:
+            import torch
+            doc_vectors = torch.load(EMBEDDINGS_FILE).cpu().numpy()
+            with open(CHUNKS_FILE, 'r', encoding='utf-8') as f:
+                text_chunks = json.load(f)
+        except FileNotFoundError:
+            print(f"⚠️ '{EMBEDDINGS_FILE}' or '{CHUNKS_FILE}' not found. RAG will not work.")
+            return RagStore()
+
+    # Book/page of every chunk; optional, older stores were built without it
+    try:
+        with open(SOURCES_FILE, 'r', encoding='utf-8') as f:
+            chunk_sources = json.load(f)
+        if len(chunk_sources) != len(text_chunks):
+            chunk_sources = None
+    except FileNotFoundError:
+        chunk_sources = None
 
-# --- Load Models & Data ---
-print("🔄 Loading models and embeddings...")
-sbert_model = SentenceTransformer(MODEL_NAME)
-
-try:
-    doc_embeddings = torch.load(EMBEDDINGS_FILE)
-    with open(CHUNKS_FILE, 'r', encoding='utf-8') as f:
-        text_chunks = json.load(f)
-except FileNotFoundError:
-    print(f"⚠️ '{EMBEDDINGS_FILE}' or '{CHUNKS_FILE}' not found. RAG will not work.")
-    doc_embeddings, text_chunks = None, None
-
-# --- Load FAQ & embeddings ---
-def load_faq_and_create_embeddings(model):
-    if not os.path.exists(FAQ_FILE):
-        return [], None
+    # Vector index over the document embeddings
     try:
-        with open(FAQ_FILE, 'r', encoding='utf-8') as f:
-            faq_data = json.load(f)
-        if not faq_data:
-            return [], None
-        faq_queries = [item['query'] for item in faq_data]
-        faq_embeddings = model.encode(faq_queries, convert_to_tensor=True)
-        return faq_data, faq_embeddings
-    except Exception:
-        return [], None
-
-faq_data, faq_embeddings = load_faq_and_create_embeddings(sbert_model)
-
-# --- Gemini API setup ---
-gemini_model = None
-if GEMINI_API_KEY:
+        doc_index = load_index(INDEX_FILE, doc_vectors, nprobe=IVF_NPROBE, normalized=vectors_normalized)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"⚠️ Vector index unavailable ({e}). Falling back to exact search.")
+        doc_index = FlatIndex(doc_vectors, normalized=vectors_normalized)
+
+    # BM25 index for exact terms (variety codes, chemical names); optional
+    lexical = None
+    if HYBRID_RETRIEVAL:
+        try:
+            lexical = LexicalIndex.open(STORE_PREFIX) if lexical_index_exists(STORE_PREFIX) else None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not open BM25 index ({e}).")
+        # Same count is not enough: a re-ingest can change the texts and keep the count
+        if lexical is not None and lexical.chunks_sha1 != (text_chunks_sha1 or chunks_sha1(text_chunks)):
+            print("⚠️ BM25 index does not match the chunks; rebuild it with lexical_index.py.")
+            lexical = None
+        if lexical is None:
+            print("⚠️ No BM25 index; retrieval uses embeddings only.")
+    return RagStore(doc_index, text_chunks, chunk_sources, lexical)
+
+def _load_faq_store():
+    from faq_store import FAQStore
+    return FAQStore(sbert_model.get(), faq_file=FAQ_FILE).load()
+
+def _load_gemini_model():
+    if not GEMINI_API_KEY:
+        print("⚠️ GEMINI_API_KEY not found. Gemini fallback unavailable.")
+        return None
     try:
+        import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+        return genai.GenerativeModel('gemini-1.5-flash')
     except Exception as e:
         print(f"⚠️ Error configuring Gemini API: {e}")
-else:
-    print("⚠️ GEMINI_API_KEY not found. Gemini fallback unavailable.")
+        return None
 
-# --- Helper Functions ---
-def search_faq(query_embedding, faq_embeddings, faq_data):
-    if faq_embeddings is None or not faq_data:
+def _load_local_llm():
+    if not LOCAL_LLM_ENABLED:
         return None
-    cosine_scores = util.cos_sim(query_embedding, faq_embeddings)[0]
-    best_score, best_idx = torch.max(cosine_scores, dim=0)
-    return faq_data[best_idx]['answer'] if best_score > SIMILARITY_THRESHOLD else None
+    try:
+        llm = LocalLLM(LOCAL_LLM_MODEL)
+    except RuntimeError as e:
+        print(f"⚠️ {e} Using Gemini only.")
+        return None
+    try:
+        llm.warm()
+    except Exception as e:
+        # Not fatal: every call re-checks the server and the breaker handles outages
+        print(f"⚠️ Could not preload '{LOCAL_LLM_MODEL}' in Ollama ({e}).")
+    return llm
+
+sbert_model = LazyResource("sbert_model", _load_sbert_model)
+query_encoder = LazyResource("query_encoder", _load_query_encoder)
+rag_store = LazyResource("rag_store", _load_rag_store)
+faq_store = LazyResource("faq_store", _load_faq_store)
+gemini_model = LazyResource("gemini_model", _load_gemini_model, required=False)
+local_llm = LazyResource("local_llm", _load_local_llm, required=False)
+
+# --- Query embedding cache ---
+query_embedding_cache = TTLCache(max_size=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+answer_cache = SemanticAnswerCache(threshold=ANSWER_CACHE_THRESHOLD, max_size=ANSWER_CACHE_SIZE,
+                                   ttl_seconds=ANSWER_CACHE_TTL_SECONDS)
+
+def normalize_query(query):
+    """Canonical cache key for a question: lowercase, single spaces, no trailing punctuation."""
+    return re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!. ')
+
+def encode_query(query):
+    """Encodes a question once, reusing the cached vector for repeated questions."""
+    key = normalize_query(query)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = query_encoder.get().encode(query)
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
+async def encode_query_async(query):
+    """Async variant of encode_query: waits on the batching encoder without blocking the loop."""
+    key = normalize_query(query)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        encoder = await query_encoder.get_async()
+        embedding = await asyncio.wrap_future(encoder.submit(query))
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
+def get_query_stats():
+    """Encoder batching and query cache metrics for the API."""
+    return {
+        "encoder": query_encoder.get().stats() if query_encoder.is_loaded else {"loaded": False},
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "local_llm": local_llm.get().stats() if local_llm.is_loaded and local_llm.get() else {"loaded": False},
+    }
 
-def retrieve_relevant_chunks(query, model, embeddings, text_chunks, top_k=5):
-    if embeddings is None or text_chunks is None:
+# --- Helper Functions ---
+def retrieve_relevant_chunks(query_embedding, store, top_k=5, query=None):
+    """
+    Returns the ids of the chunks most relevant to the query, best first.
+    With the question text and a BM25 index, dense and lexical candidates
+    are merged by reciprocal rank fusion; otherwise it is dense search only.
+    """
+    if store.index is None or store.chunks is None:
         return []
-    query_embedding = model.encode(query, convert_to_tensor=True)
-    cosine_scores = util.cos_sim(query_embedding, embeddings)[0]
-    top_indices = torch.topk(cosine_scores, k=min(top_k, len(text_chunks))).indices.tolist()
-    return [text_chunks[idx] for idx in top_indices]
-
-def generate_with_local_llm(query, context):
-    """Generates an answer using the local Ollama model with enhanced prompts."""
-    system_prompt = """
+    if not (query and store.lexical is not None):
+        _, top_indices = store.index.search(query_embedding, top_k=top_k)
+        return top_indices.tolist()
+    _, dense = store.index.search(query_embedding, top_k=RETRIEVAL_CANDIDATES)
+    _, lexical = store.lexical.search(query, top_k=RETRIEVAL_CANDIDATES)
+    return reciprocal_rank_fusion([dense.tolist(), lexical.tolist()], top_k=top_k)
+
+def cite_chunk(store, chunk_id):
+    """Human-readable 'book, p. N' citation for a chunk, or None if unknown."""
+    if store.sources is None:
+        return None
+    src = store.sources[chunk_id]
+    pages = f"p. {src['page']}" if src['page'] == src['page_end'] else f"pp. {src['page']}-{src['page_end']}"
+    return f"{src['source']}, {pages}"
+
+def build_context(store, chunk_ids):
+    """Joins the retrieved chunks, each labelled with the book and page it came from."""
+    parts = []
+    for chunk_id in chunk_ids:
+        citation = cite_chunk(store, chunk_id)
+        text = store.chunks[chunk_id]
+        parts.append(f"[Source: {citation}]\n{text}" if citation else text)
+    return "\n---\n".join(parts)
+
+LOCAL_LLM_SYSTEM_PROMPT = """
     You are 'Krishi Mitra', a friendly and helpful agricultural advisor.
     Answer questions based ONLY on the provided context.
 
@@ -96,24 +241,37 @@ def generate_with_local_llm(query, context):
     - If context doesn't have the answer, say "I'm sorry, I couldn't find specific details on that in my resources."
     - Use bullet points for lists.
     """
-    try:
-        response = ollama.chat(
-            model=LOCAL_LLM_MODEL,
-            messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user',
-                 'content': f"Context:\n{context}\n\nQuestion:\n{query}"}
-            ]
-        )
-        return response['message']['content']
-    except Exception as e:
-        return f"Local LLM error: {e}"
 
-def generate_with_gemini_api(query, context):
-    """Generates an answer using the Gemini API."""
-    if not gemini_model:
-        return "Gemini API is not configured."
-    prompt = f"""
+def build_local_llm_messages(query, context):
+    return [
+        {'role': 'system', 'content': LOCAL_LLM_SYSTEM_PROMPT},
+        {'role': 'user',
+         'content': f"Context:\n{context}\n\nQuestion:\n{query}"}
+    ]
+
+def generate_with_local_llm(query, context):
+    """Generates an answer using the local Ollama model. Raises LocalLLMUnavailable on failure."""
+    llm = local_llm.get()
+    if llm is None:
+        raise LocalLLMUnavailable("local LLM disabled")
+    return llm.chat(build_local_llm_messages(query, context))
+
+async def generate_with_local_llm_async(query, context):
+    llm = await local_llm.get_async()
+    if llm is None:
+        raise LocalLLMUnavailable("local LLM disabled")
+    return await llm.chat_async(build_local_llm_messages(query, context))
+
+async def stream_with_local_llm_async(query, context):
+    """Yields answer tokens from the local Ollama model as they are generated. Raises on failure."""
+    llm = await local_llm.get_async()
+    if llm is None:
+        raise LocalLLMUnavailable("local LLM disabled")
+    async for token in llm.stream_async(build_local_llm_messages(query, context)):
+        yield token
+
+def build_gemini_prompt(query, context):
+    return f"""
     You are 'Krishi Mitra', a friendly and knowledgeable agricultural expert in India.
     Answer the question clearly and conversationally, using ONLY the provided context.
 
@@ -123,64 +281,238 @@ def generate_with_gemini_api(query, context):
     Question:
     {query}
     """
+
+def generate_with_gemini_api(query, context):
+    """Generates an answer using the Gemini API."""
+    model = gemini_model.get()
+    if not model:
+        return "Gemini API is not configured."
     try:
-        response = gemini_model.generate_content(prompt)
+        response = model.generate_content(build_gemini_prompt(query, context))
         return response.text
     except Exception as e:
         return f"Gemini API error: {e}"
 
-def stop_ollama_server():
-    """Stops any running Ollama server process to free system resources."""
+async def generate_with_gemini_api_async(query, context):
+    """Generates an answer using the Gemini API without blocking the event loop."""
+    model = await gemini_model.get_async()
+    if not model:
+        return "Gemini API is not configured."
     try:
-        subprocess.run(["pkill", "-f", "ollama"], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        time.sleep(2)
-    except FileNotFoundError:
-        pass
+        response = await model.generate_content_async(build_gemini_prompt(query, context))
+        return response.text
+    except Exception as e:
+        return f"Gemini API error: {e}"
 
-def update_faq_file(faq_data, query, answer):
-    """Appends a new Q&A pair to faq.json."""
-    new_entry = {"query": query, "answer": answer}
-    faq_data.append(new_entry)
-    with open(FAQ_FILE, 'w', encoding='utf-8') as f:
-        json.dump(faq_data, f, indent=2, ensure_ascii=False)
-    print(f"✅ Saved new Q&A to '{FAQ_FILE}'.")
+class StreamOutcome:
+    """Filled in while an answer streams; `failed` means the text ends in an error, not an answer."""
+
+    def __init__(self):
+        self.failed = False
+
+async def stream_with_gemini_api_async(query, context, outcome=None):
+    """
+    Yields answer tokens from the Gemini API as they arrive; errors are
+    yielded as text and flagged on `outcome`.
+    """
+    outcome = outcome or StreamOutcome()
+    model = await gemini_model.get_async()
+    if not model:
+        outcome.failed = True
+        yield "Gemini API is not configured."
+        return
+    try:
+        response = await model.generate_content_async(build_gemini_prompt(query, context), stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    except Exception as e:
+        outcome.failed = True
+        yield f"Gemini API error: {e}"
+
+async def stream_answer_tokens(query, context, outcome=None):
+    """Local model first, Gemini if it fails before producing any token."""
+    outcome = outcome or StreamOutcome()
+    if LOCAL_LLM_ENABLED:
+        started = False
+        try:
+            async for token in stream_with_local_llm_async(query, context):
+                started = True
+                yield token
+            if started:
+                return
+        except Exception as e:
+            if started:
+                outcome.failed = True
+                yield f"\n\nLocal LLM error: {e}"
+                return
+            print(f"⚠️ Local LLM unavailable ({e}). Falling back to Gemini.")
+    async for token in stream_with_gemini_api_async(query, context, outcome):
+        yield token
 
 # --- Main Query Engine Function ---
-def run_query_engine(query: str) -> str:
-    global faq_data, faq_embeddings
+NO_CONTEXT_ANSWER = "I'm sorry, I couldn't find specific details in my knowledge base."
 
-    query_embedding = sbert_model.encode(query, convert_to_tensor=True)
+LLM_ERROR_PREFIXES = ("Local LLM error", "Gemini API error", "Gemini API is not configured")
 
+def lookup_faq_or_context(query_embedding, query=None):
+    """Returns (faq_answer, chunk_ids, context_str); either the FAQ answer or the context is set."""
     # 1. Check FAQ first
-    faq_answer = search_faq(query_embedding, faq_embeddings, faq_data)
+    faq_answer = faq_store.get().search(query_embedding, SIMILARITY_THRESHOLD)
     if faq_answer:
-        return faq_answer
+        return faq_answer, [], None
 
     # 2. Retrieve relevant chunks
-    relevant_chunks = retrieve_relevant_chunks(query, sbert_model, doc_embeddings, text_chunks)
-    if not relevant_chunks:
-        return "I'm sorry, I couldn't find specific details in my knowledge base."
+    store = rag_store.get()
+    chunk_ids = retrieve_relevant_chunks(query_embedding, store, query=query)
+    if not chunk_ids:
+        return None, [], None
+    return None, chunk_ids, build_context(store, chunk_ids)
+
+def is_good_answer(answer):
+    return "error" not in answer.lower() and len(answer.split()) > 5
 
-    context_str = "\n---\n".join(relevant_chunks)
+def is_cacheable_answer(answer):
+    # Short or FAQ-rejected answers are still worth reusing; transient LLM failures are not
+    return bool(answer) and not answer.startswith(LLM_ERROR_PREFIXES)
 
-    # 3. Generate answer using AI
+def is_useful_local_answer(answer):
+    return bool(answer) and len(answer.strip()) >= MIN_LOCAL_ANSWER_CHARS
+
+def generate_answer(query, context_str):
+    """Local LLM first, Gemini as fallback."""
+    if LOCAL_LLM_ENABLED:
+        try:
+            final_answer = generate_with_local_llm(query, context_str)
+            if is_useful_local_answer(final_answer):
+                return final_answer
+            print("⚠️ Local LLM returned unhelpful response. Falling back to Gemini.")
+        except LocalLLMUnavailable as e:
+            print(f"⚠️ Local LLM unavailable ({e}). Falling back to Gemini.")
+    return generate_with_gemini_api(query, context_str)
+
+async def generate_answer_async(query, context_str):
+    """Async variant of generate_answer."""
+    if LOCAL_LLM_ENABLED:
+        try:
+            final_answer = await generate_with_local_llm_async(query, context_str)
+            if is_useful_local_answer(final_answer):
+                return final_answer
+            print("⚠️ Local LLM returned unhelpful response. Falling back to Gemini.")
+        except LocalLLMUnavailable as e:
+            print(f"⚠️ Local LLM unavailable ({e}). Falling back to Gemini.")
+    return await generate_with_gemini_api_async(query, context_str)
+
+def run_query_engine(query: str) -> str:
+    # Encoded once and shared by every retrieval stage below
+    query_embedding = encode_query(query)
+
+    faq_answer, chunk_ids, context_str = lookup_faq_or_context(query_embedding, query)
+    if faq_answer:
+        return faq_answer
+    if context_str is None:
+        return NO_CONTEXT_ANSWER
+
+    # 3. Reuse a recent (or in-flight) answer to a paraphrase over the same chunks
+    status, value = answer_cache.claim(query_embedding, chunk_ids)
+    if status == "hit":
+        return value
+    if status == "wait":
+        return value.result()
+
+    # 4. Generate answer using AI
     try:
-        # Force a failure here to test Gemini fallback
-        raise ValueError("Simulating local LLM failure for testing.")
-        final_answer = generate_with_local_llm(query, context_str)
-        if not final_answer or len(final_answer.strip()) < 10:
-            raise ValueError("Local LLM returned unhelpful response.")
-    except Exception:
-        stop_ollama_server()
-        final_answer = generate_with_gemini_api(query, context_str)
-
-    # 4. Update FAQ if answer is good
-    if "error" not in final_answer.lower() and len(final_answer.split()) > 5:
-        update_faq_file(faq_data, query, final_answer)
-        faq_data, faq_embeddings = load_faq_and_create_embeddings(sbert_model)
+        final_answer = generate_answer(query, context_str)
+    except Exception as e:
+        answer_cache.fail(value, e)
+        raise
+    answer_cache.resolve(value, final_answer, cacheable=is_cacheable_answer(final_answer))
+
+    # 5. Update FAQ if answer is good
+    if is_good_answer(final_answer):
+        faq_store.get().add(query, final_answer, query_embedding)
+
+    return final_answer
+
+async def prepare_query_async(query):
+    """Encodes the question and runs the FAQ lookup or chunk retrieval off the event loop."""
+    query_embedding = await encode_query_async(query)
+    faq_answer, chunk_ids, context_str = await run_cpu_bound(lookup_faq_or_context, query_embedding, query)
+    return query_embedding, faq_answer, chunk_ids, context_str
+
+async def run_query_engine_async(query: str) -> str:
+    """
+    Asyncio-native /ask path: encoding waits on the batching encoder, search
+    runs on the CPU pool and the LLM call is awaited, so no request ever
+    parks an event-loop or threadpool worker on I/O.
+    """
+    query_embedding, faq_answer, chunk_ids, context_str = await prepare_query_async(query)
+    if faq_answer:
+        return faq_answer
+    if context_str is None:
+        return NO_CONTEXT_ANSWER
+
+    status, value = answer_cache.claim(query_embedding, chunk_ids)
+    if status == "hit":
+        return value
+    if status == "wait":
+        return await asyncio.wrap_future(value)
+
+    try:
+        final_answer = await generate_answer_async(query, context_str)
+    except BaseException as e:
+        answer_cache.fail(value, e if isinstance(e, Exception) else RuntimeError("Answer generation cancelled."))
+        raise
+    answer_cache.resolve(value, final_answer, cacheable=is_cacheable_answer(final_answer))
+
+    if is_good_answer(final_answer):
+        await run_cpu_bound(faq_store.get().add, query, final_answer, query_embedding)
 
     return final_answer
 
+async def stream_query_engine_async(query: str):
+    """
+    Streaming /ask path. Yields events in one envelope for every outcome:
+      {"type": "token", "text": ...}   zero or more times
+      {"type": "done", "source": "faq" | "cache" | "llm" | "none", "answer": <full answer>}
+    FAQ, cached and no-context answers arrive as a single token followed by "done".
+    """
+    query_embedding, faq_answer, chunk_ids, context_str = await prepare_query_async(query)
+    if faq_answer:
+        yield {"type": "token", "text": faq_answer}
+        yield {"type": "done", "source": "faq", "answer": faq_answer}
+        return
+    if context_str is None:
+        yield {"type": "token", "text": NO_CONTEXT_ANSWER}
+        yield {"type": "done", "source": "none", "answer": NO_CONTEXT_ANSWER}
+        return
+
+    status, value = answer_cache.claim(query_embedding, chunk_ids)
+    if status != "owner":
+        answer = value if status == "hit" else await asyncio.wrap_future(value)
+        yield {"type": "token", "text": answer}
+        yield {"type": "done", "source": "cache", "answer": answer}
+        return
+
+    tokens = []
+    outcome = StreamOutcome()
+    try:
+        async for token in stream_answer_tokens(query, context_str, outcome):
+            tokens.append(token)
+            yield {"type": "token", "text": token}
+    except BaseException as e:
+        # Includes the client disconnecting mid-stream: release anyone waiting on this answer
+        answer_cache.fail(value, e if isinstance(e, Exception) else RuntimeError("Answer stream closed."))
+        raise
+    final_answer = "".join(tokens)
+    # A stream that broke off partway still starts like a real answer: trust the flag, not the text
+    answer_cache.resolve(value, final_answer,
+                         cacheable=not outcome.failed and is_cacheable_answer(final_answer))
+
+    if not outcome.failed and is_good_answer(final_answer):
+        await run_cpu_bound(faq_store.get().add, query, final_answer, query_embedding)
+    yield {"type": "done", "source": "llm", "answer": final_answer}
+
 # --- Interactive Loop ---
 def main():
     print(f"\nWelcome! I'm Krishi Mitra, your Agri-Advisor Bot.")
@@ -191,12 +523,10 @@ def main():
         try:
             query = input("> ").strip()
             if query.lower() == "exit":
-                stop_ollama_server()
                 break
             if not query:
                 continue
 
-            stop_ollama_server()
             print("\n🔎 Searching through resources...")
             answer = run_query_engine(query)
             print("\nAnswer:\n")
@@ -204,7 +534,6 @@ def main():
             print("\n" + "="*50 + "\n")
 
         except KeyboardInterrupt:
-            stop_ollama_server()
             print("\nGoodbye!")
             break
 
@@ -0,0 +1,144 @@
+# scenarios.py - What-if yield grids: one base input, the Cartesian product of varied fields
+#
+# The dashboard explores "what if I irrigate / use fertilizer / harvest
+# later" for a single field. Instead of one /predict round trip per
+# scenario, /predict/scenarios resolves weather and soil once, expands
+# every combination of the varied values, scores them in one batch call
+# and returns the whole response surface. Surfaces are cached by a hash of
+# the base input, the grid and the model version that scored them.
+import os
+import json
+import math
+import hashlib
+import itertools
+
+from ttl_cache import TTLCache
+
+# --- Config ---
+SCENARIO_MAX_POINTS = int(os.getenv("SCENARIO_MAX_POINTS", "2000"))
+SCENARIO_CACHE_SIZE = int(os.getenv("SCENARIO_CACHE_SIZE", "512"))
+# Matches the current-weather cache: a surface never outlives the rainfall it used
+SCENARIO_CACHE_TTL_SECONDS = int(os.getenv("SCENARIO_CACHE_TTL_SECONDS", "600"))
+
+# Fields a scenario may vary, and the type each value must have
+SCENARIO_FIELDS = {
+    "Fertilizer_Used": bool,
+    "Irrigation_Used": bool,
+    "Days_to_Harvest": int,
+    "Temperature_Celsius": float,
+    "Rainfall_mm": float,
+    "Soil_Type": str,
+    "Crop": str,
+    "Weather_Condition": str,
+}
+
+scenario_cache = TTLCache(max_size=SCENARIO_CACHE_SIZE, ttl_seconds=SCENARIO_CACHE_TTL_SECONDS)
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+def _coerce(field, value):
+    kind = SCENARIO_FIELDS[field]
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise ScenarioError(f"{field} values must be true or false.")
+        return value
+    if kind is str:
+        if not isinstance(value, str):
+            raise ScenarioError(f"{field} values must be strings.")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ScenarioError(f"{field} values must be finite numbers.")
+    return int(round(value)) if kind is int else float(value)
+
+
+def _expand_range(field, spec):
+    """{"start", "stop", "step"} -> the values from start to stop inclusive."""
+    try:
+        start, stop, step = float(spec["start"]), float(spec["stop"]), float(spec["step"])
+    except (KeyError, TypeError, ValueError):
+        raise ScenarioError(f"{field} range needs numeric start, stop and step.")
+    if not all(math.isfinite(v) for v in (start, stop, step)):
+        raise ScenarioError(f"{field} range bounds and step must be finite numbers.")
+    if step <= 0 or stop < start:
+        raise ScenarioError(f"{field} range needs step > 0 and stop >= start.")
+    count = math.floor((stop - start) / step + 1e-9) + 1
+    if count > SCENARIO_MAX_POINTS:
+        raise ScenarioError(f"{field} range has more than {SCENARIO_MAX_POINTS} values.")
+    # Rounded so 0.1 steps give 20.3, not 20.299999999999997
+    return [round(start + i * step, 6) for i in range(count)]
+
+
+def grid_axes(vary):
+    """
+    Validated axes as an ordered {field: [values]}: a list of values, or a
+    range for numeric fields. Duplicates are dropped, keeping first order.
+    """
+    if not vary:
+        raise ScenarioError("vary must name at least one field.")
+    axes = {}
+    for field, spec in vary.items():
+        if field not in SCENARIO_FIELDS:
+            raise ScenarioError(f"'{field}' cannot be varied; choose from {', '.join(SCENARIO_FIELDS)}.")
+        if isinstance(spec, dict):
+            if SCENARIO_FIELDS[field] not in (int, float):
+                raise ScenarioError(f"{field} takes a list of values, not a range.")
+            spec = _expand_range(field, spec)
+        if not isinstance(spec, list) or not spec:
+            raise ScenarioError(f"{field} needs a non-empty list of values or a range.")
+        axes[field] = list(dict.fromkeys(_coerce(field, value) for value in spec))
+    points = math.prod(len(values) for values in axes.values())
+    if points > SCENARIO_MAX_POINTS:
+        raise ScenarioError(f"The grid has {points} scenarios; the limit is {SCENARIO_MAX_POINTS}.")
+    return axes
+
+
+def expand_grid(base_row, axes):
+    """One model input per combination, in row-major order of the axes."""
+    fields = list(axes)
+    return [{**base_row, **dict(zip(fields, combination))}
+            for combination in itertools.product(*axes.values())]
+
+
+def scenario_key(base_request, axes, model_version):
+    """
+    Hash of everything that determines a surface (weather is covered by the
+    cache TTL). Axes go in as ordered [field, values] pairs: their order
+    shapes the nested surface, so it must not be sorted away.
+    """
+    payload = json.dumps([base_request, [[field, values] for field, values in axes.items()], model_version],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def response_surface(axes, results):
+    """
+    The batch results as a flat scenario list plus a nested surface shaped
+    like the axes; scenarios that could not be scored are None there.
+    """
+    fields = list(axes)
+    scenarios, values = [], []
+    for combination, result in zip(itertools.product(*axes.values()), results):
+        value = result.get("predicted_yield_tons_per_hectare")
+        scenario = {**dict(zip(fields, combination)), "predicted_yield_tons_per_hectare": value}
+        if value is None:
+            scenario["error"] = result.get("error")
+        scenarios.append(scenario)
+        values.append(value)
+
+    def nest(flat, shape):
+        if len(shape) == 1:
+            return flat
+        size = len(flat) // shape[0]
+        return [nest(flat[i * size:(i + 1) * size], shape[1:]) for i in range(shape[0])]
+
+    scored = [s for s in scenarios if s["predicted_yield_tons_per_hectare"] is not None]
+    return {
+        "fields": fields,
+        "axes": axes,
+        "surface": nest(values, [len(v) for v in axes.values()]),
+        "scenarios": scenarios,
+        "best": max(scored, key=lambda s: s["predicted_yield_tons_per_hectare"]) if scored else None,
+    }
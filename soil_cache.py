@@ -0,0 +1,106 @@
+# soil_cache.py - Persistent, grid-keyed cache of SoilGrids properties
+#
+# enrich_dataset.py fills it (one SoilGrids call per 0.01-degree cell, ever);
+# the API reads it to attach soil properties to a location without any
+# network call. Lookups find the nearest cached cell within a radius, so a
+# town's coordinates resolve to the soil of its district.
+import os
+import math
+import sqlite3
+import threading
+
+# --- Config ---
+SOIL_CACHE_FILE = os.getenv("SOIL_CACHE_FILE", "soil_cache.sqlite")
+GRID_STEP_DEGREES = 0.01
+# Nearest-cell search radius for lookups that miss the exact cell
+SOIL_MAX_DISTANCE_KM = float(os.getenv("SOIL_MAX_DISTANCE_KM", "75"))
+SOIL_COLUMNS = ('soil_ph', 'soil_nitrogen', 'soil_phosphorus', 'soil_potassium')
+KM_PER_DEGREE = 111.32
+
+
+def grid_cell(lat, lon):
+    return round(lat / GRID_STEP_DEGREES), round(lon / GRID_STEP_DEGREES)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+class SoilCache:
+    """SQLite table of soil properties keyed by grid cell. Safe to share between threads."""
+
+    def __init__(self, path=SOIL_CACHE_FILE):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS soil (
+                    grid_lat INTEGER NOT NULL,
+                    grid_lon INTEGER NOT NULL,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    {", ".join(f"{column} REAL" for column in SOIL_COLUMNS)},
+                    PRIMARY KEY (grid_lat, grid_lon)
+                )""")
+
+    def _conn(self):
+        # One connection per thread; WAL lets the API read while a run writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM soil").fetchone()[0]
+
+    def get(self, lat, lon):
+        """Soil properties of the exact grid cell, or None."""
+        row = self._conn().execute(
+            f"SELECT {', '.join(SOIL_COLUMNS)} FROM soil WHERE grid_lat = ? AND grid_lon = ?", grid_cell(lat, lon)
+        ).fetchone()
+        return dict(zip(SOIL_COLUMNS, row)) if row else None
+
+    def nearest(self, lat, lon, max_distance_km=SOIL_MAX_DISTANCE_KM):
+        """
+        Soil properties of the closest cached cell within max_distance_km, as
+        a dict with an extra 'distance_km' key, or None.
+        """
+        lat_cells = math.ceil(max_distance_km / KM_PER_DEGREE / GRID_STEP_DEGREES)
+        lon_cells = math.ceil(lat_cells / max(math.cos(math.radians(lat)), 0.01))
+        grid_lat, grid_lon = grid_cell(lat, lon)
+        rows = self._conn().execute(
+            f"SELECT lat, lon, {', '.join(SOIL_COLUMNS)} FROM soil "
+            "WHERE grid_lat BETWEEN ? AND ? AND grid_lon BETWEEN ? AND ?",
+            (grid_lat - lat_cells, grid_lat + lat_cells, grid_lon - lon_cells, grid_lon + lon_cells),
+        ).fetchall()
+        best, best_distance = None, max_distance_km
+        for row in rows:
+            distance = haversine_km(lat, lon, row[0], row[1])
+            if distance <= best_distance:
+                best, best_distance = row, distance
+        if best is None:
+            return None
+        return {**dict(zip(SOIL_COLUMNS, best[2:])), "distance_km": round(best_distance, 1)}
+
+    def missing(self, locations):
+        """The (lat, lon) pairs whose grid cell is not cached yet, one per cell."""
+        cached = set(self._conn().execute("SELECT grid_lat, grid_lon FROM soil"))
+        todo = {}
+        for lat, lon in locations:
+            cell = grid_cell(lat, lon)
+            if cell not in cached:
+                todo.setdefault(cell, (lat, lon))
+        return list(todo.values())
+
+    def put(self, lat, lon, soil):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO soil (grid_lat, grid_lon, lat, lon, {', '.join(SOIL_COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?, {', '.join('?' * len(SOIL_COLUMNS))})",
+                (*grid_cell(lat, lon), lat, lon, *(soil.get(column) for column in SOIL_COLUMNS)),
+            )
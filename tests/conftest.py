@@ -0,0 +1,98 @@
+# Shared fixtures. The modules under test live in the repository root.
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeOllama:
+    """
+    A local stand-in for the Ollama server's /api/chat. Each request is
+    answered according to `mode`:
+      "ok"     streams `tokens` (or returns them joined when not streaming)
+      "break"  streams `tokens`, then drops the connection mid-response
+      "error"  answers 500
+      "slow"   waits `delay` seconds, then behaves like "ok"
+    """
+
+    def __init__(self):
+        self.mode = "ok"
+        self.tokens = ["Sow ", "rice ", "after ", "the ", "first ", "monsoon ", "rains."]
+        self.delay = 0.0
+        self.requests = 0
+        self.release = threading.Event()
+        self.release.set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake.requests += 1
+                if fake.mode == "slow":
+                    fake.release.wait(fake.delay)
+                if fake.mode == "error":
+                    return self._send(500, json.dumps({"error": "model crashed"}).encode())
+                if not body.get("stream", True):
+                    message = {"role": "assistant", "content": "".join(fake.tokens)}
+                    return self._send(200, json.dumps({"model": body["model"], "message": message,
+                                                       "done": True}).encode())
+                lines = [json.dumps({"model": body["model"], "done": False,
+                                     "message": {"role": "assistant", "content": token}}) + "\n"
+                         for token in fake.tokens]
+                lines.append(json.dumps({"model": body["model"], "done": True,
+                                         "message": {"role": "assistant", "content": ""}}) + "\n")
+                payload = "".join(lines).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                if fake.mode == "break":
+                    # Promise the whole body, send part of it, hang up
+                    self.wfile.write("".join(lines[:3]).encode())
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(payload)
+
+            def _send(self, status, payload):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_ollama():
+    server = FakeOllama()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def preload(monkeypatch):
+    """Makes a LazyResource return `value` without running its loader (restored after the test)."""
+    def set_value(resource, value):
+        monkeypatch.setattr(resource, "_value", value)
+        monkeypatch.setattr(resource, "_loaded", True)
+    return set_value
@@ -0,0 +1,98 @@
+# CompiledModel must predict what the sklearn pipeline it was compiled from predicts
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from benchmark_compiled_model import CATEGORIES, TOLERANCE, synthetic_pipeline, synthetic_rows
+from compiled_model import CompiledModel, UnsupportedPipeline, compile_pipeline, file_sha1, load_for
+from model_registry import model_frame
+from train_yield_model import BOOLEAN_FEATURES, CATEGORICAL_FEATURES, NUMERIC_FEATURES
+
+
+@pytest.fixture(scope="module")
+def tree_pipeline():
+    return synthetic_pipeline(3000, 40)
+
+
+@pytest.fixture(scope="module")
+def linear_pipeline():
+    rows = synthetic_rows(2000, seed=5)
+    frame = pd.DataFrame(rows)[CATEGORICAL_FEATURES + BOOLEAN_FEATURES + NUMERIC_FEATURES]
+    target = frame['Rainfall_mm'] / 100 + frame['Irrigation_Used'] * 2.0 + (frame['Crop'] == 'Rice') * 0.7
+    prep = ColumnTransformer([
+        ("categorical", OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES),
+        ("numeric", StandardScaler(), BOOLEAN_FEATURES + NUMERIC_FEATURES),
+    ])
+    return Pipeline([("prep", prep), ("model", Ridge(alpha=1.0))]).fit(frame, target)
+
+
+def assert_parity(pipeline, compiled, rows):
+    expected = pipeline.predict(model_frame(pipeline, rows))
+    np.testing.assert_allclose(compiled.predict(rows), expected, rtol=0, atol=TOLERANCE)
+
+
+def test_trees_match_pipeline(tree_pipeline):
+    assert_parity(tree_pipeline, compile_pipeline(tree_pipeline), synthetic_rows(2000, seed=3))
+
+
+def test_trees_unseen_categories_and_missing_numbers(tree_pipeline):
+    rows = synthetic_rows(1000, seed=6, noisy=True)
+    for row in rows[::5]:
+        row['Soil_Type'] = 'Laterite'
+    for row in rows[1::9]:
+        row['Region'] = None
+    for row in rows[2::13]:
+        row['Temperature_Celsius'] = None
+    assert any(row['Crop'] not in CATEGORIES['Crop'] for row in rows)
+    assert any(row['Rainfall_mm'] is None for row in rows)
+    assert_parity(tree_pipeline, compile_pipeline(tree_pipeline), rows)
+
+
+def test_single_rows_match(tree_pipeline):
+    compiled = compile_pipeline(tree_pipeline)
+    for row in synthetic_rows(20, seed=7, noisy=True):
+        assert_parity(tree_pipeline, compiled, [row])
+
+
+def test_linear_model_matches_pipeline(linear_pipeline):
+    compiled = compile_pipeline(linear_pipeline)
+    assert compiled.meta["kind"] == "linear"
+    rows = synthetic_rows(1000, seed=8)
+    for row in rows[::7]:
+        row['Crop'] = 'Millet'  # ignored by the one-hot encoder
+    assert_parity(linear_pipeline, compiled, rows)
+
+
+def test_npz_round_trip(tree_pipeline, linear_pipeline, tmp_path):
+    rows = synthetic_rows(500, seed=9, noisy=True)
+    for name, pipeline in (("trees", tree_pipeline), ("linear", linear_pipeline)):
+        path = str(tmp_path / f"{name}.npz")
+        compile_pipeline(pipeline, source_sha1="abc").save(path)
+        loaded = CompiledModel.load(path)
+        assert loaded.source_sha1 == "abc"
+        if name == "linear":
+            rows = [{**row, 'Rainfall_mm': row['Rainfall_mm'] or 500.0} for row in rows]
+        assert_parity(pipeline, loaded, rows)
+
+
+def test_load_for_ignores_artifact_of_another_pkl(tree_pipeline, tmp_path):
+    import joblib
+    model_file = str(tmp_path / "yield_model.pkl")
+    joblib.dump(tree_pipeline, model_file)
+    compile_pipeline(tree_pipeline, source_sha1=file_sha1(model_file)).save(str(tmp_path / "yield_model.npz"))
+    assert load_for(model_file) is not None
+
+    joblib.dump(Pipeline(tree_pipeline.steps), model_file)
+    compile_pipeline(tree_pipeline, source_sha1="stale").save(str(tmp_path / "yield_model.npz"))
+    assert load_for(model_file) is None
+
+
+def test_unsupported_model_is_rejected(tree_pipeline):
+    from sklearn.ensemble import RandomForestRegressor
+    pipeline = Pipeline([tree_pipeline.steps[0], ("model", RandomForestRegressor())])
+    with pytest.raises(UnsupportedPipeline):
+        compile_pipeline(pipeline)
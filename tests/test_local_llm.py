@@ -0,0 +1,158 @@
+# LocalLLM against a stub Ollama server: queueing for a generation slot, the
+# circuit breaker and the Gemini fallback in query_engine
+import time
+import asyncio
+import threading
+
+import pytest
+
+import query_engine
+from local_llm import LocalLLM, LocalLLMUnavailable, CircuitBreaker, GenerationSlots
+
+MESSAGES = [{"role": "user", "content": "When should I sow paddy?"}]
+
+
+def make_llm(fake_ollama, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_seconds=0.3))
+    return LocalLLM("phi3", host=fake_ollama.host, timeout=5, **kwargs)
+
+
+# --- Queueing ---
+def test_slot_is_handed_to_an_async_waiter_without_polling():
+    slots = GenerationSlots(1)
+
+    async def run():
+        assert await slots.acquire_async(timeout=1)
+        waiter = asyncio.ensure_future(slots.acquire_async(timeout=1))
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        threading.Thread(target=slots.release).start()
+        assert await waiter
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 0.02
+    assert slots.in_use == 1
+
+
+def test_sync_and_async_callers_share_one_limit():
+    slots = GenerationSlots(1)
+    assert slots.acquire(timeout=0)
+    assert asyncio.run(slots.acquire_async(timeout=0.05)) is False
+    slots.release()
+    assert asyncio.run(slots.acquire_async(timeout=0.05)) is True
+    assert slots.acquire(timeout=0.05) is False
+    slots.release()
+    assert slots.in_use == 0
+
+
+def test_queue_timeout_rejects_as_busy(fake_ollama):
+    fake_ollama.mode = "slow"
+    fake_ollama.delay = 5
+    fake_ollama.release.clear()
+    llm = make_llm(fake_ollama, max_concurrency=1, queue_seconds=0.2)
+
+    async def run():
+        first = asyncio.ensure_future(llm.chat_async(MESSAGES))
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        with pytest.raises(LocalLLMUnavailable, match="slots busy"):
+            await llm.chat_async(MESSAGES)
+        waited = time.perf_counter() - started
+        fake_ollama.release.set()
+        assert await first == "".join(fake_ollama.tokens)
+        return waited
+
+    waited = asyncio.run(run())
+    assert 0.15 < waited < 1.0
+    stats = llm.stats()
+    assert stats["rejected_busy"] == 1 and stats["slots_in_use"] == 0
+    # Being busy says nothing about the model's health
+    assert stats["breaker"] == "closed"
+
+
+# --- Circuit breaker ---
+def test_breaker_opens_then_half_open_trial_closes_it(fake_ollama):
+    fake_ollama.mode = "error"
+    llm = make_llm(fake_ollama)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LocalLLMUnavailable):
+                await llm.chat_async(MESSAGES)
+        assert llm.breaker.state == "open"
+        requests = fake_ollama.requests
+        with pytest.raises(LocalLLMUnavailable, match="circuit breaker open"):
+            await llm.chat_async(MESSAGES)
+        assert fake_ollama.requests == requests
+
+        await asyncio.sleep(0.35)
+        assert llm.breaker.state == "half-open"
+        fake_ollama.mode = "ok"
+        assert await llm.chat_async(MESSAGES) == "".join(fake_ollama.tokens)
+        assert llm.breaker.state == "closed"
+
+    asyncio.run(run())
+    assert llm.stats()["rejected_open"] == 1
+
+
+def test_failed_half_open_trial_reopens_breaker(fake_ollama):
+    fake_ollama.mode = "error"
+    llm = make_llm(fake_ollama)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LocalLLMUnavailable):
+                await llm.chat_async(MESSAGES)
+        await asyncio.sleep(0.35)
+        with pytest.raises(LocalLLMUnavailable):
+            await llm.chat_async(MESSAGES)
+        assert llm.breaker.state == "open"
+
+    asyncio.run(run())
+
+
+# --- Gemini fallback ---
+class FakeGemini:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        text = "Gemini says: sow paddy with the first monsoon rains."
+        if not stream:
+            return type("Response", (), {"text": text})()
+
+        async def chunks():
+            for word in text.split(" "):
+                yield type("Chunk", (), {"text": word + " "})()
+        return chunks()
+
+
+@pytest.fixture
+def gemini(monkeypatch, preload):
+    model = FakeGemini()
+    preload(query_engine.gemini_model, model)
+    monkeypatch.setattr(query_engine, "LOCAL_LLM_ENABLED", True)
+    return model
+
+
+def test_falls_back_to_gemini_when_local_model_fails(fake_ollama, preload, gemini):
+    fake_ollama.mode = "error"
+    preload(query_engine.local_llm, make_llm(fake_ollama))
+    answer = asyncio.run(query_engine.generate_answer_async("When?", "context"))
+    assert answer.startswith("Gemini says")
+    assert gemini.calls == 1
+
+
+def test_open_breaker_goes_straight_to_gemini(fake_ollama, preload, gemini):
+    llm = make_llm(fake_ollama)
+    llm.breaker.record_failure()
+    llm.breaker.record_failure()
+    preload(query_engine.local_llm, llm)
+
+    async def run():
+        return [t async for t in query_engine.stream_answer_tokens("When?", "context")]
+
+    assert "".join(asyncio.run(run())).startswith("Gemini says")
+    assert fake_ollama.requests == 0
+    assert gemini.calls == 1
@@ -0,0 +1,95 @@
+# Streaming /ask path against a stub Ollama server: FAQ hits, complete answers
+# and answers that break off partway
+import asyncio
+
+import numpy as np
+import pytest
+
+import query_engine
+from answer_cache import SemanticAnswerCache
+from local_llm import LocalLLM, CircuitBreaker
+
+QUESTION = "When should I sow paddy?"
+EMBEDDING = np.ones(8, dtype=np.float32)
+CHUNK_IDS = [3, 7]
+
+
+class RecordingFAQ:
+    def __init__(self):
+        self.added = []
+
+    def add(self, query, answer, embedding):
+        self.added.append((query, answer))
+
+
+def collect(question=QUESTION):
+    async def run():
+        return [event async for event in query_engine.stream_query_engine_async(question)]
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def engine(monkeypatch, preload, fake_ollama):
+    """query_engine wired to the stub server, a fresh answer cache and a recording FAQ store."""
+    faq = RecordingFAQ()
+    state = {"faq_answer": None}
+
+    async def prepare(query):
+        if state["faq_answer"]:
+            return EMBEDDING, state["faq_answer"], [], None
+        return EMBEDDING, None, CHUNK_IDS, "Paddy is sown at the onset of the monsoon."
+
+    monkeypatch.setattr(query_engine, "prepare_query_async", prepare)
+    monkeypatch.setattr(query_engine, "answer_cache", SemanticAnswerCache())
+    monkeypatch.setattr(query_engine, "LOCAL_LLM_ENABLED", True)
+    preload(query_engine.faq_store, faq)
+    preload(query_engine.gemini_model, None)
+    preload(query_engine.local_llm, LocalLLM("phi3", host=fake_ollama.host, timeout=5,
+                                             breaker=CircuitBreaker(failure_threshold=3)))
+    return faq, state
+
+
+def test_faq_hit_streams_one_token_without_llm_call(engine, fake_ollama):
+    faq, state = engine
+    state["faq_answer"] = "Sow paddy in June."
+    events = collect()
+    assert events == [{"type": "token", "text": "Sow paddy in June."},
+                      {"type": "done", "source": "faq", "answer": "Sow paddy in June."}]
+    assert fake_ollama.requests == 0
+    assert faq.added == []
+
+
+def test_complete_stream_is_cached_and_added_to_faq(engine, fake_ollama):
+    faq, _ = engine
+    events = collect()
+    tokens = [e["text"] for e in events if e["type"] == "token"]
+    assert tokens == fake_ollama.tokens
+    assert events[-1] == {"type": "done", "source": "llm", "answer": "".join(fake_ollama.tokens)}
+    assert faq.added == [(QUESTION, "".join(fake_ollama.tokens))]
+
+    # The same question is now answered from the answer cache
+    assert query_engine.answer_cache.claim(EMBEDDING, CHUNK_IDS)[0] == "hit"
+    assert collect()[-1]["source"] == "cache"
+    assert fake_ollama.requests == 1
+
+
+def test_stream_failing_midway_is_neither_cached_nor_added(engine, fake_ollama):
+    faq, _ = engine
+    fake_ollama.mode = "break"
+    events = collect()
+    answer = events[-1]["answer"]
+    assert events[-1]["source"] == "llm"
+    assert answer.startswith("".join(fake_ollama.tokens[:3]))
+    assert "Local LLM error" in answer
+    assert faq.added == []
+    # Nothing cached: the next identical question generates again
+    assert query_engine.answer_cache.claim(EMBEDDING, CHUNK_IDS)[0] == "owner"
+
+
+def test_failure_before_first_token_falls_back_and_is_not_cached(engine, fake_ollama):
+    faq, _ = engine
+    fake_ollama.mode = "error"
+    events = collect()
+    assert events[-1]["answer"] == "Gemini API is not configured."
+    assert faq.added == []
+    assert query_engine.answer_cache.claim(EMBEDDING, CHUNK_IDS)[0] == "owner"
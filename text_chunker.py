@@ -0,0 +1,120 @@
+# text_chunker.py - Linear-time, token-aware chunking for RAG ingestion
+import re
+
+# --- Config ---
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces; stay under it
+DEFAULT_MAX_TOKENS = 200
+DEFAULT_OVERLAP_TOKENS = 40
+MIN_CHUNK_CHARS = 100
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = re.compile(r'\s+')
+_NON_DIGITS = re.compile(r'\D+')
+_NON_LETTERS = re.compile(r'[\W\d_]+')
+
+
+def advanced_text_cleaning(text):
+    """Cleans text and heuristically splits table-like structures into sentences."""
+    text = _WHITESPACE.sub(' ', text)
+    blocks = _SENTENCE_END.split(text)
+    processed = []
+    for block in blocks:
+        digits = len(_NON_DIGITS.sub('', block))
+        letters = len(_NON_LETTERS.sub('', block))
+        if letters > 10 and digits > 5:
+            if not block.endswith('.'):
+                block += '.'
+        processed.append(block)
+    return " ".join(processed).strip()
+
+
+def split_sentences(text):
+    """Cleans a page of text and returns its non-empty sentences."""
+    return [s for s in _SENTENCE_END.split(advanced_text_cleaning(text)) if s]
+
+
+def whitespace_token_counts(sentences):
+    """Fallback token counter when no tokenizer is available (about 0.75 of word pieces)."""
+    return [len(s.split()) for s in sentences]
+
+
+class TokenAwareChunker:
+    """
+    Packs sentences into chunks of at most `max_tokens` tokens, where
+    consecutive chunks share roughly `overlap_tokens` tokens of whole
+    sentences. Each sentence is tokenized once and every chunk is joined
+    once from a slice of the sentence list, so the cost is linear in the
+    length of the book.
+    """
+
+    def __init__(self, tokenizer=None, max_tokens=DEFAULT_MAX_TOKENS,
+                 overlap_tokens=DEFAULT_OVERLAP_TOKENS, min_chunk_chars=MIN_CHUNK_CHARS):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.min_chunk_chars = min_chunk_chars
+
+    def count_tokens(self, sentences):
+        if not sentences:
+            return []
+        if self.tokenizer is None:
+            return whitespace_token_counts(sentences)
+        encoded = self.tokenizer(sentences, add_special_tokens=False)['input_ids']
+        return [len(ids) for ids in encoded]
+
+    def _split_long(self, sentence, n_tokens):
+        """Breaks a sentence longer than max_tokens into word windows that fit."""
+        words = sentence.split()
+        per_piece = max(1, int(len(words) * self.max_tokens / n_tokens))
+        return [" ".join(words[i:i + per_piece]) for i in range(0, len(words), per_piece)]
+
+    def _sentence_spans(self, pages):
+        """Flattens pages into parallel (sentences, pages, token_counts) lists."""
+        sentences, page_numbers = [], []
+        for page_number, text in pages:
+            page_sentences = split_sentences(text)
+            sentences.extend(page_sentences)
+            page_numbers.extend([page_number] * len(page_sentences))
+        counts = self.count_tokens(sentences)
+
+        if any(c > self.max_tokens for c in counts):
+            fitted = ([], [], [])
+            for sentence, page_number, count in zip(sentences, page_numbers, counts):
+                pieces = [sentence] if count <= self.max_tokens else self._split_long(sentence, count)
+                fitted[0].extend(pieces)
+                fitted[1].extend([page_number] * len(pieces))
+            sentences, page_numbers = fitted[0], fitted[1]
+            counts = self.count_tokens(sentences)
+        return sentences, page_numbers, counts
+
+    def iter_spans(self, token_counts):
+        """Yields (start, end) sentence index ranges for every chunk."""
+        n = len(token_counts)
+        start = 0
+        while start < n:
+            end, total = start, 0
+            while end < n and (end == start or total + token_counts[end] <= self.max_tokens):
+                total += token_counts[end]
+                end += 1
+            yield start, end
+            if end >= n:
+                break
+            # Step back over whole sentences until the overlap budget is used
+            next_start, overlap = end, 0
+            while next_start - 1 > start and overlap + token_counts[next_start - 1] <= self.overlap_tokens:
+                next_start -= 1
+                overlap += token_counts[next_start]
+            start = next_start
+
+    def iter_page_chunks(self, pages):
+        """Yields (chunk, first_page, last_page) for a book given as (page_number, text) pairs."""
+        sentences, page_numbers, counts = self._sentence_spans(pages)
+        for start, end in self.iter_spans(counts):
+            chunk = " ".join(sentences[start:end])
+            # Filter out very small chunks
+            if len(chunk) > self.min_chunk_chars:
+                yield chunk, page_numbers[start], page_numbers[end - 1]
+
+    def chunk_text(self, text):
+        """Splits one long text into chunks."""
+        return [chunk for chunk, _, _ in self.iter_page_chunks([(1, text)])]
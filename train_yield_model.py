@@ -1,42 +1,276 @@
+# train_yield_model.py - Reproducible trainer for the yield model served by /predict
+#
+# Reads the training data in chunks (CSV) or record batches (Parquet) into a
+# compact frame, runs a k-fold cross-validated hyperparameter search for a
+# HistGradientBoostingRegressor with one process per (configuration, fold),
+# refits the best configuration on all rows and exports a versioned pipeline
+# (plus its compiled NumPy form) to models/, where predict_hackathon.py picks
+# up the newest one.
+#
+# Training data must use the model's column names, as crop_yield.csv does.
+# Limitation: enrich_dataset.py's output keeps its source's lowercased
+# schema (state_name, crop, season, yield, ...) without soil type, weather
+# condition, fertilizer or irrigation, so it is rejected as missing columns.
+# The soil columns are only used by data that has them under these names;
+# no dataset in this repository does yet.
+#
+# Usage:
+#   python train_yield_model.py                          # crop_yield.csv, default grid
+#   python train_yield_model.py --data enriched.parquet --folds 5 --jobs 8
+#   python train_yield_model.py --evaluate hackathon_yield_model.pkl
+import os
+import json
+import time
+import argparse
+import itertools
+from datetime import datetime, timezone
+
+import numpy as np
 import pandas as pd
 import joblib
-from sklearn.model_selection import train_test_split
+from joblib import Parallel, delayed
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder
+
+from compiled_model import compile_pipeline, file_sha1
+from soil_cache import SOIL_COLUMNS
 
 # --- Configuration ---
 INPUT_CSV = "crop_yield.csv"
 MODEL_FILE = "hackathon_yield_model.pkl"
+MODEL_DIR = "models"
+TARGET = 'Yield_tons_per_hectare'
+CATEGORICAL_FEATURES = ['Region', 'Soil_Type', 'Crop', 'Weather_Condition']
+BOOLEAN_FEATURES = ['Fertilizer_Used', 'Irrigation_Used']
+NUMERIC_FEATURES = ['Rainfall_mm', 'Temperature_Celsius', 'Days_to_Harvest']
+# Used when the data has them under these names (see the header note)
+OPTIONAL_NUMERIC_FEATURES = list(SOIL_COLUMNS)
+CHUNK_ROWS = 200_000
+RANDOM_STATE = 42
+
+# Search space; every combination is cross-validated
+PARAM_GRID = {
+    "learning_rate": [0.05, 0.1],
+    "max_leaf_nodes": [31, 63],
+    "min_samples_leaf": [20, 100],
+    "l2_regularization": [0.0, 1.0],
+}
+MAX_ITER = 300
+
+
+# --- Data Loading ---
+
+class MissingColumns(ValueError):
+    pass
+
+
+def _check_columns(path, columns):
+    required = CATEGORICAL_FEATURES + BOOLEAN_FEATURES + NUMERIC_FEATURES + [TARGET]
+    missing = [c for c in required if c not in columns]
+    if missing:
+        hint = ""
+        if 'yield' in columns and 'state_name' in columns:
+            hint = " This looks like enrich_dataset.py output, which uses a different schema."
+        raise MissingColumns(f"'{path}' is missing columns: {', '.join(missing)}.{hint}")
+
+
+def _compact(frame, numeric):
+    """Categories for text, float32 for numbers: a fraction of pandas' default footprint."""
+    frame = frame.astype({c: 'category' for c in CATEGORICAL_FEATURES})
+    frame = frame.astype({c: 'float32' for c in numeric + [TARGET]})
+    return frame.astype({c: 'bool' for c in BOOLEAN_FEATURES})
+
+
+def _available_numeric(columns):
+    return NUMERIC_FEATURES + [c for c in OPTIONAL_NUMERIC_FEATURES if c in columns]
+
+
+def iter_batches(path, chunk_rows=CHUNK_ROWS):
+    """Yields (batch DataFrame, numeric feature list) without ever loading the whole file as text."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        _check_columns(path, parquet.schema_arrow.names)
+        numeric = _available_numeric(parquet.schema_arrow.names)
+        columns = CATEGORICAL_FEATURES + BOOLEAN_FEATURES + numeric + [TARGET]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield _compact(batch.to_pandas(), numeric), numeric
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        _check_columns(path, header)
+        numeric = _available_numeric(header)
+        columns = CATEGORICAL_FEATURES + BOOLEAN_FEATURES + numeric + [TARGET]
+        dtypes = {c: 'float32' for c in numeric + [TARGET]}
+        for chunk in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_rows):
+            yield _compact(chunk, numeric), numeric
+
+
+def load_training_data(path, chunk_rows=CHUNK_ROWS):
+    """Concatenates compact batches; rows without a target are dropped."""
+    batches, numeric = [], NUMERIC_FEATURES
+    for batch, numeric in iter_batches(path, chunk_rows):
+        batches.append(batch.dropna(subset=[TARGET]))
+    # Batches may have seen different categories; concat falls back to object, so re-cast
+    data = pd.concat(batches, ignore_index=True)
+    data = data.astype({c: 'category' for c in CATEGORICAL_FEATURES})
+    return data, numeric
+
+
+# --- Model ---
+
+def build_encoder(numeric):
+    # Unknown categories at predict time are encoded as -1, which the model treats as missing
+    return ColumnTransformer([
+        ("categorical", OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1,
+                                       encoded_missing_value=-1), CATEGORICAL_FEATURES),
+        ("numeric", 'passthrough', BOOLEAN_FEATURES + numeric),
+    ])
+
+
+def build_model(params):
+    return HistGradientBoostingRegressor(
+        max_iter=MAX_ITER,
+        categorical_features=list(range(len(CATEGORICAL_FEATURES))),
+        early_stopping=False,
+        random_state=RANDOM_STATE,
+        **params,
+    )
+
+
+def param_combinations(grid=PARAM_GRID):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def _fit_fold(params, X, y, train_idx, test_idx):
+    started = time.perf_counter()
+    model = build_model(params).fit(X[train_idx], y[train_idx])
+    fit_seconds = time.perf_counter() - started
+    return r2_score(y[test_idx], model.predict(X[test_idx])), fit_seconds
+
+
+def search(X, y, folds, jobs, grid=PARAM_GRID):
+    """
+    Cross-validates every configuration. Each (configuration, fold) is one
+    task on a process pool; X and y are memory-mapped to the workers rather
+    than copied, and joblib caps each worker's OpenMP threads so the pool
+    does not oversubscribe the cores.
+    """
+    configs = param_combinations(grid)
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE).split(X))
+    scores = Parallel(n_jobs=jobs, max_nbytes='1M')(
+        delayed(_fit_fold)(params, X, y, train_idx, test_idx)
+        for params in configs for train_idx, test_idx in splits
+    )
+    results = []
+    for i, params in enumerate(configs):
+        fold_scores = scores[i * folds:(i + 1) * folds]
+        r2 = np.array([r for r, _ in fold_scores])
+        results.append({
+            "params": params,
+            "r2_mean": float(r2.mean()),
+            "r2_std": float(r2.std()),
+            "fit_seconds": float(np.mean([s for _, s in fold_scores])),
+        })
+    return sorted(results, key=lambda r: r["r2_mean"], reverse=True)
+
+
+def export_pipeline(pipeline, metadata, model_dir=MODEL_DIR):
+    """
+    Writes models/yield_model-<version>.pkl, its compiled NumPy form (.npz,
+    see compiled_model.py) and a .json with how it was trained.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(model_dir, f"yield_model-{version}")
+    joblib.dump(pipeline, base + '.pkl.tmp')
+    compile_pipeline(pipeline, source_sha1=file_sha1(base + '.pkl.tmp')).save(base + '.npz')
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump({"version": version, **metadata}, f, indent=2)
+    # The .pkl appears last, so a watcher never sees a half-written model
+    os.replace(base + '.pkl.tmp', base + '.pkl')
+    return base + '.pkl', version
+
+
+# --- Entry Points ---
+
+def evaluate(model_file, data_path):
+    """The original accuracy check: scores a saved pipeline on a fixed 20% split."""
+    print("--- Starting Model Accuracy Check ---")
+    data, _ = load_training_data(data_path)
+    model_pipeline = joblib.load(model_file)
+    X = data.drop(TARGET, axis=1)
+    y = data[TARGET]
+    _, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=RANDOM_STATE)
+    print("📈 Evaluating model performance...")
+    r2 = r2_score(y_test, model_pipeline.predict(X_test))
+    print(f"⭐ Model R² score (accuracy): {r2:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and export the crop yield model.")
+    parser.add_argument("--data", default=INPUT_CSV, help="CSV or Parquet training data")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=-1, help="Search processes (-1 = all cores)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--evaluate", metavar="MODEL_FILE", help="Only score an existing pipeline")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data):
+        print(f"❌ ERROR: Dataset not found at '{args.data}'. Please provide the correct data file.")
+        return
+    try:
+        if args.evaluate:
+            evaluate(args.evaluate, args.data)
+            return
+        started = time.perf_counter()
+        data, numeric = load_training_data(args.data, args.chunk_rows)
+    except MissingColumns as e:
+        print(f"❌ ERROR: {e}")
+        return
+    print(f"✅ Loaded {len(data)} rows in {time.perf_counter() - started:.1f}s "
+          f"({data.memory_usage(deep=True).sum() / 1e6:.0f} MB in memory).")
+
+    # Categories are encoded once; the search then works on one float32 matrix
+    encoder = build_encoder(numeric)
+    y = data[TARGET].to_numpy(dtype=np.float32)
+    X = encoder.fit_transform(data.drop(columns=[TARGET])).astype(np.float32)
+    del data
+
+    configs = param_combinations()
+    print(f"🔎 Cross-validating {len(configs)} configurations x {args.folds} folds...")
+    started = time.perf_counter()
+    results = search(X, y, args.folds, args.jobs)
+    print(f"   search took {time.perf_counter() - started:.1f}s")
+    print(f"   {'R² mean':>8} {'± std':>7} {'fit s':>7}   params")
+    for r in results:
+        print(f"   {r['r2_mean']:>8.4f} {r['r2_std']:>7.4f} {r['fit_seconds']:>7.1f}   {r['params']}")
+
+    best = results[0]
+    started = time.perf_counter()
+    model = build_model(best["params"]).fit(X, y)
+    refit_seconds = time.perf_counter() - started
+    pipeline = Pipeline([("prep", encoder), ("model", model)])
+
+    path, version = export_pipeline(pipeline, {
+        "data": os.path.abspath(args.data),
+        "rows": int(len(y)),
+        "features": CATEGORICAL_FEATURES + BOOLEAN_FEATURES + numeric,
+        "params": best["params"],
+        "cv_folds": args.folds,
+        "cv_r2_mean": best["r2_mean"],
+        "cv_r2_std": best["r2_std"],
+        "refit_seconds": round(refit_seconds, 2),
+        "search": results,
+    }, args.model_dir)
+    print(f"🎉 Best CV R² {best['r2_mean']:.4f}; refit on all rows in {refit_seconds:.1f}s. "
+          f"Exported version {version} to '{path}'.")
+
 
-# --- Evaluate the Model's Accuracy ---
-print("--- Starting Model Accuracy Check ---")
-
-# 1. Load Data
-try:
-    df = pd.read_csv(INPUT_CSV)
-    print("✅ Dataset loaded successfully.")
-except FileNotFoundError:
-    print(f"❌ ERROR: Dataset not found at '{INPUT_CSV}'. Please provide the correct data file.")
-    exit()
-
-# 2. Load the trained model
-try:
-    model_pipeline = joblib.load(MODEL_FILE)
-    print("✅ Trained model loaded successfully.")
-except FileNotFoundError:
-    print(f"❌ ERROR: Model file not found at '{MODEL_FILE}'. Please run the full training script first.")
-    exit()
-
-# 3. Define Features (X) and Target (y)
-X = df.drop('Yield_tons_per_hectare', axis=1)
-y = df['Yield_tons_per_hectare']
-
-# 4. Split Data (using the same split as training for consistent evaluation)
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# 5. Evaluate the Model
-print("📈 Evaluating model performance...")
-y_pred = model_pipeline.predict(X_test)
-r2 = r2_score(y_test, y_pred)
-
-# 6. Print Accuracy
-print(f"⭐ Model R² score (accuracy): {r2:.4f}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# upstream.py - Rate-limited, retrying HTTP access to an external API shared by worker threads
+import time
+import random
+import threading
+
+import requests
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `burst` calls."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a call may be made."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Upstream:
+    """
+    One external API. Every call waits for the upstream's token bucket, and
+    throttled, failed or timed-out calls are retried with exponential backoff
+    and jitter. Each worker thread keeps its own pooled requests.Session.
+    """
+
+    def __init__(self, name, url, rate_per_second, burst=None, retries=3, backoff_seconds=1.0, timeout=30):
+        self.name = name
+        self.url = url
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self._local = threading.local()
+        self._counters_lock = threading.Lock()
+        self.counters = {"calls": 0, "retries": 0, "failures": 0}
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _count(self, key):
+        with self._counters_lock:
+            self.counters[key] += 1
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = self.backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+        self._count("retries")
+        time.sleep(delay)
+
+    def get_json(self, params):
+        """Returns the decoded JSON body, or None once retries are exhausted or the request is rejected."""
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            self._count("calls")
+            try:
+                response = self._session().get(self.url, params=params, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt < self.retries:
+                    self._backoff(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES:
+                if attempt < self.retries:
+                    self._backoff(attempt, response)
+                continue
+            if response.status_code != 200:
+                # Bad coordinates or parameters: retrying will not help
+                break
+            try:
+                return response.json()
+            except ValueError:
+                if attempt < self.retries:
+                    self._backoff(attempt)
+        self._count("failures")
+        return None
+
+    def stats(self):
+        with self._counters_lock:
+            return dict(self.counters)
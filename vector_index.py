@@ -0,0 +1,181 @@
+# vector_index.py - Pluggable vector index for RAG retrieval
+import numpy as np
+
+# --- Config ---
+INDEX_FILE = 'vector_index.npz'
+DEFAULT_BACKEND = 'flat'
+DEFAULT_NPROBE = 8
+SEARCH_BLOCK_SIZE = 8192
+
+
+def normalize_vectors(vectors):
+    """Returns a float32 copy of the vectors scaled to unit length."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """Returns (scores, indices) of the k best scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.argsort(-scores[candidates], kind='stable')
+    best = candidates[order]
+    return scores[best], best
+
+
+# --- Exact Backend ---
+class FlatIndex:
+    """Exact cosine search over every vector (brute force, but no recall loss)."""
+    backend = 'flat'
+
+    def __init__(self, vectors, normalized=False):
+        self.vectors = vectors if normalized else normalize_vectors(vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query_vector, top_k=5):
+        query = normalize_vectors(query_vector).reshape(-1)
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), SEARCH_BLOCK_SIZE):
+            # float16 / int8 stores are widened per block so the product runs in BLAS
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_SIZE], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return _top_k(scores, top_k)
+
+    def to_arrays(self):
+        return {}
+
+
+# --- Approximate Backend ---
+class IVFIndex:
+    """
+    Inverted-file index: vectors are clustered with spherical k-means and only
+    the `nprobe` closest clusters are scanned at query time. Raising `nprobe`
+    trades latency for recall; nprobe == n_lists is an exact search.
+    """
+    backend = 'ivf'
+
+    def __init__(self, vectors, centroids, list_offsets, list_ids,
+                 nprobe=DEFAULT_NPROBE, normalized=False):
+        self.vectors = vectors if normalized else normalize_vectors(vectors)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_ids = np.asarray(list_ids, dtype=np.int64)
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, nprobe=DEFAULT_NPROBE, n_iter=20,
+              max_train_size=50000, seed=42, normalized=False):
+        """Clusters the vectors and builds the inverted lists."""
+        vectors = vectors if normalized else normalize_vectors(vectors)
+        n = len(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n)))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        train = vectors
+        if n > max_train_size:
+            train = vectors[np.sort(rng.choice(n, max_train_size, replace=False))]
+        train = np.asarray(train, dtype=np.float32)
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = _assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, train)
+            counts = np.bincount(assignments, minlength=n_lists)
+            # Re-seed empty clusters with random training points
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+            centroids = normalize_vectors(sums)
+
+        assignments = _assign(vectors, centroids)
+        list_ids = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(vectors, centroids, list_offsets, list_ids,
+                   nprobe=nprobe, normalized=True)
+
+    def search(self, query_vector, top_k=5, nprobe=None):
+        query = normalize_vectors(query_vector).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        _, probe_lists = _top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([
+            self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]]
+            for l in probe_lists
+        ])
+        if len(candidates) == 0:
+            return _top_k(np.empty(0, dtype=np.float32), top_k)
+        candidates.sort()
+        scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        best_scores, best = _top_k(scores, top_k)
+        return best_scores, candidates[best]
+
+    def to_arrays(self):
+        return {
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_ids': self.list_ids,
+            'nprobe': np.array(self.nprobe),
+        }
+
+
+def _assign(vectors, centroids):
+    """Returns the closest centroid for every vector, in blocks to bound memory."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SEARCH_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + SEARCH_BLOCK_SIZE], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+BACKENDS = {FlatIndex.backend: FlatIndex, IVFIndex.backend: IVFIndex}
+
+
+# --- Build / Save / Load ---
+def build_index(vectors, backend=DEFAULT_BACKEND, normalized=False, **kwargs):
+    """Builds an index of the requested backend over the given vectors."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector index backend '{backend}'. Choose from {list(BACKENDS)}.")
+    if backend == IVFIndex.backend:
+        return IVFIndex.build(vectors, normalized=normalized, **kwargs)
+    return FlatIndex(vectors, normalized=normalized)
+
+
+def save_index(index, path=INDEX_FILE):
+    """
+    Saves the index structure only. The vectors themselves stay in the
+    embeddings store and are handed back to `load_index`.
+    """
+    np.savez(path, backend=np.array(index.backend), size=np.array(len(index)),
+             **index.to_arrays())
+
+
+def load_index(path, vectors, nprobe=None, normalized=False):
+    """Loads a saved index and attaches it to the embedding vectors."""
+    with np.load(path) as data:
+        backend = str(data['backend'])
+        if int(data['size']) != len(vectors):
+            raise ValueError(f"Index '{path}' was built for {int(data['size'])} vectors, "
+                             f"but the store has {len(vectors)}. Re-run ingestion.")
+        if backend == IVFIndex.backend:
+            return IVFIndex(vectors, data['centroids'], data['list_offsets'], data['list_ids'],
+                            nprobe=nprobe or int(data['nprobe']), normalized=normalized)
+    return FlatIndex(vectors, normalized=normalized)
@@ -0,0 +1,135 @@
+# weather_history.py - Daily NASA POWER series per location, cached on disk as Parquet
+#
+# Crop rows that share a district also share its weather. Instead of one
+# POWER request per (row, season), each location's daily series is fetched
+# once for the whole year range it is needed for, stored under
+# nasa_power_cache/<lat>_<lon>.parquet, and every season window of every row
+# at that location is aggregated from it with cumulative sums.
+import os
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- Config ---
+CACHE_DIR = os.getenv("NASA_POWER_CACHE_DIR", "nasa_power_cache")
+PARAMETERS = ("T2M", "PRECTOTCORR", "RH2M")
+MISSING_VALUE = -999
+
+
+class WeatherHistory:
+    def __init__(self, upstream, cache_dir=CACHE_DIR):
+        self.upstream = upstream
+        self.cache_dir = cache_dir
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _path(self, lat, lon):
+        return os.path.join(self.cache_dir, f"{lat:.4f}_{lon:.4f}.parquet")
+
+    def _lock(self, lat, lon):
+        # One fetch per location at a time; different locations proceed in parallel
+        with self._locks_lock:
+            return self._locks.setdefault((round(lat, 4), round(lon, 4)), threading.Lock())
+
+    def _load(self, lat, lon):
+        path = self._path(lat, lon)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def _save(self, lat, lon, series):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(lat, lon)
+        series.to_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def _request(self, lat, lon, start_year, end_year):
+        end = last_available_day(end_year)
+        params = {
+            "parameters": ",".join(PARAMETERS),
+            "community": "AG",
+            "longitude": lon,
+            "latitude": lat,
+            "start": f"{start_year}0101",
+            "end": end.strftime('%Y%m%d'),
+            "format": "JSON"
+        }
+        data = self.upstream.get_json(params)
+        if data is None:
+            return None
+        try:
+            parameters = data['properties']['parameter']
+            series = pd.DataFrame({name: pd.Series(parameters[name], dtype='float64') for name in PARAMETERS})
+        except (KeyError, TypeError):
+            return None
+        series.index = pd.to_datetime(series.index, format='%Y%m%d')
+        return series.replace(MISSING_VALUE, np.nan).sort_index()
+
+    def daily_series(self, lat, lon, start_year, end_year):
+        """
+        Daily T2M / PRECTOTCORR / RH2M for every day of start_year..end_year,
+        indexed by date (up to yesterday for the current year). Years the
+        on-disk cache lacks, or covers only partly because they were fetched
+        while still in progress, are fetched in a single request. Returns
+        None if they cannot be fetched.
+        """
+        with self._lock(lat, lon):
+            cached = self._load(lat, lon)
+            missing = self._missing_years(cached, start_year, end_year)
+            if missing:
+                fetched = self._request(lat, lon, min(missing), max(missing))
+                if fetched is None:
+                    return None
+                # Fresh values win: POWER fills recent days in after a lag
+                cached = fetched if cached is None else fetched.combine_first(cached)
+                self._save(lat, lon, cached)
+        return cached.loc[f"{start_year}-01-01":f"{end_year}-12-31"]
+
+    @staticmethod
+    def _missing_years(cached, start_year, end_year):
+        """Years of start_year..end_year without data, plus every year after the last day with data."""
+        if cached is None:
+            return list(range(start_year, end_year + 1))
+        observed = cached.dropna(how='all').index
+        have = set(observed.year.unique())
+        missing = {year for year in range(start_year, end_year + 1) if year not in have}
+        last = observed.max().date() if len(observed) else None
+        if last is None or last < last_available_day(end_year):
+            first = start_year if last is None else max(start_year, last.year)
+            missing.update(range(first, end_year + 1))
+        return sorted(missing)
+
+
+def last_available_day(year):
+    """Dec 31 of `year`, or yesterday while `year` is still in progress."""
+    return min(datetime.date(year, 12, 31), datetime.date.today() - datetime.timedelta(days=1))
+
+
+def season_aggregates(series, starts, ends):
+    """
+    Mean temperature, total rainfall and mean humidity over each [start, end]
+    date window (inclusive), computed for all windows at once. Days with
+    missing values are left out, as the per-request version did.
+    """
+    dates = series.index.values
+    lo = np.searchsorted(dates, np.asarray(starts, dtype='datetime64[ns]'), side='left')
+    hi = np.searchsorted(dates, np.asarray(ends, dtype='datetime64[ns]'), side='right')
+
+    def window_sums(column):
+        values = series[column].to_numpy()
+        valid = ~np.isnan(values)
+        total = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+        count = np.concatenate(([0], np.cumsum(valid)))
+        return total[hi] - total[lo], count[hi] - count[lo]
+
+    temp_total, temp_count = window_sums("T2M")
+    rain_total, _ = window_sums("PRECTOTCORR")
+    humidity_total, humidity_count = window_sums("RH2M")
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            "temperature": np.where(temp_count > 0, temp_total / temp_count, np.nan),
+            "rainfall": rain_total,
+            "humidity": np.where(humidity_count > 0, humidity_total / humidity_count, np.nan),
+        })